@@ -0,0 +1,54 @@
+#!/usr/local/bin/python3.5
+
+import argparse
+import json
+import os
+import time
+import urllib.parse
+from collections import OrderedDict
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+# Local stand-in for the ADS abstract service queried for bibcode authors, so that
+# author resolution can be run offline, e.g.
+#   python3 ads-standin.py --port 8080 &
+#   python3 import.py --ads-url http://localhost:8080/cgi-bin/nph-abs_connect
+# Authors are answered from a bibauthors.json file, other bibcodes get an empty record.
+
+parser = argparse.ArgumentParser(description='Serve bibcode authors the way the ADS abstract service does.')
+parser.add_argument('--port', '-p',    dest='port',    help='Port to listen on.',                           default=8080, type=int)
+parser.add_argument('--authors', '-a', dest='authors', help='JSON file of authors keyed by bibcode.',        default='../bibauthors.json')
+parser.add_argument('--delay', '-d',   dest='delay',   help='Seconds to wait before answering each query.', default=0., type=float)
+args = parser.parse_args()
+
+bibauthors = OrderedDict()
+if os.path.isfile(args.authors):
+    with open(args.authors, 'r') as f:
+        bibauthors = json.loads(f.read(), object_pairs_hook=OrderedDict)
+
+class ADSHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        bibcode = query.get('bibcode', [''])[0]
+        if args.delay:
+            time.sleep(args.delay)
+        # Five lines of header before the record, as ADS sends them.
+        lines = ['Query Results from the ADS Database', '', '',
+                 'Retrieved 1 abstracts, starting with number 1.', '']
+        if bibcode in bibauthors:
+            lines.append(bibauthors[bibcode])
+        body = '\n'.join(lines).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+print('Serving ' + str(len(bibauthors)) + ' bibcodes on port ' + str(args.port))
+ThreadingServer(('localhost', args.port), ADSHandler).serve_forever()
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from html import unescape
+
+# Authors of bibcodes as listed by ADS, cached in bibauthors.json. Authors fetched
+# since that file was last written are appended to a journal next to it as they
+# arrive, one JSON line per bibcode, so that a run that dies loses nothing.
+
+adsurl = 'http://adsabs.harvard.edu/cgi-bin/nph-abs_connect'
+adsjobs = 8
+adsrate = 10.
+adsbatch = 100
+
+ratelock = threading.Lock()
+journallock = threading.Lock()
+nextquery = 0.
+
+def bib_journal_path(path):
+    return os.path.splitext(path)[0] + '.journal'
+
+def load_bib_authors(path):
+    bibauthors = OrderedDict()
+    if os.path.isfile(path):
+        with open(path, 'r') as f:
+            bibauthors = json.loads(f.read(), object_pairs_hook=OrderedDict)
+    journalpath = bib_journal_path(path)
+    if os.path.isfile(journalpath):
+        with open(journalpath, 'r') as f:
+            for line in f:
+                try:
+                    (bibcode, authors) = json.loads(line)
+                except ValueError:
+                    # Only the line being written when a run died can be cut short.
+                    continue
+                bibauthors[bibcode] = authors
+    return bibauthors
+
+def journal_bib_authors(path, entries):
+    if not entries:
+        return
+    lines = ''.join([json.dumps([x, y], ensure_ascii=False) + '\n' for x, y in entries])
+    with journallock:
+        with open(bib_journal_path(path), 'a', encoding='utf8') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+def clear_bib_journal(path):
+    if os.path.isfile(bib_journal_path(path)):
+        os.remove(bib_journal_path(path))
+
+def wait_for_rate(rate):
+    global nextquery
+    with ratelock:
+        now = time.monotonic()
+        wait = nextquery - now
+        nextquery = max(now, nextquery) + 1./rate
+    if wait > 0.:
+        time.sleep(wait)
+
+def query_bib_author(bibcode, url = adsurl, rate = adsrate):
+    wait_for_rate(rate)
+    adsquery = (url + '?db_key=ALL&version=1&bibcode=' + urllib.parse.quote(bibcode) + '&data_type=Custom&format=%253m%20%25(y)')
+    response = urllib.request.urlopen(adsquery)
+    html = response.read().decode('utf-8')
+    hsplit = html.split("\n")
+    if len(hsplit) > 5:
+        bibcodeauthor = hsplit[5]
+    else:
+        bibcodeauthor = ''
+
+    if not bibcodeauthor:
+        warnings.warn("Bibcode didn't return authors, not converting this bibcode.")
+
+    return unescape(bibcodeauthor).strip()
+
+# Fetch the authors of all the given bibcodes not in bibauthors, several at a time,
+# journaling each batch as it completes. Bibcodes that fail are left out.
+def resolve_bib_authors(bibcodes, bibauthors, path, url = adsurl, jobs = adsjobs, rate = adsrate):
+    def fetch(bibcode):
+        try:
+            return (bibcode, query_bib_author(bibcode, url, rate))
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            warnings.warn('Author lookup for ' + bibcode + ' failed in ADS.')
+            return (bibcode, None)
+
+    missing = [x for x in OrderedDict.fromkeys(bibcodes) if x not in bibauthors]
+    with ThreadPoolExecutor(max_workers = jobs) as pool:
+        for b in range(0, len(missing), adsbatch):
+            entries = [x for x in pool.map(fetch, missing[b:b + adsbatch]) if x[1] is not None]
+            journal_bib_authors(path, entries)
+            bibauthors.update(entries)
+    return missing
@@ -0,0 +1,48 @@
+import ast
+import os
+import sys
+import tempfile
+import types
+
+scriptsdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import.py runs its whole task loop at module level, so the benchmarks only
+# execute the statements above that loop (imports, tables and the ingest
+# primitives). Afterwards the working directory is moved into a scratch tree
+# with empty repo folders so that nothing touches the real event repositories.
+# Functions and classes defined after the loop can be asked for by name in defs.
+def load_import(argv = [], defs = []):
+    oldcwd = os.getcwd()
+    os.chdir(scriptsdir)
+    if scriptsdir not in sys.path:
+        sys.path.insert(0, scriptsdir)
+
+    with open('import.py', 'r') as f:
+        tree = ast.parse(f.read(), 'import.py')
+    body = []
+    intasks = False
+    for node in tree.body:
+        if isinstance(node, ast.For) and isinstance(node.iter, ast.Name) and node.iter.id == 'tasks':
+            intasks = True
+        if not intasks or (isinstance(node, (ast.FunctionDef, ast.ClassDef)) and node.name in defs):
+            body.append(node)
+
+    oldargv = sys.argv
+    sys.argv = ['import.py'] + list(argv)
+    # Registered as a module so that worker processes can find its functions.
+    module = types.ModuleType('oscimport')
+    sys.modules['oscimport'] = module
+    namespace = module.__dict__
+    try:
+        exec(compile(ast.Module(body = body, type_ignores = []), 'import.py', 'exec'), namespace)
+    finally:
+        sys.argv = oldargv
+
+    scratch = tempfile.mkdtemp(prefix = 'osc-bench-')
+    os.makedirs(os.path.join(scratch, 'scripts'))
+    for rep in namespace['repofolders']:
+        os.makedirs(os.path.join(scratch, rep))
+    os.chdir(os.path.join(scratch, 'scripts'))
+    namespace['benchscratch'] = scratch
+    namespace['bencholdcwd'] = oldcwd
+    return namespace
@@ -0,0 +1,40 @@
+import argparse
+import time
+from collections import OrderedDict
+from benchmarks import load_import
+
+# Measures the cost of ingesting one row (add_event + add_source + add_quantity)
+# against catalogs of increasingly many stubbed events. With the alias index the
+# per-row time should stay flat as the catalog grows.
+
+parser = argparse.ArgumentParser(description='Benchmark alias resolution in import.py.')
+parser.add_argument('--scales', dest='scales', help='Comma-delimited list of catalog sizes.', default='1000,10000,50000')
+parser.add_argument('--rows', dest='rows', help='Rows ingested per scale.', type=int, default=2000)
+bargs = parser.parse_args()
+
+osc = load_import()
+
+def fill_stubs(n):
+    osc['clear_events']()
+    events = OrderedDict()
+    for i in range(n):
+        name = 'SN' + str(1900 + i % 100) + 'bench' + str(i)
+        events[name] = OrderedDict([['name', name], ['alias', [
+            OrderedDict([['value', name], ['source', '1']]),
+            OrderedDict([['value', 'PTF' + str(i)], ['source', '1']]),
+            OrderedDict([['value', 'PSN J' + str(i).zfill(8)], ['source', '1']])]], ['stub', True]])
+    osc['events'] = events
+    osc['reindex_aliases']()
+
+print('{:>10} {:>16}'.format('events', 'us per row'))
+for scale in [int(x) for x in bargs.scales.split(',')]:
+    fill_stubs(scale)
+    start = time.perf_counter()
+    for r in range(bargs.rows):
+        # Half of the rows hit an existing event through an alias, half create new events.
+        name = ('PTF' + str((r * 7919) % scale)) if r % 2 else ('BENCH' + str(r))
+        name = osc['add_event'](name, load = False)
+        source = osc['add_source'](name, bibcode = '2016arXiv160501054G')
+        osc['add_quantity'](name, 'alias', 'BENCHALIAS' + str(r), source)
+    elapsed = time.perf_counter() - start
+    print('{:>10} {:>16.2f}'.format(scale, 1.e6 * elapsed / bargs.rows))
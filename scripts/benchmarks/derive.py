@@ -0,0 +1,55 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+from benchmarks import load_import, scriptsdir
+
+# Times the final sanitize-and-derive pass of import.py over a corpus of event
+# files with different numbers of worker processes. Each run starts from a fresh
+# copy of the corpus. The author and extinction caches are filled beforehand for
+# every bibcode and event in the corpus so that no run waits on ADS or IRSA.
+# Files per second should grow close to linearly with the jobs, up to the
+# number of cores.
+
+parser = argparse.ArgumentParser(description='Benchmark the final derive pass of import.py.')
+parser.add_argument('files', nargs='*', help='Event files to derive (defaults to the event repositories).')
+parser.add_argument('--count', dest='count', help='Maximum number of event files to derive.', type=int, default=500)
+parser.add_argument('--jobs', dest='jobs', help='Comma-delimited list of worker counts.', default='1,2,4')
+bargs = parser.parse_args()
+
+os.chdir(scriptsdir)
+from repos import *
+files = [os.path.abspath(x) for x in (bargs.files if bargs.files else sorted(repo_file_list()))][:bargs.count]
+if not files:
+    raise IOError('No event files found, clone the event repositories or pass files explicitly.')
+
+osc = load_import(defs = ['SharedCache', 'derive_event_file', 'start_derive_worker', 'derive_worker', 'derive_event_files'])
+osc['bibauthordict'] = OrderedDict()
+osc['extinctionsdict'] = OrderedDict()
+for fi in files:
+    event = json.loads(get_event_text(fi), object_pairs_hook=OrderedDict)
+    name = next(reversed(event))
+    osc['extinctionsdict'][name] = [0., 0.]
+    for source in event[name].get('sources', []):
+        if 'bibcode' in source:
+            osc['bibauthordict'][source['bibcode']] = ''
+
+def copy_corpus():
+    copies = []
+    for fi in files:
+        outdir = os.path.join('..', os.path.basename(os.path.dirname(fi)))
+        os.makedirs(outdir, exist_ok = True)
+        copies.append(outdir + '/' + os.path.basename(fi))
+        shutil.copy(fi, copies[-1])
+    return copies
+
+print('{:>6} {:>10} {:>12}'.format('jobs', 'seconds', 'files/s'))
+for jobs in [int(x) for x in bargs.jobs.split(',')]:
+    osc['args'].jobs = jobs
+    copies = copy_corpus()
+    start = time.perf_counter()
+    osc['derive_event_files'](copies)
+    elapsed = time.perf_counter() - start
+    print('{:>6} {:>10.2f} {:>12.1f}'.format(jobs, elapsed, len(copies)/elapsed))
@@ -0,0 +1,47 @@
+import argparse
+import os
+import time
+import numpy
+from astropy import units as un
+from astropy.cosmology import z_at_value
+from benchmarks import scriptsdir
+
+# Times the redshift-distance conversions made while deriving quantities, per
+# scalar through astropy (as import.py used to make them) against one call on
+# the interpolation table in cosmology.py, and reports the largest differences.
+
+parser = argparse.ArgumentParser(description='Benchmark cosmological distance lookups.')
+parser.add_argument('--count', dest='count', help='Number of redshifts.', type=int, default=2000)
+parser.add_argument('--inverse', dest='inverse', help='Number of distances to find redshifts for.', type=int, default=200)
+bargs = parser.parse_args()
+
+os.chdir(scriptsdir)
+from cosmology import *
+
+start = time.perf_counter()
+load_cosmology_table()
+print('Table load (s):           ' + '{:.3f}'.format(time.perf_counter() - start))
+
+z = 10.**numpy.random.uniform(-4., 0.7, bargs.count)
+start = time.perf_counter()
+slow = numpy.array([cosmo.luminosity_distance(x).value for x in z])
+astropytime = time.perf_counter() - start
+start = time.perf_counter()
+fast = cosmo_luminosity_distance(z)
+tabletime = time.perf_counter() - start
+print('Luminosity distances:     ' + str(bargs.count))
+print('  astropy per scalar (s): ' + '{:.3f}'.format(astropytime))
+print('  table (s):              ' + '{:.6f}'.format(tabletime))
+print('  max relative error:     ' + '{:.2e}'.format(numpy.max(numpy.abs(fast/slow - 1.))))
+
+dc = 10.**numpy.random.uniform(0., 3.5, bargs.inverse)
+start = time.perf_counter()
+slow = numpy.array([z_at_value(cosmo.comoving_distance, x*un.Mpc).value for x in dc])
+astropytime = time.perf_counter() - start
+start = time.perf_counter()
+fast = cosmo_redshift(dc)
+tabletime = time.perf_counter() - start
+print('Redshifts from distances: ' + str(bargs.inverse))
+print('  z_at_value (s):         ' + '{:.3f}'.format(astropytime))
+print('  table (s):              ' + '{:.6f}'.format(tabletime))
+print('  max relative error:     ' + '{:.2e}'.format(numpy.max(numpy.abs(fast/slow - 1.))))
@@ -0,0 +1,36 @@
+import argparse
+import os
+import time
+import numpy
+from benchmarks import scriptsdir
+
+# Times E(B-V) lookups from the local SFD maps for a catalog's worth of random
+# coordinates, in one vectorized call and one call per event (as
+# derive_and_sanitize makes them).
+
+parser = argparse.ArgumentParser(description='Benchmark local dust map lookups.')
+parser.add_argument('--dust-maps', dest='dustmapdir', help='Folder with the SFD dust maps.', default='../dust-maps')
+parser.add_argument('--count', dest='count', help='Number of coordinates.', type=int, default=50000)
+bargs = parser.parse_args()
+
+os.chdir(scriptsdir)
+from dustmap import *
+
+if not load_dust_maps(bargs.dustmapdir):
+    raise IOError('Dust maps not found in ' + bargs.dustmapdir + ', expected ' + ', '.join(dustmapfiles) + '.')
+
+ra = numpy.random.uniform(0., 360., bargs.count)
+dec = numpy.degrees(numpy.arcsin(numpy.random.uniform(-1., 1., bargs.count)))
+
+start = time.perf_counter()
+sfd_ebv(ra, dec)
+batched = time.perf_counter() - start
+
+start = time.perf_counter()
+for r, d in zip(ra, dec):
+    sfd_ebv([r], [d])
+single = time.perf_counter() - start
+
+print('Coordinates:           ' + str(bargs.count))
+print('One call (s):          ' + '{:.3f}'.format(batched))
+print('One call per event (s): ' + '{:.3f}'.format(single))
@@ -0,0 +1,60 @@
+import argparse
+import builtins
+import time
+from benchmarks import load_import
+
+# Replays a source that hits the same events over and over (one spectrum file
+# per row, journaling after each file as the CfA spectra task does) and counts
+# the event files read and written. With the events kept resident each event
+# should be read and written once, with a zero memory budget every file touched
+# costs a read and a write.
+
+parser = argparse.ArgumentParser(description='Benchmark event journaling in import.py.')
+parser.add_argument('--events', dest='events', help='Number of events.', type=int, default=200)
+parser.add_argument('--files', dest='files', help='Files ingested per event.', type=int, default=10)
+parser.add_argument('--budgets', dest='budgets', help='Comma-delimited list of memory budgets (MB).', default='0,1024')
+bargs = parser.parse_args()
+
+osc = load_import()
+counts = {'reads': 0, 'writes': 0}
+
+def counting_open(path, mode = 'r', *args, **kwargs):
+    if str(path).endswith('.json') and 'r' in mode:
+        counts['reads'] += 1
+    return builtins.open(path, mode, *args, **kwargs)
+
+write_all_events = osc['write_all_events']
+def counting_write_all_events(empty = False, gz = False, bury = False, names = None):
+    counts['writes'] += len([x for x in (osc['events'] if names is None else names) if 'stub' not in osc['events'][x]])
+    write_all_events(empty = empty, gz = gz, bury = bury, names = names)
+
+osc['open'] = counting_open
+osc['write_all_events'] = counting_write_all_events
+
+def ingest(budget, prefix):
+    osc['args'].memorybudget = budget
+    # Start from events already on disk, as stubs, like a task does.
+    for e in range(bargs.events):
+        name = osc['add_event'](prefix + str(e))
+        source = osc['add_source'](name, bibcode = '2016arXiv160501054G')
+        osc['add_quantity'](name, 'discoverdate', '2000/01/01', source)
+    osc['journal_events'](clear = False, flush = True)
+    osc['clear_events']()
+    counts['reads'] = counts['writes'] = 0
+    wavelengths = [str(3000 + 2*i) for i in range(500)]
+    fluxes = ['%.9e' % (1.e-15 + 1.e-18*i) for i in range(500)]
+    start = time.perf_counter()
+    for f in range(bargs.files):
+        for e in range(bargs.events):
+            name = osc['add_event'](prefix + str(e))
+            source = osc['add_source'](name, bibcode = '2016arXiv160501054G')
+            osc['add_spectrum'](name, 'Angstrom', 'erg/s/cm^2/Angstrom', wavelengths = wavelengths, fluxes = fluxes,
+                u_time = 'MJD', time = str(51544 + f), source = source, filename = 'bench' + str(f) + '.dat')
+            osc['journal_events']()
+    osc['journal_events'](clear = False, flush = True)
+    return time.perf_counter() - start
+
+print('{:>12} {:>10} {:>10} {:>10}'.format('budget (MB)', 'reads', 'writes', 'seconds'))
+for b, budget in enumerate([float(x) for x in bargs.budgets.split(',')]):
+    elapsed = ingest(budget, 'SN2000bench' + str(b) + '-')
+    print('{:>12g} {:>10} {:>10} {:>10.2f}'.format(budget, counts['reads'], counts['writes'], elapsed))
@@ -0,0 +1,47 @@
+import argparse
+import gc
+import json
+import os
+import tracemalloc
+from collections import OrderedDict
+from benchmarks import scriptsdir
+
+# Compares the memory held by loaded events when kept as nested OrderedDicts
+# (as parsed by json.loads) against the Event/entry classes in events.py.
+
+parser = argparse.ArgumentParser(description='Benchmark memory per loaded event.')
+parser.add_argument('files', nargs='*', help='Event files to load (defaults to the event repositories).')
+parser.add_argument('--count', dest='count', help='Maximum number of event files to load.', type=int, default=2000)
+bargs = parser.parse_args()
+
+os.chdir(scriptsdir)
+from events import *
+from repos import *
+
+files = bargs.files if bargs.files else sorted(repo_file_list())
+files = files[:bargs.count]
+if not files:
+    raise IOError('No event files found, clone the event repositories or pass files explicitly.')
+texts = [get_event_text(x) for x in files]
+
+def measure(convert):
+    gc.collect()
+    tracemalloc.start()
+    loaded = []
+    for text in texts:
+        event = json.loads(text, object_pairs_hook=OrderedDict)
+        name = next(iter(event))
+        loaded.append(convert(event[name]))
+        del(event)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size
+
+olddict = measure(lambda x: x)
+newobj = measure(make_event)
+
+print('Events loaded:          ' + str(len(texts)))
+print('OrderedDict bytes/event: ' + '{:,.0f}'.format(olddict/len(texts)))
+print('Event bytes/event:       ' + '{:,.0f}'.format(newobj/len(texts)))
+print('Reduction factor:        ' + '{:.2f}'.format(olddict/newobj))
@@ -0,0 +1,106 @@
+import argparse
+import os
+import random
+import shutil
+import time
+from benchmarks import load_import
+from benchmarks.synthetic import *
+
+# Merges the duplicates of a synthetic catalog twice from the same event files,
+# with the pairwise scan import.py used to make (every event's names against
+# those of every later event) and with merge_duplicates, times both and checks
+# that they leave the same event files. Some duplicates are chained (a third
+# entry sharing a name with the second only) so that groups of more than two
+# are merged as well.
+
+parser = argparse.ArgumentParser(description='Benchmark merging duplicate events.')
+parser.add_argument('--events', dest='events', help='Number of events.', type=int, default=2000)
+parser.add_argument('--duplicates', dest='duplicates', help='Fraction of events entered more than once.', type=float, default=0.1)
+parser.add_argument('--seed', dest='seed', help='Seed of the synthetic catalog.', type=int, default=0)
+parser.add_argument('--skip-pairwise', dest='skippairwise', help='Only time merge_duplicates.', default=False, action='store_true')
+bargs = parser.parse_args()
+
+osc = load_import()
+
+def pairwise_merge_duplicates():
+    events = osc['events']
+    keys = list(sorted(list(events.keys())))
+    for n1, name1 in enumerate(keys[:]):
+        if name1 not in events:
+            continue
+        allnames1 = osc['merge_names'](name1)
+        for name2 in keys[n1+1:]:
+            if name2 not in events or name1 == name2:
+                continue
+            allnames2 = osc['merge_names'](name2)
+            if bool(allnames1 & allnames2):
+                load1 = osc['load_event_from_file'](name1, delete = True)
+                load2 = osc['load_event_from_file'](name2, delete = True)
+                if load1 and load2:
+                    if osc['merge_priority'](allnames1) > osc['merge_priority'](allnames2):
+                        osc['copy_to_event'](name2, name1)
+                        keys.append(name1)
+                        osc['drop_event'](name2)
+                    else:
+                        osc['copy_to_event'](name1, name2)
+                        keys.append(name2)
+                        osc['drop_event'](name1)
+                osc['journal_events']()
+
+def reset_catalog():
+    osc['clear_events']()
+    osc['events'].clear()
+    osc['reindex_aliases']()
+    osc['eventpaths'].clear()
+    osc['stubindex'].clear()
+    if os.path.isfile(osc['stubindexpath']):
+        os.remove(osc['stubindexpath'])
+
+def repo_texts():
+    texts = {}
+    for rep in osc['repofolders']:
+        for fname in os.listdir('../' + rep):
+            with open('../' + rep + '/' + fname, 'r') as f:
+                texts[rep + '/' + fname] = f.read()
+    return texts
+
+rand = random.Random(bargs.seed)
+catalog = make_catalog(bargs.events, seed = bargs.seed, duplicates = bargs.duplicates)
+chained = []
+for event in catalog:
+    chained.append(event)
+    if rand.random() < bargs.duplicates/4.:
+        chained.append(duplicate_event(rand, event, int(event['quantities'][0][1][:4]), distributions))
+for event in chained:
+    name = osc['add_event'](event['name'])
+    source = osc['add_source'](name, bibcode = event['sources'][0])
+    for alias in event['aliases']:
+        osc['add_quantity'](name, 'alias', alias, source)
+    for quantity, value in event['quantities']:
+        osc['add_quantity'](name, quantity, value, source)
+osc['write_all_events']()
+for rep in osc['repofolders']:
+    shutil.copytree('../' + rep, '../' + rep + '-original')
+
+def run_merge(merge):
+    reset_catalog()
+    for rep in osc['repofolders']:
+        shutil.rmtree('../' + rep)
+        shutil.copytree('../' + rep + '-original', '../' + rep)
+    osc['load_stubs']()
+    start = time.perf_counter()
+    merge()
+    osc['journal_events'](clear = False, flush = True)
+    elapsed = time.perf_counter() - start
+    return (elapsed, len(osc['events']), repo_texts())
+
+(newtime, newcount, newtexts) = run_merge(osc['merge_duplicates'])
+print('Events entered:           ' + str(len(chained)))
+print('merge_duplicates:         {:.2f} s, {} events left'.format(newtime, newcount))
+if not bargs.skippairwise:
+    (oldtime, oldcount, oldtexts) = run_merge(pairwise_merge_duplicates)
+    print('Pairwise scan:            {:.2f} s, {} events left'.format(oldtime, oldcount))
+    print('Speedup:                  {:.1f}x'.format(oldtime/newtime))
+    print('Files only one has:       ' + str(len(set(oldtexts) ^ set(newtexts))))
+    print('Files that differ:        ' + str(len([x for x in oldtexts if x in newtexts and oldtexts[x] != newtexts[x]])))
+shutil.rmtree(osc['benchscratch'])
@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import time
+from collections import OrderedDict
+from benchmarks import load_import, scriptsdir
+from benchmarks.synthetic import *
+
+# Times the ingest primitives of import.py one at a time on synthetic catalogs
+# of several sizes: every event is added, then all its sources, quantities,
+# photometry and spectra, the names are cleaned, the events written and the
+# duplicates merged from the written files. Nothing is fetched. The timings,
+# with the commit, machine and distributions they were made with, are written
+# to a JSON file, and an earlier file can be given to compare against. Runs are
+# only comparable on the same machine with the same distributions and seed.
+
+parser = argparse.ArgumentParser(description='Benchmark the ingest primitives of import.py.')
+parser.add_argument('files', nargs='*', help='Event files to fit the catalog distributions to.')
+parser.add_argument('--scales', dest='scales', help='Comma-delimited list of catalog sizes.', default='250,1000,4000')
+parser.add_argument('--seed', dest='seed', help='Seed of the synthetic catalogs.', type=int, default=0)
+parser.add_argument('--repeat', dest='repeat', help='Runs per scale, the fastest of which is kept.', type=int, default=1)
+parser.add_argument('--distributions', dest='distributions', help='JSON file with the distributions (or earlier results) to use.', default='')
+parser.add_argument('--output', dest='output', help='JSON file to write the results to.', default='primitives.json')
+parser.add_argument('--compare', dest='compare', help='JSON file with earlier results to compare against.', default='')
+bargs = parser.parse_args()
+
+output = os.path.abspath(bargs.output)
+compare = os.path.abspath(bargs.compare) if bargs.compare else ''
+
+os.chdir(scriptsdir)
+try:
+    commit = subprocess.check_output(['git', 'describe', '--always', '--dirty'], stderr = subprocess.DEVNULL).decode('utf-8').strip()
+except (OSError, subprocess.CalledProcessError):
+    commit = ''
+
+if bargs.distributions:
+    dists = load_distributions(bargs.distributions)
+elif bargs.files:
+    from events import get_event_text
+    dists = fit_distributions([get_event_text(x) for x in bargs.files])
+else:
+    dists = distributions
+
+osc = load_import()
+
+primitives = ['add_event', 'add_source', 'add_quantity', 'add_photometry', 'add_spectrum', 'name_clean',
+    'write_all_events', 'merge_duplicates']
+
+# Empties the catalog, its indexes and the scratch repositories.
+def reset_catalog():
+    osc['clear_events']()
+    osc['events'].clear()
+    osc['reindex_aliases']()
+    osc['eventpaths'].clear()
+    osc['stubindex'].clear()
+    for rep in osc['repofolders']:
+        shutil.rmtree('../' + rep)
+        os.makedirs('../' + rep)
+    if os.path.isfile(osc['stubindexpath']):
+        os.remove(osc['stubindexpath'])
+
+def run_catalog(catalog):
+    reset_catalog()
+    timings = OrderedDict()
+    def record(primitive, calls, start):
+        timings[primitive] = OrderedDict([('calls', calls), ('seconds', time.perf_counter() - start)])
+
+    start = time.perf_counter()
+    names = [osc['add_event'](x['name']) for x in catalog]
+    record('add_event', len(catalog), start)
+
+    start = time.perf_counter()
+    sources = [[osc['add_source'](name, bibcode = x) for x in event['sources']] for name, event in zip(names, catalog)]
+    record('add_source', sum([len(x) for x in sources]), start)
+
+    calls = 0
+    start = time.perf_counter()
+    for name, event, srcs in zip(names, catalog, sources):
+        for alias in event['aliases']:
+            osc['add_quantity'](name, 'alias', alias, srcs[0])
+        for q, (quantity, value) in enumerate(event['quantities']):
+            osc['add_quantity'](name, quantity, value, srcs[q % len(srcs)])
+        calls += len(event['aliases']) + len(event['quantities'])
+    record('add_quantity', calls, start)
+
+    calls = 0
+    start = time.perf_counter()
+    for name, event, srcs in zip(names, catalog, sources):
+        for photo in event['photometry']:
+            osc['add_photometry'](name, time = photo['time'], band = photo['band'], magnitude = photo['magnitude'],
+                e_magnitude = photo['e_magnitude'], upperlimit = photo['upperlimit'], source = srcs[photo['source']])
+        calls += len(event['photometry'])
+    record('add_photometry', calls, start)
+
+    calls = 0
+    start = time.perf_counter()
+    for name, event, srcs in zip(names, catalog, sources):
+        for spectrum in event['spectra']:
+            osc['add_spectrum'](name, 'Angstrom', 'erg/s/cm^2/Angstrom', wavelengths = spectrum['wavelengths'],
+                fluxes = spectrum['fluxes'], u_time = 'MJD', time = spectrum['time'], source = srcs[spectrum['source']])
+        calls += len(event['spectra'])
+    record('add_spectrum', calls, start)
+
+    aliases = [x for event in catalog for x in event['aliases']]
+    start = time.perf_counter()
+    for alias in aliases:
+        osc['name_clean'](alias)
+    record('name_clean', len(aliases), start)
+
+    count = len(osc['events'])
+    start = time.perf_counter()
+    osc['write_all_events']()
+    record('write_all_events', count, start)
+
+    osc['clear_events']()
+    start = time.perf_counter()
+    osc['merge_duplicates']()
+    record('merge_duplicates', count, start)
+    timings['merge_duplicates']['merged'] = count - len(osc['events'])
+    return timings
+
+results = []
+for scale in [int(x) for x in bargs.scales.split(',')]:
+    catalog = make_catalog(scale, seed = bargs.seed, dists = dists)
+    best = OrderedDict()
+    for r in range(bargs.repeat):
+        timings = run_catalog(catalog)
+        for primitive in timings:
+            if primitive not in best or timings[primitive]['seconds'] < best[primitive]['seconds']:
+                best[primitive] = timings[primitive]
+    for primitive in primitives:
+        results.append(OrderedDict([('events', scale), ('primitive', primitive)] + list(best[primitive].items())))
+shutil.rmtree(osc['benchscratch'])
+
+report = OrderedDict([
+    ('commit', commit),
+    ('date', time.strftime('%Y-%m-%d %H:%M:%S')),
+    ('python', platform.python_version()),
+    ('platform', platform.platform()),
+    ('processor', platform.processor()),
+    ('cpus', os.cpu_count()),
+    ('seed', bargs.seed),
+    ('distributions', dists),
+    ('results', results)
+])
+with open(output, 'w') as f:
+    f.write(json.dumps(report, indent='\t', separators=(',', ':')))
+
+earlier = {}
+if compare:
+    with open(compare, 'r') as f:
+        oldreport = json.loads(f.read(), object_pairs_hook=OrderedDict)
+    if oldreport['distributions'] != dists or oldreport['seed'] != bargs.seed:
+        print('Warning: ' + bargs.compare + ' was made from other synthetic catalogs.')
+    earlier = dict(((x['events'], x['primitive']), x) for x in oldreport['results'])
+
+print('{:>8} {:<18} {:>10} {:>10} {:>12}'.format('events', 'primitive', 'calls', 'seconds', 'us per call') +
+    (' {:>10}'.format('vs ' + oldreport['commit'][:7]) if earlier else ''))
+for result in results:
+    line = '{:>8} {:<18} {:>10} {:>10.3f} {:>12.2f}'.format(result['events'], result['primitive'], result['calls'],
+        result['seconds'], 1.e6*result['seconds']/max(result['calls'], 1))
+    old = earlier.get((result['events'], result['primitive']))
+    if old and old['seconds'] > 0.:
+        line += ' {:>9.2f}x'.format(result['seconds']/old['seconds'])
+    print(line)
+print('Results written to ' + output)
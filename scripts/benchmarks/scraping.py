@@ -0,0 +1,84 @@
+import argparse
+import os
+import time
+from glob import glob
+from bs4 import BeautifulSoup
+from benchmarks import scriptsdir
+
+# Parses the cached pages of the scraping tasks the way import.py used to (the
+# whole page with html5lib) and the way it does now (parse_html, keeping only the
+# elements each task reads), times both and checks that the elements the task
+# goes on to read serialize identically.
+
+parser = argparse.ArgumentParser(description='Benchmark HTML parsing of the cached scraped pages.')
+parser.add_argument('--builder', dest='builder', help='Tree builder to compare against html5lib.', default='')
+parser.add_argument('--count', dest='count', help='Maximum number of pages of each kind.', type=int, default=50)
+bargs = parser.parse_args()
+
+os.chdir(scriptsdir)
+from htmlparse import *
+
+def rows(soup):
+    return soup.findAll('tr')
+
+def first_table_rows(soup):
+    return soup.find('table').findAll('tr')
+
+def links(soup):
+    return soup.findAll('a')
+
+def ogle_lines(soup):
+    return soup.findAll('a') + [x.nextSibling for x in soup.findAll('br')]
+
+def candidate(soup):
+    return soup.findAll('script') + soup.findAll('table', {"class":"generictable"})
+
+# Kind of page, its cached files, the elements kept by parse_html, what the task
+# reads from them and, where it differs, what it read from the html5lib tree.
+pages = [
+    ('Asiago catalog', '../sne-external/asiago-cat.php',                 None,     {}, first_table_rows, None),
+    ('Asiago spectra', '../sne-external-spectra/Asiago/spectra.html',    None,     {}, rows, None),
+    ('ASASSN',         '../sne-external/ASASSN/sn_list.html',            None,     {}, first_table_rows, None),
+    ('CCCP',           '../sne-external/CCCP/*.html',                    'a',      {}, links, lambda x: x.body.findAll('a')),
+    ('CRTS',           '../sne-external/CRTS/*.html',                    None,     {}, rows, None),
+    ('DES',            '../sne-external/DES/transients.html',            None,     {}, tbody_rows, lambda x: x.find('tbody').findAll('tr')),
+    ('OGLE',           '../sne-external/OGLE-*-transients.html',         None,     {}, ogle_lines, None),
+    ('PS1 3pi',        '../sne-external/3pi/page*.html',                 None,     {}, rows, None),
+    ('PS1 3pi pages',  '../sne-external/3pi/candidate-*.html',           ['script', 'table'], {}, candidate, None),
+    ('PTF',            '../sne-external/PTF/update.html',                'select', {"name":"objid"}, lambda x: x.find('select').findAll('option'), None),
+    ('Rochester',      '../sne-external/rochester/*.html',               None,     {}, rows, None),
+    ('SUSPECT',        '../sne-external/SUSPECT/*.html',                 None,     {}, lambda x: x.body.findAll('a'), None),
+    ('WISeREP',        '../sne-external-WISEREP/*/*.html',               'tr',     {}, lambda x: x.findAll('tr', {'valign': 'top'}), None)
+]
+
+print('{:16}{:>7}{:>9}{:>14}{:>12}{:>9}{:>12}'.format('Pages', 'Files', 'MB', 'html5lib (s)', 'new (s)', 'Speedup', 'Mismatches'))
+totals = [0., 0.]
+mismatches = []
+for (kind, pattern, only, attrs, extract, oldextract) in pages:
+    files = sorted(glob(pattern))[:bargs.count]
+    if not files:
+        continue
+    size = 0
+    times = [0., 0.]
+    bad = 0
+    for fname in files:
+        with open(fname, 'r') as f:
+            html = f.read()
+        size += len(html)
+        start = time.perf_counter()
+        old = (oldextract if oldextract else extract)(BeautifulSoup(html, 'html5lib'))
+        times[0] += time.perf_counter() - start
+        start = time.perf_counter()
+        new = extract(parse_html(html, only, attrs, builder = bargs.builder))
+        times[1] += time.perf_counter() - start
+        if [str(x) for x in old] != [str(x) for x in new]:
+            bad += 1
+            mismatches.append(fname)
+    totals = [x + y for x, y in zip(totals, times)]
+    print('{:16}{:>7}{:>9.2f}{:>14.3f}{:>12.3f}{:>9.1f}{:>12}'.format(kind, len(files), size/1.e6, times[0], times[1], times[0]/times[1], bad))
+
+if not totals[1]:
+    raise IOError('No cached pages found, run the scraping tasks first.')
+print('{:16}{:>7}{:>9}{:>14.3f}{:>12.3f}{:>9.1f}'.format('All', '', '', totals[0], totals[1], totals[0]/totals[1]))
+for fname in mismatches:
+    print('Differs: ' + fname)
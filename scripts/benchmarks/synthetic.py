@@ -0,0 +1,166 @@
+import bisect
+import json
+import random
+import string
+from collections import OrderedDict
+
+# Generates catalogs of made-up events for the benchmarks, shaped like the real
+# one: how many aliases, sources, photometry points and spectra each event has,
+# and how long its spectra are, are drawn from histograms of [low, high, weight]
+# bins (counts uniform within a bin). The defaults below follow the rough shape
+# of the catalog; fit_distributions builds the same histograms from event files
+# for an exact match. A fraction of the events come twice, under a second name
+# that shares an alias or is the AT designation of the first, for
+# merge_duplicates to find.
+
+distributions = OrderedDict([
+    ('aliases',    [[1, 2, .45], [2, 3, .30], [3, 5, .18], [5, 10, .07]]),
+    ('sources',    [[1, 2, .40], [2, 4, .35], [4, 8, .18], [8, 30, .07]]),
+    ('photometry', [[0, 1, .35], [1, 10, .25], [10, 40, .20], [40, 160, .12], [160, 640, .06], [640, 3000, .02]]),
+    ('spectra',    [[0, 1, .90], [1, 3, .06], [3, 10, .03], [10, 60, .01]]),
+    ('spectrumsize', [[200, 1000, .30], [1000, 2000, .40], [2000, 5000, .25], [5000, 20000, .05]])
+])
+duplicatefraction = 0.02
+
+bands = ['U', 'B', 'V', 'R', 'I', 'g', 'r', 'i', 'z', 'J', 'H', 'K', 'UVW1', 'UVM2', 'UVW2']
+claimedtypes = ['Ia', 'Ia', 'Ia', 'II', 'II', 'IIP', 'IIn', 'Ib', 'Ic', 'Ic-BL', 'Ib/c', 'Candidate']
+
+# Distributions saved in a JSON file, on their own or with the results of an
+# earlier benchmark run.
+def load_distributions(path):
+    with open(path, 'r') as f:
+        dists = json.loads(f.read(), object_pairs_hook=OrderedDict)
+    return dists.get('distributions', dists)
+
+# Histograms with power of two bins of the counts in the given event files.
+def fit_distributions(texts):
+    counts = OrderedDict((x, []) for x in distributions)
+    for text in texts:
+        event = json.loads(text, object_pairs_hook=OrderedDict)
+        event = event[next(reversed(event))]
+        counts['aliases'].append(max(len(event.get('alias', [])), 1))
+        counts['sources'].append(max(len(event.get('sources', [])), 1))
+        counts['photometry'].append(len(event.get('photometry', [])))
+        counts['spectra'].append(len(event.get('spectra', [])))
+        counts['spectrumsize'].extend([len(x['data']) for x in event.get('spectra', []) if 'data' in x])
+    fitted = OrderedDict()
+    for key in counts:
+        if not counts[key]:
+            fitted[key] = distributions[key]
+            continue
+        bins = OrderedDict()
+        for count in counts[key]:
+            low = 0 if count == 0 else 2**(count.bit_length() - 1)
+            bins[low] = bins.get(low, 0) + 1
+        fitted[key] = [[x, max(2*x, 1), bins[x]/len(counts[key])] for x in sorted(bins)]
+    return fitted
+
+def draw(rand, bins):
+    cumulative = []
+    total = 0.
+    for low, high, weight in bins:
+        total += weight
+        cumulative.append(total)
+    low, high, weight = bins[min(bisect.bisect(cumulative, rand.random()*total), len(bins) - 1)]
+    return rand.randrange(low, high)
+
+def letters(rand, count):
+    return ''.join(rand.choice(string.ascii_lowercase) for i in range(count))
+
+def coordinate_name(rand, prefix):
+    return (prefix + 'J' + str(rand.randrange(24)).zfill(2) + str(rand.randrange(60)).zfill(2) + str(rand.randrange(6000)).zfill(4) +
+        rand.choice('+-') + str(rand.randrange(90)).zfill(2) + str(rand.randrange(60)).zfill(2) + str(rand.randrange(600)).zfill(3))
+
+# A designation in one of the forms that sources give names in, cleaned or not.
+def random_name(rand, year):
+    yy = str(year)[2:]
+    kind = rand.randrange(10)
+    if kind < 3:
+        return 'SN' + str(year) + (letters(rand, 1).upper() if rand.random() < 0.1 else letters(rand, rand.choice([2, 2, 3])))
+    if kind == 3:
+        return rand.choice(['PTF', 'iPTF']) + yy + letters(rand, 3)
+    if kind == 4:
+        return 'PS1-' + yy + letters(rand, rand.choice([1, 2, 3]))
+    if kind == 5:
+        return 'ASASSN-' + yy + letters(rand, 2)
+    if kind == 6:
+        return 'Gaia' + yy + letters(rand, 3)
+    if kind == 7:
+        return coordinate_name(rand, rand.choice(['MASTER OT ', 'MASJ', 'PSN ', 'PNV ']))
+    if kind == 8:
+        return rand.choice(['LSQ', 'SNhunt', 'CSS', 'DES']) + yy + letters(rand, 2)
+    return 'OGLE-' + str(year) + '-SN-' + str(rand.randrange(1, 200)).zfill(3)
+
+def random_bibcode(rand, year):
+    return (str(year) + rand.choice(['ApJ..', 'MNRAS', 'A&A..', 'AJ...', 'PASP.', 'CBET.', 'ATel.']) +
+        str(rand.randrange(1, 900)).rjust(4, '.') + rand.choice('.L') + str(rand.randrange(1, 3000)).rjust(4, '.') +
+        rand.choice(string.ascii_uppercase))
+
+def random_spectrum(rand, size, mjd):
+    start = rand.uniform(3000., 4000.)
+    step = rand.uniform(1., 10.)
+    scale = 10.**rand.uniform(-17., -14.)
+    return OrderedDict([
+        ('time', '%.3f' % mjd),
+        ('wavelengths', ['%.2f' % (start + step*i) for i in range(size)]),
+        ('fluxes', ['%.6e' % (scale*(1. + 0.1*rand.random())) for i in range(size)])
+    ])
+
+def random_event(rand, name, year, dists):
+    mjd = 36934. + 365.25*(year - 1960) + rand.uniform(0., 365.)
+    event = OrderedDict()
+    event['name'] = name
+    event['aliases'] = [name] + [random_name(rand, year) for i in range(draw(rand, dists['aliases']) - 1)]
+    event['sources'] = [random_bibcode(rand, year + rand.randrange(3)) for i in range(draw(rand, dists['sources']))]
+    event['quantities'] = [
+        ('discoverdate', str(year) + '/' + str(rand.randrange(1, 13)).zfill(2) + '/' + str(rand.randrange(1, 29)).zfill(2)),
+        ('ra', str(rand.randrange(24)).zfill(2) + ':' + str(rand.randrange(60)).zfill(2) + ':' + '%05.2f' % rand.uniform(0., 60.)),
+        ('dec', rand.choice('+-') + str(rand.randrange(90)).zfill(2) + ':' + str(rand.randrange(60)).zfill(2) + ':' + '%04.1f' % rand.uniform(0., 60.)),
+        ('redshift', '%.4f' % rand.uniform(0.001, 0.3)),
+        ('claimedtype', rand.choice(claimedtypes))
+    ]
+    event['photometry'] = []
+    for i in range(draw(rand, dists['photometry'])):
+        upper = rand.random() < 0.1
+        event['photometry'].append(OrderedDict([
+            ('time', '%.3f' % (mjd + rand.uniform(-20., 300.))),
+            ('band', rand.choice(bands)),
+            ('magnitude', '%.2f' % rand.uniform(12., 23.)),
+            ('e_magnitude', '' if upper else '%.2f' % rand.uniform(0.01, 0.3)),
+            ('upperlimit', upper),
+            ('source', rand.randrange(len(event['sources'])))
+        ]))
+    event['spectra'] = []
+    for i in range(draw(rand, dists['spectra'])):
+        spectrum = random_spectrum(rand, draw(rand, dists['spectrumsize']), mjd + rand.uniform(-10., 200.))
+        spectrum['source'] = rand.randrange(len(event['sources']))
+        event['spectra'].append(spectrum)
+    return event
+
+# A second entry for the same event: its AT designation, or a new name sharing
+# one of its aliases.
+def duplicate_event(rand, event, year, dists):
+    name = event['name']
+    if name.startswith('SN') and rand.random() < 0.5:
+        twinname = 'AT' + name[2:]
+    else:
+        twinname = random_name(rand, year)
+    twin = random_event(rand, twinname, year, dists)
+    twin['aliases'].append(rand.choice(event['aliases']))
+    return twin
+
+# Returns count events (plus their duplicates), the same for the same seed.
+def make_catalog(count, seed = 0, dists = distributions, duplicates = duplicatefraction):
+    rand = random.Random(seed)
+    catalog = []
+    names = set()
+    while len(names) < count:
+        year = rand.randrange(1960, 2017)
+        name = random_name(rand, year)
+        if name in names:
+            continue
+        names.add(name)
+        catalog.append(random_event(rand, name, year, dists))
+        if rand.random() < duplicates:
+            catalog.append(duplicate_event(rand, catalog[-1], year, dists))
+    return catalog
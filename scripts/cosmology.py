@@ -0,0 +1,84 @@
+import os
+import numpy
+from astropy.cosmology import Planck15 as cosmo
+
+# Distance-redshift relations of the Planck15 cosmology interpolated from a
+# dense table, for arrays of redshifts or distances at once. The table holds the
+# comoving distance on a grid even in log(1 + z) together with its derivative,
+# so that cubic Hermite interpolation can be used both ways. It is built once by
+# Gauss-Legendre integration of 1/E(z), checked against astropy's own integrals
+# and kept on disk.
+
+cosmologypath = '../cosmology-planck15.npz'
+cosmologyzmax = 1000.
+cosmologypoints = 20000
+cosmologyprecision = 1.e-9
+
+cosmologytable = {}
+
+def build_cosmology_table():
+    if cosmo.Ok0 != 0.:
+        raise(ValueError('Distance tables assume a flat cosmology.'))
+    u = numpy.linspace(0., numpy.log1p(cosmologyzmax), cosmologypoints)
+    z = numpy.expm1(u)
+    (nodes, weights) = numpy.polynomial.legendre.leggauss(8)
+    mid = 0.5*(z[1:] + z[:-1])
+    half = 0.5*(z[1:] - z[:-1])
+    integrand = numpy.array([cosmo.inv_efunc(mid + half*x) for x in nodes])
+    steps = half*numpy.dot(weights, integrand)
+    hubble = cosmo.hubble_distance.to('Mpc').value
+    table = {'z': z, 'dc': hubble*numpy.concatenate([[0.], numpy.cumsum(steps)]),
+        'ddcdz': hubble*cosmo.inv_efunc(z), 'key': numpy.array(repr(cosmo)), 'zmax': numpy.array(cosmologyzmax),
+        'points': numpy.array(cosmologypoints)}
+    check = numpy.linspace(0.001, 10., 25)
+    error = numpy.abs(hermite(check, table['z'], table['dc'], table['ddcdz'])/cosmo.comoving_distance(check).value - 1.)
+    if numpy.max(error) > cosmologyprecision:
+        raise(ValueError('Cosmology table differs from astropy by ' + str(numpy.max(error)) + '.'))
+    return table
+
+def load_cosmology_table():
+    if cosmologytable:
+        return cosmologytable
+    if os.path.isfile(cosmologypath):
+        with numpy.load(cosmologypath) as npz:
+            # The grid is compared by the parameters it was built from, its last node isn't exactly zmax.
+            if ('zmax' in npz.files and 'points' in npz.files and str(npz['key']) == repr(cosmo) and
+                float(npz['zmax']) == cosmologyzmax and int(npz['points']) == cosmologypoints):
+                cosmologytable.update([(x, npz[x]) for x in npz.files])
+    if not cosmologytable:
+        cosmologytable.update(build_cosmology_table())
+        temppath = cosmologypath + '.' + str(os.getpid()) + '.npz'
+        numpy.savez(temppath, **cosmologytable)
+        os.replace(temppath, cosmologypath)
+    return cosmologytable
+
+def hermite(x, xs, ys, dys):
+    x = numpy.asarray(x, dtype = float)
+    i = numpy.clip(numpy.searchsorted(xs, x) - 1, 0, len(xs) - 2)
+    h = xs[i + 1] - xs[i]
+    t = (x - xs[i])/h
+    return ((2.*t**3 - 3.*t**2 + 1.)*ys[i] + (t**3 - 2.*t**2 + t)*h*dys[i] +
+        (-2.*t**3 + 3.*t**2)*ys[i + 1] + (t**3 - t**2)*h*dys[i + 1])
+
+def cosmo_comoving_distance(z):
+    table = load_cosmology_table()
+    z = numpy.asarray(z, dtype = float)
+    if numpy.any(z < 0.):
+        raise(ValueError('Negative redshift.'))
+    dc = hermite(z, table['z'], table['dc'], table['ddcdz'])
+    # Redshifts past the table are rare enough to integrate directly.
+    beyond = z > cosmologyzmax
+    if numpy.any(beyond):
+        dc = numpy.where(beyond, cosmo.comoving_distance(numpy.where(beyond, z, 0.)).value, dc)
+    return dc
+
+def cosmo_luminosity_distance(z):
+    return (1. + numpy.asarray(z, dtype = float))*cosmo_comoving_distance(z)
+
+# Redshift at a comoving distance (Mpc), as z_at_value(cosmo.comoving_distance, ...) finds it.
+def cosmo_redshift(dc, zmax = cosmologyzmax):
+    table = load_cosmology_table()
+    dc = numpy.asarray(dc, dtype = float)
+    if numpy.any(dc < 0.) or numpy.any(dc > cosmo_comoving_distance(min(zmax, cosmologyzmax))):
+        raise(ValueError('Comoving distance outside of the redshift range.'))
+    return hermite(dc, table['dc'], table['z'], 1./table['ddcdz'])
@@ -1,3 +1,4 @@
+import numpy
 from math import log10, floor
 
 def get_sig_digits(x):
@@ -49,3 +50,41 @@ def zpad(val, n = 2):
     if len(bits) != 2:
         return val.zfill(n)
     return "%s.%s" % (bits[0].zfill(n), bits[1])
+
+# Parse a sequence of number strings into a float array, NaN where unparseable.
+def str_floats(arr):
+    try:
+        return numpy.array(arr, dtype=str).astype(float)
+    except ValueError:
+        floats = numpy.empty(len(arr))
+        for i, x in enumerate(arr):
+            floats[i] = float(x) if is_number(x) else float('nan')
+        return floats
+
+# Replace each string by str(round_sig(float(x), length)) where that is shorter.
+# Only strings longer than length can shrink, and those are parsed and their
+# exponents found in bulk. The rounding itself goes through '%.*f', which rounds
+# exactly as round() does, so the output matches the scalar version.
+def trim_str_arr(arr, length = 10):
+    strs = numpy.array(arr, dtype=str)
+    trimmed = strs.tolist()
+    candidates = numpy.flatnonzero(numpy.char.str_len(strs) > length)
+    if not len(candidates):
+        return trimmed
+    floats = str_floats(strs[candidates])
+    finite = numpy.isfinite(floats)
+    candidates, floats = candidates[finite], floats[finite]
+    with numpy.errstate(divide='ignore'):
+        logs = numpy.log10(numpy.abs(floats))
+    for c, x, lg in zip(candidates.tolist(), floats.tolist(), logs.tolist()):
+        if x == 0.0:
+            rounded = 0.0
+        else:
+            # Recheck exponents that numpy's log10 could put on the wrong side of an integer.
+            exponent = int(floor(log10(abs(x)) if abs(lg - round(lg)) < 1.e-9 else lg))
+            decimals = length - exponent - 1
+            rounded = float('%.*f' % (decimals, x)) if decimals >= 0 else round(x, decimals)
+        rstr = str(rounded)
+        if len(rstr) < len(trimmed[c]):
+            trimmed[c] = rstr
+    return trimmed
@@ -0,0 +1,68 @@
+import os
+import numpy
+from astropy.io import fits
+
+# Schlegel, Finkbeiner & Davis (1998) dust maps, one Lambert zenithal equal-area
+# projection per Galactic hemisphere, read straight from the FITS files so that
+# E(B-V) can be looked up for any number of coordinates without IRSA. Values are
+# rescaled to Schlafly & Finkbeiner (2011), as IRSA's "SandF" columns are. IRSA
+# also gives the spread of E(B-V) around the position, which a single map value
+# has no counterpart of, so values from the maps come without an error.
+
+dustmapfiles = ['SFD_dust_4096_ngp.fits', 'SFD_dust_4096_sgp.fits']
+sandfscale = 0.86
+
+# ICRS (J2000) to Galactic rotation.
+galacticmatrix = numpy.array([
+    [-0.0548755604162154, -0.8734370902348850, -0.4838350155487132],
+    [ 0.4941094278755837, -0.4448296299600112,  0.7469822444972189],
+    [-0.8676661490190047, -0.1980763734312015,  0.4559837761750669]])
+
+dustmaps = []
+
+def load_dust_maps(folder):
+    if dustmaps:
+        return True
+    paths = [os.path.join(folder, x) for x in dustmapfiles]
+    if not all([os.path.isfile(x) for x in paths]):
+        return False
+    for path in paths:
+        hdulist = fits.open(path, memmap = True)
+        header = hdulist[0].header
+        dustmaps.append((hdulist[0].data, header['CRPIX1'] - 1., header['CRPIX2'] - 1., header['LAM_SCAL'], header['LAM_NSGP']))
+    return True
+
+def sexagesimal_degrees(value, hours = False):
+    if ':' not in value:
+        return float(value)
+    parts = [float(x) for x in value.strip().lstrip('+-').split(':')]
+    degrees = sum([x/60.**i for i, x in enumerate(parts)])
+    return (-1. if value.strip().startswith('-') else 1.)*degrees*(15. if hours else 1.)
+
+def galactic_coordinates(ra, dec):
+    ra = numpy.radians(numpy.asarray(ra, dtype = float))
+    dec = numpy.radians(numpy.asarray(dec, dtype = float))
+    vector = numpy.array([numpy.cos(dec)*numpy.cos(ra), numpy.cos(dec)*numpy.sin(ra), numpy.sin(dec)])
+    gal = numpy.tensordot(galacticmatrix, vector, axes = 1)
+    return (numpy.arctan2(gal[1], gal[0]), numpy.arcsin(numpy.clip(gal[2], -1., 1.)))
+
+# Bilinear interpolation of each map at the points in its hemisphere.
+def sfd_ebv(ra, dec):
+    if not dustmaps:
+        raise(ValueError('Dust maps not loaded, call load_dust_maps first.'))
+    (l, b) = galactic_coordinates(ra, dec)
+    ebv = numpy.zeros(l.shape)
+    for (data, crpix1, crpix2, lamscal, n) in dustmaps:
+        sel = (b >= 0.) if n > 0 else (b < 0.)
+        if not numpy.any(sel):
+            continue
+        r = lamscal*numpy.sqrt(1. - n*numpy.sin(b[sel]))
+        x = numpy.clip(crpix1 + r*numpy.cos(l[sel]), 0., data.shape[1] - 1.)
+        y = numpy.clip(crpix2 - n*r*numpy.sin(l[sel]), 0., data.shape[0] - 1.)
+        x0 = numpy.minimum(numpy.floor(x).astype(int), data.shape[1] - 2)
+        y0 = numpy.minimum(numpy.floor(y).astype(int), data.shape[0] - 2)
+        dx = x - x0
+        dy = y - y0
+        ebv[sel] = ((1. - dx)*(1. - dy)*data[y0, x0] + dx*(1. - dy)*data[y0, x0 + 1] +
+            (1. - dx)*dy*data[y0 + 1, x0] + dx*dy*data[y0 + 1, x0 + 1])
+    return ebv*sandfscale
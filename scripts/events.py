@@ -1,4 +1,11 @@
+import codecs
 import gzip
+import io
+import os
+import sys
+import numpy
+from array import array
+from collections import OrderedDict
 
 def get_event_text(eventfile):
     if eventfile.split('.')[-1] == 'gz':
@@ -9,5 +16,387 @@ def get_event_text(eventfile):
             filetext = f.read()
     return filetext
 
+# Compressed (.gz) event files are written through gzip directly rather than
+# written out in full and compressed afterwards. Either is written to a
+# temporary file first and moved into place, so that the file is never seen
+# half written.
+def write_event_text(eventfile, filetext):
+    temppath = eventfile + '.' + str(os.getpid())
+    if eventfile.split('.')[-1] == 'gz':
+        with open(temppath, 'wb') as raw:
+            with io.TextIOWrapper(gzip.GzipFile(eventfile, 'wb', fileobj = raw), encoding='utf8') as f:
+                f.write(filetext)
+    else:
+        with codecs.open(temppath, 'w', encoding='utf8') as f:
+            f.write(filetext)
+    os.replace(temppath, eventfile)
+
 def get_event_filename(name):
     return(name.replace('/', '_'))
+
+# Compact stand-ins for the nested OrderedDicts that make up an event. Fields
+# common to a record kind live in __slots__, anything else in a small overflow
+# dict, and each record remembers its key order (as a tuple shared between all
+# records with the same order) so that it serializes exactly like the
+# OrderedDict it replaces. Categorical strings are interned.
+keyorders = {}
+
+class Entry(object):
+    __slots__ = ('_keys', '_extra')
+    slotkeys = frozenset()
+    internkeys = frozenset()
+
+    def __init__(self, items = ()):
+        self._keys = ()
+        self._extra = None
+        if hasattr(items, 'items'):
+            items = items.items()
+        for key, value in items:
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        if key in self.slotkeys:
+            return getattr(self, key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self.internkeys and isinstance(value, str):
+            value = sys.intern(value)
+        if key not in self._keys:
+            keys = self._keys + (key,)
+            self._keys = keyorders.setdefault(keys, keys)
+        if key in self.slotkeys:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        keys = tuple(x for x in self._keys if x != key)
+        self._keys = keyorders.setdefault(keys, keys)
+        if key in self.slotkeys:
+            delattr(self, key)
+        else:
+            del(self._extra[key])
+            if not self._extra:
+                self._extra = None
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __eq__(self, other):
+        if isinstance(other, Entry):
+            return self.items() == other.items()
+        if isinstance(other, dict):
+            return dict(self.items()) == other
+        return NotImplemented
+
+    def __repr__(self):
+        return type(self).__name__ + '(' + repr(self.items()) + ')'
+
+    def keys(self):
+        return list(self._keys)
+
+    def values(self):
+        return [self[x] for x in self._keys]
+
+    def items(self):
+        return [(x, self[x]) for x in self._keys]
+
+    def get(self, key, default = None):
+        return self[key] if key in self._keys else default
+
+    def setdefault(self, key, default = None):
+        if key not in self._keys:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self._keys:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self[key]
+        del(self[key])
+        return value
+
+    def copy(self):
+        return type(self)(self.items())
+
+class QuantityEntry(Entry):
+    __slots__ = ('value', 'error', 'source', 'kind', 'probability', 'unit', 'derived')
+    slotkeys = frozenset(__slots__)
+    internkeys = frozenset(['source', 'kind', 'unit'])
+
+class SourceEntry(Entry):
+    __slots__ = ('name', 'url', 'reference', 'bibcode', 'acknowledgment', 'alias', 'secondary')
+    slotkeys = frozenset(__slots__)
+    internkeys = frozenset(['name', 'url', 'reference', 'bibcode', 'acknowledgment', 'alias'])
+
+class PhotoEntry(Entry):
+    __slots__ = ('time', 'e_time', 'u_time', 'band', 'system', 'magnitude', 'e_magnitude', 'upperlimit',
+        'telescope', 'instrument', 'observatory', 'observer', 'survey', 'source')
+    slotkeys = frozenset(__slots__)
+    internkeys = frozenset(['u_time', 'band', 'system', 'telescope', 'instrument', 'observatory', 'observer',
+        'survey', 'source', 'u_flux', 'u_fluxdensity', 'u_frequency', 'u_energy'])
+
+class SpectrumEntry(Entry):
+    __slots__ = ('u_time', 'time', 'instrument', 'telescope', 'observatory', 'filename', 'waveunit', 'fluxunit',
+        'errorunit', 'data', 'source')
+    slotkeys = frozenset(__slots__)
+    internkeys = frozenset(['u_time', 'instrument', 'telescope', 'observatory', 'waveunit', 'fluxunit', 'errorunit',
+        'source', 'observer', 'reducer', 'survey'])
+
+class Event(Entry):
+    __slots__ = ('schema', 'name', 'sources', 'alias', 'distinctfrom', 'errors', 'discoverdate', 'discoverer',
+        'maxdate', 'claimedtype', 'ra', 'dec', 'host', 'hostra', 'hostdec', 'redshift', 'velocity', 'ebv',
+        'maxappmag', 'maxband', 'photometry', 'spectra', 'stub')
+    slotkeys = frozenset(__slots__)
+    internkeys = frozenset(['schema'])
+
+entryclasses = {
+    'sources': SourceEntry,
+    'photometry': PhotoEntry,
+    'spectra': SpectrumEntry
+}
+
+# Convert a parsed event (e.g. the OrderedDict from json.loads) into an Event.
+# Lists of records become typed entries, legacy lists of plain strings are kept.
+def make_event(items):
+    if isinstance(items, Event):
+        return items
+    event = Event()
+    for key, value in (items.items() if hasattr(items, 'items') else items):
+        if isinstance(value, list):
+            cls = entryclasses.get(key, QuantityEntry)
+            value = [x if isinstance(x, cls) else cls(x) if isinstance(x, (dict, Entry)) else x for x in value]
+            if key == 'spectra':
+                for x in value:
+                    if isinstance(x, SpectrumEntry) and 'data' in x:
+                        x['data'] = SpectrumData.from_rows(x['data'])
+        event[key] = value
+    return event
+
+# Struct-of-arrays alternative to an event's list of PhotoEntry. The original
+# strings are kept for output, numeric tags are also parsed once into float
+# arrays (NaN where absent) and categorical tags are stored as integer codes.
+# Iterating or indexing still yields PhotoEntry rows, so code that expects the
+# list keeps working while derivations can use the arrays directly.
+class PhotoTable(object):
+    floattags = ('time', 'magnitude', 'e_magnitude', 'e_lower_magnitude', 'e_upper_magnitude', 'flux', 'e_flux',
+        'fluxdensity', 'e_fluxdensity')
+    codetags = ('u_time', 'band', 'system', 'telescope', 'instrument', 'source')
+
+    def __init__(self, rows = ()):
+        self.count = 0
+        self.orders = []
+        self.ordercodes = {}
+        self.order = array('i')
+        self.columns = OrderedDict()
+        self.floatcolumns = OrderedDict([(x, array('d')) for x in self.floattags])
+        self.codevalues = OrderedDict([(x, []) for x in self.codetags])
+        self.codelookup = OrderedDict([(x, {}) for x in self.codetags])
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if i < 0 or i >= self.count:
+            raise IndexError('Photometry row out of range')
+        return PhotoEntry([(x, self.value(x, i)) for x in self.orders[self.order[i]]])
+
+    def __setitem__(self, i, row):
+        if i < 0:
+            i += self.count
+        for key in row:
+            self.add_column(key)
+        self.order[i] = self.order_code(tuple(row.keys()))
+        for key in self.columns:
+            self.set_value(key, i, row[key] if key in row else None)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def value(self, key, i):
+        if key in self.codelookup:
+            return self.codevalues[key][self.columns[key][i]]
+        return self.columns[key][i]
+
+    def order_code(self, keys):
+        if keys not in self.ordercodes:
+            self.ordercodes[keys] = len(self.orders)
+            self.orders.append(keys)
+        return self.ordercodes[keys]
+
+    def add_column(self, key):
+        if key in self.columns:
+            return
+        if key in self.codelookup:
+            self.columns[key] = array('i', [self.code(key, None)]*self.count)
+        else:
+            self.columns[key] = [None]*self.count
+
+    def code(self, key, value):
+        lookup = self.codelookup[key]
+        if value not in lookup:
+            lookup[value] = len(self.codevalues[key])
+            self.codevalues[key].append(sys.intern(value) if isinstance(value, str) else value)
+        return lookup[value]
+
+    def parse_float(self, value):
+        try:
+            if isinstance(value, list):
+                return min([float(x) for x in value])
+            return float(value)
+        except (TypeError, ValueError):
+            return float('nan')
+
+    def set_value(self, key, i, value):
+        if key in self.codelookup:
+            self.columns[key][i] = self.code(key, value)
+        else:
+            self.columns[key][i] = value
+        if key in self.floatcolumns:
+            self.floatcolumns[key][i] = self.parse_float(value) if value is not None else float('nan')
+
+    def append(self, row):
+        for key in row:
+            self.add_column(key)
+        self.order.append(self.order_code(tuple(row.keys())))
+        for key in self.columns:
+            if key in self.codelookup:
+                self.columns[key].append(self.code(key, row[key] if key in row else None))
+            else:
+                self.columns[key].append(row[key] if key in row else None)
+        for key in self.floatcolumns:
+            self.floatcolumns[key].append(self.parse_float(row[key]) if key in row else float('nan'))
+        self.count += 1
+
+    # Boolean array of the rows that set a tag.
+    def has(self, key):
+        if key not in self.columns:
+            return numpy.zeros(self.count, dtype=bool)
+        if key in self.codelookup:
+            return self.codes(key) != self.code(key, None)
+        return numpy.array([x is not None for x in self.columns[key]], dtype=bool)
+
+    def floats(self, key):
+        return numpy.array(self.floatcolumns[key], dtype=float)
+
+    def codes(self, key):
+        if key not in self.columns:
+            return numpy.full(self.count, self.code(key, None), dtype=int)
+        return numpy.array(self.columns[key], dtype=int)
+
+    # Array of a categorical tag's values, with missing where absent.
+    def labels(self, key, missing = None):
+        codes = self.codes(key)
+        values = numpy.empty(len(self.codevalues[key]), dtype=object)
+        values[:] = [missing if x is None else x for x in self.codevalues[key]]
+        return values[codes]
+
+    def take(self, indices):
+        indices = [int(x) for x in indices]
+        self.order = array('i', [self.order[x] for x in indices])
+        for key in self.columns:
+            column = self.columns[key]
+            if key in self.codelookup:
+                self.columns[key] = array('i', [column[x] for x in indices])
+            else:
+                self.columns[key] = [column[x] for x in indices]
+        for key in self.floatcolumns:
+            column = self.floatcolumns[key]
+            self.floatcolumns[key] = array('d', [column[x] for x in indices])
+
+    def sort(self, key = None, reverse = False):
+        rows = list(self)
+        indices = sorted(range(self.count), key = (lambda x: key(rows[x])) if key else (lambda x: rows[x]),
+            reverse = reverse)
+        self.take(indices)
+
+# Column store for a spectrum's data. Each column (wavelength, flux and
+# optionally error) keeps its strings, at the precision they were given, in a
+# byte string array for output, plus a float array (NaN where unparseable) for
+# computation. Iterating still yields the [wavelength, flux, (error)] rows of
+# strings the JSON files hold.
+class SpectrumData(object):
+    def __init__(self, columns):
+        self.strings = []
+        # Like zip(), rows stop at the shortest column.
+        length = min([len(x) for x in columns]) if columns else 0
+        for column in columns:
+            column = list(column[:length])
+            try:
+                self.strings.append(numpy.array(column, dtype='S'))
+            except UnicodeEncodeError:
+                self.strings.append(numpy.array(column, dtype='U'))
+        self.values = numpy.empty((len(self.strings), length))
+        for i, column in enumerate(self.strings):
+            try:
+                self.values[i] = column.astype(float)
+            except ValueError:
+                self.values[i] = [self.parse_float(x) for x in column.tolist()]
+
+    # Rows that aren't a rectangular table of strings are kept as they are.
+    @classmethod
+    def from_rows(cls, rows):
+        if isinstance(rows, cls):
+            return rows
+        if (not isinstance(rows, list) or not rows or not all(isinstance(x, list) for x in rows) or
+            len(set(len(x) for x in rows)) != 1 or not all(isinstance(y, str) for x in rows for y in x)):
+            return rows
+        return cls(list(zip(*rows)))
+
+    def __len__(self):
+        return self.values.shape[1]
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def __getitem__(self, i):
+        return self.rows()[i]
+
+    def __eq__(self, other):
+        return self.rows() == list(other)
+
+    def parse_float(self, value):
+        try:
+            return float(value)
+        except ValueError:
+            return float('nan')
+
+    def floats(self, i):
+        return self.values[i]
+
+    def rows(self):
+        columns = [x.astype(str).tolist() for x in self.strings]
+        return [list(x) for x in zip(*columns)]
+
+# Passed as json.dumps(..., default = entry_json) when writing events.
+def entry_json(obj):
+    if isinstance(obj, Entry):
+        return OrderedDict(obj.items())
+    if isinstance(obj, PhotoTable):
+        return [OrderedDict(x.items()) for x in obj]
+    if isinstance(obj, SpectrumData):
+        return obj.rows()
+    raise TypeError(repr(obj) + ' is not JSON serializable')
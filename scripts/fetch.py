@@ -0,0 +1,142 @@
+import asyncio
+import functools
+import json
+import os
+import threading
+import urllib.parse
+import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+# One HTTP session for the whole run so that connections to each host are kept
+# open and reused, with the bytes, responses and time spent counted per task.
+# Files cached from a URL get a sidecar holding the ETag and Last-Modified
+# headers they were served with, which are sent back on the next request so that
+# an unchanged source answers 304 without a body.
+
+fetchsession = requests.Session()
+fetchsession.mount('http://', HTTPAdapter(pool_connections = 32, pool_maxsize = 8))
+fetchsession.mount('https://', HTTPAdapter(pool_connections = 32, pool_maxsize = 8))
+
+fetchstats = OrderedDict()
+fetchlock = threading.Lock()
+fetchtask = ''
+
+def set_fetch_task(task):
+    global fetchtask
+    fetchtask = task
+
+# Responses to the background fetchers arrive on their threads. Bodies are
+# counted by their Content-Length where given, and a streamed body without one
+# isn't read here just to be counted.
+def count_fetch(response, *args, **kwargs):
+    if 'Content-Length' in response.headers:
+        size = int(response.headers['Content-Length'])
+    else:
+        size = 0 if kwargs.get('stream') else len(response.content)
+    with fetchlock:
+        stats = fetchstats.setdefault(fetchtask, OrderedDict([('requests', 0), ('notmodified', 0), ('bytes', 0), ('seconds', 0.)]))
+        stats['requests'] += 1
+        if response.status_code == 304:
+            stats['notmodified'] += 1
+        stats['bytes'] += size
+        stats['seconds'] += response.elapsed.total_seconds()
+
+fetchsession.hooks['response'].append(count_fetch)
+
+def fetch_meta_path(filepath):
+    return filepath + '.meta'
+
+def load_fetch_meta(filepath, url):
+    path = fetch_meta_path(filepath)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'r') as f:
+        try:
+            meta = json.loads(f.read())
+        except ValueError:
+            return {}
+    return meta if meta.get('url') == url else {}
+
+def save_fetch_meta(filepath, url, response):
+    meta = OrderedDict([('url', url)])
+    if 'ETag' in response.headers:
+        meta['etag'] = response.headers['ETag']
+    if 'Last-Modified' in response.headers:
+        meta['lastmodified'] = response.headers['Last-Modified']
+    path = fetch_meta_path(filepath)
+    if len(meta) == 1:
+        if os.path.isfile(path):
+            os.remove(path)
+        return
+    with open(path, 'w') as f:
+        f.write(json.dumps(meta, indent='\t', separators=(',', ':')))
+
+# GET the URL, conditionally on the copy cached at filepath if there is one.
+def conditional_get(url, filepath = '', timeout = 120):
+    headers = {}
+    if filepath and os.path.isfile(filepath):
+        meta = load_fetch_meta(filepath, url)
+        if 'etag' in meta:
+            headers['If-None-Match'] = meta['etag']
+        if 'lastmodified' in meta:
+            headers['If-Modified-Since'] = meta['lastmodified']
+    return fetchsession.get(url, timeout = timeout, headers = headers)
+
+# Fetches batches of URLs in the background for tasks that download a page per
+# object. Everything a task will need is submitted up front and then collected
+# with get() in the order the task parses it, so parsing starts on the first
+# page while the rest are still downloading. Requests to each host are limited
+# to hostlimit at a time, failed requests are retried with a growing wait, and
+# each page is written to its cache file as it arrives.
+class AsyncFetcher():
+    def __init__(self, hostlimit = 4, timeout = 60, retries = 3):
+        self.hostlimit = hostlimit
+        self.timeout = timeout
+        self.retries = retries
+        self.semaphores = {}
+        self.futures = {}
+        self.executor = ThreadPoolExecutor(max_workers = 32)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target = self.loop.run_forever, daemon = True)
+        self.thread.start()
+
+    def submit(self, url, path = ''):
+        if url not in self.futures:
+            self.futures[url] = asyncio.run_coroutine_threadsafe(self.fetch(url, path), self.loop)
+
+    def get(self, url, path = ''):
+        self.submit(url, path)
+        return self.futures.pop(url).result()
+
+    async def fetch(self, url, path):
+        host = urllib.parse.urlsplit(url).netloc
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.hostlimit)
+        async with self.semaphores[host]:
+            for attempt in range(self.retries + 1):
+                try:
+                    response = await self.loop.run_in_executor(self.executor,
+                        functools.partial(fetchsession.get, url, timeout = self.timeout))
+                    response.raise_for_status()
+                    break
+                except requests.RequestException:
+                    if attempt == self.retries:
+                        raise
+                    await asyncio.sleep(2.**attempt)
+        text = response.content.decode('utf-8')
+        if path:
+            temppath = path + '.' + str(os.getpid())
+            with open(temppath, 'w') as f:
+                f.write(text)
+            os.replace(temppath, path)
+        return text
+
+    def close(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown(wait = False)
@@ -0,0 +1,33 @@
+import importlib.util
+from bs4 import BeautifulSoup, SoupStrainer
+
+# Pages scraped by the import tasks are parsed with lxml's C tree builder when it
+# is installed, which is much faster than html5lib on the long tables of
+# Rochester, CRTS and the like. Where a task reads only a small part of a page
+# (its links, a form or a few tables) only those elements are built; filtering
+# costs more than it saves on pages that are mostly the rows being read.
+# html5lib can still be asked for with --html-parser.
+
+htmlbuilder = 'lxml' if importlib.util.find_spec('lxml') else 'html5lib'
+
+def set_html_builder(builder):
+    global htmlbuilder
+    if builder not in ['lxml', 'html5lib', 'html.parser']:
+        raise(ValueError('Unknown HTML tree builder "' + builder + '".'))
+    htmlbuilder = builder
+
+# Parses html (a string, bytes or file), keeping only elements named in only
+# (and what is inside them) when given.
+def parse_html(html, only = None, attrs = {}, builder = None):
+    return BeautifulSoup(html, builder if builder else htmlbuilder, parse_only = SoupStrainer(only, attrs) if only else None)
+
+# Rows of the first tbody. html5lib adds a tbody around rows placed directly in a
+# table, lxml does not, so without one the first table's own rows are used.
+def tbody_rows(soup):
+    tbody = soup.find('tbody')
+    if tbody:
+        return tbody.findAll('tr')
+    table = soup.find('table')
+    if not table:
+        return []
+    return [x for x in table.findAll('tr') if not x.findParent(['thead', 'tfoot'])]
@@ -4,19 +4,19 @@ import csv
 import os
 import re
 import urllib
-import requests
 import calendar
 import sys
 import json
 import codecs
-import resource
 import argparse
-import gzip
 import io
-import shutil
 import statistics
 import warnings
 import subprocess
+import tempfile
+import traceback
+import multiprocessing
+import numpy
 from datetime import timedelta, datetime
 from glob import glob
 from hashlib import md5
@@ -25,22 +25,32 @@ from cdecimal import Decimal
 from astroquery.vizier import Vizier
 from astroquery.simbad import Simbad
 from astroquery.irsa_dust import IrsaDust
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
 from astropy import constants as const
 from astropy import units as un
 from astropy.io import fits
 from astropy.time import Time as astrotime
-from astropy.cosmology import Planck15 as cosmo, z_at_value
 from astropy.coordinates import SkyCoord as coord
 from collections import OrderedDict, Sequence
 from math import log10, floor, sqrt, isnan, ceil, hypot, pi
-from bs4 import BeautifulSoup, Tag, NavigableString
+from bs4 import Tag, NavigableString
 from string import ascii_letters
+from time import sleep
 from photometry import *
 from tq import *
 from digits import *
 from repos import *
 from events import *
+from dustmap import *
+from adsauthors import *
+from cosmology import *
+from fetch import *
+from viziercache import *
+from syncstate import *
+from wiserep import *
+from htmlparse import *
+from spectrumfile import *
+from runreport import *
 
 parser = argparse.ArgumentParser(description='Generate a catalog JSON file and plot HTML files from SNE data.')
 parser.add_argument('--update', '-u',       dest='update',      help='Only update catalog using live sources.',    default=False, action='store_true')
@@ -49,11 +59,34 @@ parser.add_argument('--refresh', '-r',      dest='refresh',     help='Ignore mos
 parser.add_argument('--full-refresh', '-f', dest='fullrefresh', help='Ignore all task caches.',                    default=False, action='store_true')
 parser.add_argument('--archived', '-a',     dest='archived',    help='Always use task caches.',                    default=False, action='store_true')
 parser.add_argument('--travis', '-tr',      dest='travis',      help='Run import script in test mode for Travis.', default=False, action='store_true')
-parser.add_argument('--refreshlist', '-rl', dest='refreshlist', help='Comma-delimited list of caches to clear.',   default='')
+parser.add_argument('--refreshlist', '-rl', dest='refreshlist', help='Comma-delimited list of caches (or VizieR catalog IDs) to clear.', default='')
+parser.add_argument('--columnar', '-c',     dest='columnar',    help='Store photometry in columns while importing.', default=False, action='store_true')
+parser.add_argument('--memory-budget', '-mb', dest='memorybudget', help='Megabytes of event JSON to keep loaded between tasks.', default=1024, type=float)
+parser.add_argument('--jobs', '-j',         dest='jobs',        help='Number of tasks (and event files when deriving) to run in parallel.', default=1, type=int)
+parser.add_argument('--shard-dir', '-sd',   dest='sharddir',    help='Keep each task\'s shard in this folder, reused while its inputs are unchanged.', default='')
+parser.add_argument('--rerun-shards', '-rs', dest='rerunshards', help='Comma-delimited list of tasks whose shards are rebuilt.', default='')
+parser.add_argument('--dust-maps', '-dm',   dest='dustmapdir',  help='Folder with the SFD dust maps, IRSA is queried without them.', default='../dust-maps')
+parser.add_argument('--ads-url', '-au',     dest='adsurl',      help='ADS abstract service to fetch bibcode authors from.', default=adsurl)
+parser.add_argument('--reconcile', '-rc',   dest='reconcile',   help='Walk paginated live sources in full when updating.', default=False, action='store_true')
+parser.add_argument('--html-parser', '-hp', dest='htmlparser',  help='Tree builder for scraped pages (lxml, html5lib or html.parser).', default=htmlbuilder)
+parser.add_argument('--run-report', '-rr',  dest='runreport',   help='File to write the per-task performance report to (none if empty).', default='../run-report.json')
 args = parser.parse_args()
-
+set_html_builder(args.htmlparser)
+
+# With --jobs, tasks run in a pool of worker processes forked from this one, each
+# against an event store holding only the names and aliases of the events, and the
+# events each builds come back as a delta (a JSON line per event) that is merged
+# here in table order, their names being resolved again as it is. The worker of a
+# task is started once the tasks listed in its "after" are merged, so that it sees
+# the events they added. Tasks marked inprocess look at more of the events than
+# their names (or work on the event files themselves), so they run in this process
+# once all earlier tasks are in. Globals a task sets for later use are listed in its
+# exports, and have to be JSON. With --shard-dir the delta of each task (or for an
+# importing task run here, the calls it made to add to the events) is kept as a
+# shard, which later runs reuse while its fingerprint still matches, unless the
+# task is listed in --rerun-shards.
 tasks = OrderedDict([
-    ("deleteoldevents", {"nicename":"Deleting old events",          "update": False}),
+    ("deleteoldevents", {"nicename":"Deleting old events",          "update": False, "inprocess": True}),
     ("internal",        {"nicename":"%pre metadata and photometry", "update": False}),
     ("radio",           {"nicename":"%pre radio data",              "update": False}),
     ("xray",            {"nicename":"%pre X-ray data",              "update": False}),
@@ -72,11 +105,11 @@ tasks = OrderedDict([
     ("itep",            {"nicename":"%pre ITEP",                    "update": False}),
     ("asiago",          {"nicename":"%pre Asiago metadata",         "update": False}),
     ("tns",             {"nicename":"%pre TNS metadata",            "update": True,  "archived": True}),
-    ("rochester",       {"nicename":"%pre Latest Supernovae",       "update": True,  "archived": False}),
-    ("lennarz",         {"nicename":"%pre Lennarz",                 "update": False}),
+    ("rochester",       {"nicename":"%pre Latest Supernovae",       "update": True,  "archived": False, "inprocess": True}),
+    ("lennarz",         {"nicename":"%pre Lennarz",                 "update": False, "inprocess": True}),
     ("fermi",           {"nicename":"%pre Fermi",                   "update": False}),
     ("gaia",            {"nicename":"%pre GAIA",                    "update": True,  "archived": False}),
-    ("ogle",            {"nicename":"%pre OGLE",                    "update": True,  "archived": False}),
+    ("ogle",            {"nicename":"%pre OGLE",                    "update": True,  "archived": False, "inprocess": True}),
     ("snls",            {"nicename":"%pre SNLS",                    "update": False}),
     ("psthreepi",       {"nicename":"%pre Pan-STARRS 3π",           "update": True,  "archived": False}),
     ("psmds",           {"nicename":"%pre Pan-STARRS MDS",          "update": False}),
@@ -84,7 +117,7 @@ tasks = OrderedDict([
     ("grb",             {"nicename":"%pre GRB catalog",             "update": True,  "archived": False}),
     ("crts",            {"nicename":"%pre CRTS",                    "update": True,  "archived": False}),
     ("snhunt",          {"nicename":"%pre SNhunt",                  "update": True,  "archived": False}),
-    ("nedd",            {"nicename":"%pre NED-D",                   "update": False}),
+    ("nedd",            {"nicename":"%pre NED-D",                   "update": False, "exports": ["nedddict"]}),
     ("cpcs",            {"nicename":"%pre CPCS",                    "update": True,  "archived": False}),
     ("ptf",             {"nicename":"%pre PTF",                     "update": False, "archived": False}),
     ("des",             {"nicename":"%pre DES",                     "update": False, "archived": False}),
@@ -98,10 +131,70 @@ tasks = OrderedDict([
     ("ucbspectra",      {"nicename":"%pre UCB spectra",             "update": True,  "archived": True}),
     ("suspectspectra",  {"nicename":"%pre SUSPECT spectra",         "update": False}),
     ("snfspectra",      {"nicename":"%pre SNH spectra",             "update": False}),
-    ("superfitspectra", {"nicename":"%pre Superfit spectra",        "update": False}),
-    ("mergeduplicates", {"nicename":"Merging duplicates",           "update": False}),
-    ("setprefnames",    {"nicename":"Setting preferred names",      "update": False}),
-    ("writeevents",     {"nicename":"Writing events",               "update": True })
+    ("superfitspectra", {"nicename":"%pre Superfit spectra",        "update": False, "inprocess": True}),
+    ("mergeduplicates", {"nicename":"Merging duplicates",           "update": False, "inprocess": True}),
+    ("setprefnames",    {"nicename":"Setting preferred names",      "update": False, "inprocess": True}),
+    ("writeevents",     {"nicename":"Writing events",               "update": True,  "inprocess": True})
+])
+# Tasks that go by what the tasks before them added (rather than only resolving names, which the merge
+# does again) come after all of them.
+for task in ['rochester', 'lennarz', 'ogle', 'cpcs', 'superfitspectra', 'mergeduplicates', 'setprefnames', 'writeevents']:
+    if task in tasks:
+        tasks[task]['after'] = list(tasks)[:list(tasks).index(task)]
+
+# The local files and folders each task reads, which the fingerprint of its shard covers.
+externaldir = '../sne-external/'
+spectradir = '../sne-external-spectra/'
+taskinputs = OrderedDict([
+    ("internal",        ['../sne-internal']),
+    ("radio",           ['../sne-external-radio']),
+    ("xray",            ['../sne-external-xray']),
+    ("vizier",          [externaldir + 'II_189_refs.csv', vizierdir]),
+    ("donations",       [externaldir + x for x in ['Maggi-04-11-16', 'Nicholl-04-01-16', 'brown-05-14-16',
+                                                   'galbany-04-18-16', 'nicholl-05-03-16']]),
+    ("pessto-dr1",      [externaldir + 'PESSTO_MPHOT.csv']),
+    ("scp",             [externaldir + 'SCP09.csv']),
+    ("ascii",           [externaldir + x for x in ['2006ApJ...645..841N-table3.csv', 'SNII_anderson2014', 'J_A+A_415_863-1',
+                                                   '2015MNRAS.449..451W.dat', '2016MNRAS.459.1039T.tsv', '2015ApJ...804...28G.tsv',
+                                                   '2016ApJ...819...35A.tsv', '2014ApJ...784..105W.tsv', '2012MNRAS.425.1007B.tsv',
+                                                   'apj490105t2_ascii.txt', '2005ApJ...634.1190H.tsv', '2014MNRAS.444.2133S.tsv',
+                                                   '2009MNRAS.398.1041B.tsv', '2010arXiv1007.0011P.tsv', '2000ApJ...533..320G.tsv']]),
+    ("cccp",            [externaldir + 'CCCP']),
+    ("suspect",         [externaldir + 'SUSPECT', externaldir + 'suspectreferences.csv']),
+    ("cfa",             [externaldir + x for x in ['cfa-input', 'bianco-2014-standard.dat', 'hicken-2012-standard.dat']]),
+    ("ucb",             [externaldir + 'SNDB', spectradir + 'UCB/allpub.json']),
+    ("sdss",            [externaldir + 'SDSS']),
+    ("csp",             [externaldir + 'CSP']),
+    ("itep",            [externaldir + 'itep-lc-cat-28dec2015.txt', externaldir + 'itep-refs.txt']),
+    ("asiago",          [externaldir + 'asiago-cat.php']),
+    ("tns",             [externaldir + 'TNS']),
+    ("rochester",       [externaldir + 'rochester', externaldir + 'latestsne.dat']),
+    ("lennarz",         [vizierdir]),
+    ("fermi",           [externaldir + '1SC_catalog_v01.asc']),
+    ("gaia",            [externaldir + 'GAIA']),
+    ("ogle",            [externaldir + 'OGLE', externaldir + 'OGLE-*']),
+    ("snls",            [externaldir + 'SNLS-ugriz.dat']),
+    ("psthreepi",       [externaldir + '3pi']),
+    ("psmds",           [externaldir + 'MDS/apj506838t1_mrt.txt']),
+    ("psst",            [externaldir + x for x in ['2016arXiv160204156S-tab1.tsv', '2016arXiv160204156S-tab2.tsv', '1606.04795.tsv']]),
+    ("grb",             [externaldir + 'GRB-catalog']),
+    ("crts",            [externaldir + x for x in ['CRTS', 'catalina', 'MLS', 'SSS']]),
+    ("snhunt",          [externaldir + 'SNhunt']),
+    ("nedd",            [externaldir + 'NED26.05.1-D-12.1.0-20160501.csv']),
+    ("cpcs",            [externaldir + 'CPCS']),
+    ("ptf",             [externaldir + 'PTF']),
+    ("des",             [externaldir + 'DES']),
+    ("asassn",          [externaldir + 'ASASSN']),
+    ("snf",             [externaldir + 'SNF']),
+    ("asiagospectra",   [spectradir + 'Asiago']),
+    ("wiserepspectra",  [wiserepdir]),
+    ("cfaspectra",      [spectradir + 'CfA_SNIa', spectradir + 'CfA_SNIbc', spectradir + 'CfA_Extra']),
+    ("snlsspectra",     [spectradir + 'SNLS', vizierdir]),
+    ("cspspectra",      [spectradir + 'CSP']),
+    ("ucbspectra",      [spectradir + 'UCB']),
+    ("suspectspectra",  [spectradir + 'Suspect']),
+    ("snfspectra",      [spectradir + 'SNFactory']),
+    ("superfitspectra", [spectradir + 'superfit'])
 ])
 
 oscbibcode = '2016arXiv160501054G'
@@ -122,6 +215,22 @@ currenttask = ''
 
 eventnames = []
 events = OrderedDict()
+# Maps each (name_clean'd) alias to the names of the loaded events that list it.
+aliasindex = {}
+# Per-event duplicate lookup tables for photometry, see add_photometry.
+photoindex = {}
+# Per-event lookup tables for the entries of each event's sources list, see add_source.
+sourceindex = {}
+# Write-behind journal: events changed since they were last written, the files
+# they were last written to, their sizes as JSON and their order of last use.
+dirtyevents = set()
+eventpaths = {}
+eventsizes = {}
+eventuse = OrderedDict()
+# Git commands held back by final-pass workers for the main process to run.
+gitqueue = None
+# Bibcodes of the sources added this run, their authors are fetched together before the final pass.
+sourcebibcodes = set()
 
 warnings.filterwarnings('ignore', r'Warning: converting a masked element to nan.')
 
@@ -142,6 +251,15 @@ repbetterquantity = {
     'maxdate'
 }
 
+# Tags compared when checking for duplicate photometry. Numbers are compared by
+# value, "list" tags may also hold arrays which are compared element by element.
+photostrtags = ['band', 'u_time', 'u_flux', 'u_fluxdensity', 'u_frequency', 'u_energy', 'system']
+photonumtags = ['magnitude', 'flux', 'unabsorbedflux', 'fluxdensity', 'counts', 'frequency', 'photonindex',
+    'e_magnitude', 'e_lower_time', 'e_upper_time', 'e_lower_magnitude', 'e_upper_magnitude', 'e_flux',
+    'e_unabsorbedflux', 'e_fluxdensity', 'e_counts']
+photolisttags = ['time', 'energy']
+phototags = photostrtags + photolisttags + photonumtags
+
 maxbands = [
     ['B', 'b', 'g'], # B-like bands first
     ['V', 'G'],      # if not, V-like bands
@@ -154,7 +272,11 @@ def get_schema():
     return 'https://github.com/astrocatalogs/sne/blob/' + gitrevhash + '/OSC-JSON-format.md'
 
 def uniq_cdl(values):
-    return ','.join(sorted(list(set(values))))
+    cdl = ','.join(sorted(list(set(values))))
+    # The main process sorts these again once it has mapped a task worker's source aliases to its own.
+    if taskworker and ',' in cdl:
+        sortedsources.add(cdl)
+    return cdl
 
 def rep_chars(string, chars, rep = ''):
     for c in chars:
@@ -516,6 +638,46 @@ def get_aliases(name, includename = True):
         return [name]
     return []
 
+def index_alias(name, alias):
+    names = aliasindex.setdefault(alias, [])
+    if name not in names:
+        names.append(name)
+
+def index_aliases(name):
+    if 'alias' in events[name]:
+        for alias in events[name]['alias']:
+            index_alias(name, alias['value'])
+
+def unindex_aliases(name):
+    if 'alias' in events[name]:
+        for alias in events[name]['alias']:
+            names = aliasindex.get(alias['value'], [])
+            if name in names:
+                names.remove(name)
+            if not names:
+                aliasindex.pop(alias['value'], None)
+
+def unindex_event(name):
+    unindex_aliases(name)
+    photoindex.pop(name, None)
+    sourceindex.pop(name, None)
+
+def reindex_aliases():
+    aliasindex.clear()
+    for name in events:
+        index_aliases(name)
+
+def alias_matches(alias):
+    # Entries for events that have since been dropped or renamed are pruned lazily here.
+    names = aliasindex.get(alias, [])
+    matches = [x for x in names if x in events and alias in get_aliases(x)]
+    if len(matches) != len(names):
+        if matches:
+            aliasindex[alias] = matches
+        else:
+            del(aliasindex[alias])
+    return matches
+
 def new_event(name, load = True, delete = True, loadifempty = True, refname = '',
     reference = '', url = '', bibcode = '', secondary = '', acknowledgment = ''):
     oldname = name
@@ -526,35 +688,39 @@ def new_event(name, load = True, delete = True, loadifempty = True, refname = ''
     return (name, source)
 
 def add_event(name, load = True, delete = True, loadifempty = True):
-    if loadifempty and args.update and not len(events):
+    if loadifempty and args.update and not len(events) and not taskworker:
         load_stubs()
 
     newname = name_clean(name)
     if newname not in events or 'stub' in events[newname]:
         match = ''
         if newname not in events:
-            for event in events:
-                aliases = get_aliases(event)
-                if (len(aliases) > 1 and newname in aliases and
-                    ('distinctfrom' not in events[event] or newname not in events[event]['distinctfrom'])):
+            for event in alias_matches(newname):
+                if ('distinctfrom' not in events[event] or
+                    newname not in [x['value'] for x in events[event]['distinctfrom']]):
                     match = event
                     break
             if match:
                 newname = match
 
-        if load:
+        # Task workers don't read event files: the events they only know as stubs are started
+        # afresh, for the main process to merge into the full ones.
+        if load and not taskworker:
             loadedname = load_event_from_file(name = newname, delete = delete)
             if loadedname:
                 if 'stub' in events[loadedname]:
                     raise(ValueError('Failed to find event file for stubbed event'))
                 return loadedname
 
-        if match:
+        if match and not (taskworker and 'stub' in events[match]):
             return match
+        newname = match or newname
 
-        events[newname] = OrderedDict()
+        events[newname] = Event()
         events[newname]['schema'] = get_schema()
         events[newname]['name'] = newname
+        mark_dirty(newname)
+        count_task('created')
         if args.verbose and 'stub' not in events[newname]:
             tprint('Added new event ' + newname)
         return newname
@@ -564,18 +730,13 @@ def add_event(name, load = True, delete = True, loadifempty = True):
 def event_exists(name):
     if name in events:
         return True
-    for ev in events:
-        if name in get_aliases(ev):
-            return True
-    return False
+    return bool(alias_matches(name))
 
 def get_preferred_name(name):
     if name not in events:
-        matches = []
-        for event in events:
-            aliases = get_aliases(event)
-            if len(aliases) > 1 and name in aliases:
-                return event
+        matches = alias_matches(name)
+        if matches:
+            return matches[0]
         return name
     else:
         return name
@@ -591,8 +752,27 @@ def snname(string):
 
     return newstring
 
+def source_registry(name):
+    sources = events[name]['sources'] if 'sources' in events[name] else None
+    if (name not in sourceindex or sourceindex[name]['sources'] is not sources or
+        sourceindex[name]['count'] != (len(sources) if sources else 0)):
+        sourceindex[name] = {'sources': sources, 'count': 0, 'names': {}, 'bibcodes': {}, 'aliases': {}}
+        for source in (sources or []):
+            register_source(name, source)
+    return sourceindex[name]
+
+def register_source(name, source):
+    # Earlier entries win, as they did when the sources list was searched in order.
+    registry = sourceindex[name]
+    registry['count'] += 1
+    if 'name' in source:
+        registry['names'].setdefault(source['name'], source['alias'])
+    if 'bibcode' in source:
+        registry['bibcodes'].setdefault(source['bibcode'], source['alias'])
+    registry['aliases'].setdefault(source['alias'], source)
+
 def add_source(name, refname = '', reference = '', url = '', bibcode = '', secondary = '', acknowledgment = ''):
-    nsources = len(events[name]['sources']) if 'sources' in events[name] else 0
+    registry = source_registry(name)
     if not refname:
         if not bibcode:
             raise(ValueError('Bibcode must be specified if name is not.'))
@@ -628,10 +808,9 @@ def add_source(name, refname = '', reference = '', url = '', bibcode = '', secon
             refname = rep
             break
 
-    if 'sources' not in events[name] or (refname not in [x['name'] for x in events[name]['sources']] and
-        (not bibcode or bibcode not in [x['bibcode'] if 'bibcode' in x else '' for x in events[name]['sources']])):
-        source = str(nsources + 1)
-        newsource = OrderedDict()
+    if refname not in registry['names'] and (not bibcode or bibcode not in registry['bibcodes']):
+        source = str(registry['count'] + 1)
+        newsource = SourceEntry()
         newsource['name'] = refname
         if url:
             newsource['url'] = url
@@ -639,41 +818,75 @@ def add_source(name, refname = '', reference = '', url = '', bibcode = '', secon
             newsource['reference'] = reference
         if bibcode:
             newsource['bibcode'] = bibcode
+            sourcebibcodes.add(bibcode)
         if acknowledgment:
             newsource['acknowledgment'] = acknowledgment
         newsource['alias'] =  source
         if secondary:
             newsource['secondary'] = True
         events[name].setdefault('sources',[]).append(newsource)
+        registry['sources'] = events[name]['sources']
+        register_source(name, newsource)
+        mark_dirty(name)
     else:
-        if refname in [x['name'] for x in events[name]['sources']]:
-            source = [x['alias'] for x in events[name]['sources']][
-                [x['name'] for x in events[name]['sources']].index(refname)]
-        elif bibcode and bibcode in [x['bibcode'] if 'bibcode' in x else '' for x in events[name]['sources']]:
-            source = [x['alias'] for x in events[name]['sources']][
-                [x['bibcode'] if 'bibcode' in x else '' for x in events[name]['sources']].index(bibcode)]
+        if refname in registry['names']:
+            source = registry['names'][refname]
+        elif bibcode and bibcode in registry['bibcodes']:
+            source = registry['bibcodes'][bibcode]
         else:
             raise(ValueError("Couldn't find source that should exist!"))
     return source
 
 def get_source_by_alias(name, alias):
-    for source in events[name]['sources']:
-        if source['alias'] == alias:
-            return source
+    registry = source_registry(name)
+    if alias in registry['aliases']:
+        return registry['aliases'][alias]
     print(events[name])
     raise(ValueError('Source alias not found!'))
 
-def same_tag_str(photo, val, tag):
-    issame = ((tag not in photo and not val) or (tag in photo and not val) or (tag in photo and photo[tag] == val))
-    return issame
-
-def same_tag_num(photo, val, tag, canbelist = False):
-    issame = ((tag not in photo and not val) or (tag in photo and not val) or (tag in photo and
-        ((not canbelist and Decimal(photo[tag]) == Decimal(val)) or
-         (canbelist and
-            ((isinstance(photo[tag], str) and isinstance(val, str) and Decimal(photo[tag]) == Decimal(val)) or
-             (isinstance(photo[tag], list) and isinstance(val, list) and photo[tag] == val))))))
-    return issame
+def photo_tag_key(tag, val):
+    # Values that can never compare equal get a unique key.
+    if tag in photostrtags:
+        return val
+    if tag in photolisttags:
+        if isinstance(val, list):
+            return tuple(val)
+        if not isinstance(val, str):
+            return object()
+    try:
+        return Decimal(val)
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except:
+        return object()
+
+def photo_key(photo, mask):
+    if any([tag not in photo for tag in mask]):
+        return None
+    return ('host' in photo,) + tuple(photo_tag_key(tag, photo[tag]) for tag in mask)
+
+# A new point is a duplicate of an existing one if every tag it sets matches (tags
+# it leaves empty match anything), so the index keeps one set of keys per
+# combination of set tags ("mask") seen for the event.
+def photo_index(name, mask):
+    photometry = events[name]['photometry'] if 'photometry' in events[name] else None
+    if (name not in photoindex or photoindex[name]['photometry'] is not photometry or
+        photoindex[name]['count'] != (len(photometry) if photometry else 0)):
+        photoindex[name] = {'photometry': photometry, 'count': len(photometry) if photometry else 0, 'masks': {}}
+    masks = photoindex[name]['masks']
+    if mask not in masks:
+        masks[mask] = set(filter(None, [photo_key(photo, mask) for photo in (photometry or [])]))
+    return masks[mask]
+
+def index_photo(name, photo):
+    if name not in photoindex:
+        return
+    photoindex[name]['photometry'] = events[name]['photometry']
+    photoindex[name]['count'] += 1
+    for mask in photoindex[name]['masks']:
+        key = photo_key(photo, mask)
+        if key:
+            photoindex[name]['masks'][mask].add(key)
 
 def add_photometry(name, time = "", u_time = "MJD", e_time = "", telescope = "", instrument = "", band = "",
                    magnitude = "", e_magnitude = "", source = "", upperlimit = False, system = "", scorrected = "",
@@ -681,7 +894,8 @@ def add_photometry(name, time = "", u_time = "MJD", e_time = "", telescope = "",
                    flux = "", fluxdensity = "", e_flux = "", e_fluxdensity = "", u_flux = "", u_fluxdensity = "", frequency = "",
                    u_frequency = "", counts = "", e_counts = "", nhmw = "", photonindex = "", unabsorbedflux = "",
                    e_unabsorbedflux = "", energy = "", u_energy = "", e_lower_magnitude = "", e_upper_magnitude = "",
-                   e_lower_time = "", e_upper_time = ""):
+                   e_lower_time = "", e_upper_time = "", mcorrected = ""):
+    count_task('rows')
     if (not time and not host) or (not magnitude and not flux and not fluxdensity and not counts and not unabsorbedflux):
         warnings.warn('Time or brightness not specified when adding photometry, not adding.')
         tprint('Name : "' + name + '", Time: "' + time + '", Band: "' + band + '", AB magnitude: "' + magnitude + '"')
@@ -729,38 +943,19 @@ def add_photometry(name, time = "", u_time = "MJD", e_time = "", telescope = "",
         ssystem = bandmetaf(sband, 'system')
 
     # Look for duplicate data and don't add if duplicate
-    if 'photometry' in events[name]:
-        for photo in events[name]['photometry']:
-            if (same_tag_str(photo, sband, 'band') and
-                same_tag_str(photo, u_time, 'u_time') and
-                same_tag_num(photo, time, 'time', canbelist = True) and
-                same_tag_num(photo, magnitude, 'magnitude') and
-                (('host' not in photo and not host) or ('host' in photo and host)) and
-                same_tag_num(photo, flux, 'flux') and
-                same_tag_num(photo, unabsorbedflux, 'unabsorbedflux') and
-                same_tag_num(photo, fluxdensity, 'fluxdensity') and
-                same_tag_num(photo, counts, 'counts') and
-                same_tag_num(photo, energy, 'energy', canbelist = True) and
-                same_tag_num(photo, frequency, 'frequency') and
-                same_tag_num(photo, photonindex, 'photonindex') and
-                same_tag_num(photo, e_magnitude, 'e_magnitude') and
-                same_tag_num(photo, e_lower_time, 'e_lower_time') and
-                same_tag_num(photo, e_upper_time, 'e_upper_time') and
-                same_tag_num(photo, e_lower_magnitude, 'e_lower_magnitude') and
-                same_tag_num(photo, e_upper_magnitude, 'e_upper_magnitude') and
-                same_tag_num(photo, e_flux, 'e_flux') and
-                same_tag_num(photo, e_unabsorbedflux, 'e_unabsorbedflux') and
-                same_tag_num(photo, e_fluxdensity, 'e_fluxdensity') and
-                same_tag_num(photo, e_counts, 'e_counts') and
-                same_tag_str(photo, u_flux, 'u_flux') and
-                same_tag_str(photo, u_fluxdensity, 'u_fluxdensity') and
-                same_tag_str(photo, u_frequency, 'u_frequency') and
-                same_tag_str(photo, u_energy, 'u_energy') and
-                same_tag_str(photo, ssystem, 'system')
-                ):
-                return
+    newtags = {'band': sband, 'u_time': u_time, 'time': time, 'magnitude': magnitude, 'flux': flux,
+        'unabsorbedflux': unabsorbedflux, 'fluxdensity': fluxdensity, 'counts': counts, 'energy': energy,
+        'frequency': frequency, 'photonindex': photonindex, 'e_magnitude': e_magnitude, 'e_lower_time': e_lower_time,
+        'e_upper_time': e_upper_time, 'e_lower_magnitude': e_lower_magnitude, 'e_upper_magnitude': e_upper_magnitude,
+        'e_flux': e_flux, 'e_unabsorbedflux': e_unabsorbedflux, 'e_fluxdensity': e_fluxdensity, 'e_counts': e_counts,
+        'u_flux': u_flux, 'u_fluxdensity': u_fluxdensity, 'u_frequency': u_frequency, 'u_energy': u_energy,
+        'system': ssystem}
+    mask = tuple(tag for tag in phototags if newtags[tag])
+    newkey = (bool(host),) + tuple(photo_tag_key(tag, newtags[tag]) for tag in mask)
+    if newkey in photo_index(name, mask):
+        return
 
-    photoentry = OrderedDict()
+    photoentry = PhotoEntry()
     if time:
         photoentry['time'] = time if isinstance(time, list) or isinstance(time, str) else str(time)
     if e_time:
@@ -839,19 +1034,21 @@ def add_photometry(name, time = "", u_time = "MJD", e_time = "", telescope = "",
         photoentry['nhmw'] = nhmw
     if source:
         photoentry['source'] = source
+    if args.columnar and 'photometry' not in events[name]:
+        events[name]['photometry'] = PhotoTable()
     events[name].setdefault('photometry',[]).append(photoentry)
-
-def trim_str_arr(arr, length = 10):
-    return [str(round_sig(float(x), length)) if (len(x) > length and len(str(round_sig(float(x), length))) < len(x)) else x for x in arr]
+    index_photo(name, photoentry)
+    mark_dirty(name, 250)
 
 def add_spectrum(name, waveunit, fluxunit, wavelengths = "", fluxes = "", u_time = "", time = "", instrument = "",
     deredshifted = "", dereddened = "", errorunit = "", errors = "", source = "", snr = "", telescope = "",
     observer = "", reducer = "", survey = "", filename = "", observatory = "", data = ""):
+    count_task('rows')
 
     if is_erroneous(name, 'spectra', source):
         return
 
-    spectrumentry = OrderedDict()
+    spectrumentry = SpectrumEntry()
 
     if 'spectra' in events[name]:
         for si, spectrum in enumerate(events[name]['spectra']):
@@ -863,6 +1060,7 @@ def add_spectrum(name, waveunit, fluxunit, wavelengths = "", fluxes = "", u_time
                 if 'data' in spectrum:
                     return
                 del(events[name]['spectra'][si])
+                mark_dirty(name)
                 break
 
     if not waveunit:
@@ -906,9 +1104,9 @@ def add_spectrum(name, waveunit, fluxunit, wavelengths = "", fluxes = "", u_time
     spectrumentry['waveunit'] = waveunit
     spectrumentry['fluxunit'] = fluxunit
     if data:
-        spectrumentry['data'] = data
+        spectrumentry['data'] = SpectrumData.from_rows(data)
     else:
-        if errors and max([float(x) for x in errors]) > 0.:
+        if errors and numpy.any(str_floats(errors) > 0.):
             if not errorunit:
                 warnings.warn('No error unit specified, not adding spectrum.')
                 return
@@ -916,10 +1114,11 @@ def add_spectrum(name, waveunit, fluxunit, wavelengths = "", fluxes = "", u_time
             data = [trim_str_arr(wavelengths), trim_str_arr(fluxes), trim_str_arr(errors)]
         else:
             data = [trim_str_arr(wavelengths), trim_str_arr(fluxes)]
-        spectrumentry['data'] = [list(i) for i in zip(*data)]
+        spectrumentry['data'] = SpectrumData(data)
     if source:
         spectrumentry['source'] = source
     events[name].setdefault('spectra',[]).append(spectrumentry)
+    mark_dirty(name, 30*len(spectrumentry['data']) if spectrumentry['data'] else 100)
 
 def is_erroneous(name, field, sources):
     if 'errors' in events[name]:
@@ -935,6 +1134,7 @@ def is_erroneous(name, field, sources):
 
 def add_quantity(name, quantity, value, sources, forcereplacebetter = False, derived = '',
     lowerlimit = '', upperlimit = '', error = '', unit = '', kind = '', probability = '', extra = ''):
+    count_task('rows')
     if not quantity:
         raise(ValueError(name + "'s quantity must be specified for add_quantity."))
     if not sources:
@@ -1040,7 +1240,7 @@ def add_quantity(name, quantity, value, sources, forcereplacebetter = False, der
     if not sunit:
         sunit = unit
 
-    quantaentry = OrderedDict()
+    quantaentry = QuantityEntry()
     quantaentry['value'] = svalue
     if serror:
         quantaentry['error'] = serror
@@ -1098,6 +1298,9 @@ def add_quantity(name, quantity, value, sources, forcereplacebetter = False, der
         events[name][quantity] = newquantities
     else:
         events[name].setdefault(quantity,[]).append(quantaentry)
+    if quantity == 'alias':
+        index_alias(name, svalue)
+    mark_dirty(name)
 
 def load_cached_url(url, filepath, timeout = 120, write = True, failhard = False):
     filemd5 = ''
@@ -1109,17 +1312,23 @@ def load_cached_url(url, filepath, timeout = 120, write = True, failhard = False
                 filemd5 = md5(filetxt.encode('utf-8')).hexdigest()
 
     try:
-        session = requests.Session()
-        response = session.get(url, timeout = timeout)
+        response = conditional_get(url, filepath if filetxt else '', timeout = timeout)
         response.raise_for_status()
         for x in response.history:
             x.raise_for_status()
             if x.status_code == 500 or x.status_code == 307 or x.status_code == 404:
                 raise
+        if response.status_code == 304:
+            if args.update:
+                tprint('Skipping file in "' + currenttask + '," remote copy not modified.')
+                return False
+            return filetxt
         txt = response.text
         newmd5 = md5(txt.encode('utf-8')).hexdigest()
         if args.update and newmd5 == filemd5:
             tprint('Skipping file in "' + currenttask + '," local and remote copies identical [' + newmd5 + '].')
+            if write:
+                save_fetch_meta(filepath, url, response)
             return False
     except (KeyboardInterrupt, SystemExit):
         raise
@@ -1131,6 +1340,7 @@ def load_cached_url(url, filepath, timeout = 120, write = True, failhard = False
         if write:
             with codecs.open(filepath, 'w', encoding='utf8') as f:
                 f.write(txt if txt else filetxt)
+            save_fetch_meta(filepath, url, response)
     return txt
 
 def make_date_string(year, month = '', day = ''):
@@ -1144,9 +1354,53 @@ def make_date_string(year, month = '', day = ''):
 
     return datestring
 
+# Of the rows selected by mask, the index of the smallest value in floats,
+# settling ties between values that round to the same float exactly.
+def exact_argmin(mask, floats, strings):
+    indices = numpy.flatnonzero(mask & ~numpy.isnan(floats))
+    if not len(indices):
+        return None
+    minfloat = floats[indices].min()
+    ties = indices[floats[indices] == minfloat]
+    if len(ties) == 1:
+        return ties[0]
+    minvalues = [Decimal(strings[x]) if isinstance(strings[x], str) else Decimal(minfloat) for x in ties]
+    return ties[minvalues.index(min(minvalues))]
+
+def get_max_light_table(name):
+    photometry = events[name]['photometry']
+    mask = photometry.has('magnitude') & photometry.has('time') & photometry.has('u_time') & ~photometry.has('upperlimit')
+    if not mask.any():
+        return (None, None, None, None)
+
+    mags = photometry.floats('magnitude')
+    magstrs = photometry.columns['magnitude']
+    bands = photometry.labels('band', missing = '')
+    mlindex = None
+    for mb in maxbands:
+        bandmask = mask & numpy.array([x in mb for x in bands], dtype=bool)
+        if bandmask.any():
+            mlindex = exact_argmin(bandmask, mags, magstrs)
+            break
+
+    if mlindex is None:
+        mlindex = exact_argmin(mask, mags, magstrs)
+
+    mlmag = Decimal(magstrs[mlindex])
+    mlband = bands[mlindex]
+    mlsource = photometry.value('source', mlindex)
+
+    if photometry.value('u_time', mlindex) == 'MJD':
+        mlmjd = float(photometry.columns['time'][mlindex])
+        return (astrotime(mlmjd, format='mjd').datetime, mlmag, mlband, mlsource)
+    else:
+        return (None, mlmag, mlband, mlsource)
+
 def get_max_light(name):
     if 'photometry' not in events[name]:
         return (None, None, None, None)
+    if isinstance(events[name]['photometry'], PhotoTable):
+        return get_max_light_table(name)
 
     eventphoto = [(x['u_time'], x['time'], Decimal(x['magnitude']), x['band'] if 'band' in x else '', x['source']) for x in events[name]['photometry'] if
                   ('magnitude' in x and 'time' in x and 'u_time' in x and 'upperlimit' not in x)]
@@ -1178,6 +1432,15 @@ def get_first_light(name):
     if 'photometry' not in events[name]:
         return (None, None)
 
+    if isinstance(events[name]['photometry'], PhotoTable):
+        photometry = events[name]['photometry']
+        mask = ~photometry.has('upperlimit') & photometry.has('time') & (photometry.labels('u_time') == 'MJD')
+        flindex = exact_argmin(mask, photometry.floats('time'), photometry.columns['time'])
+        if flindex is None:
+            return (None, None)
+        flmjd = float(photometry.floats('time')[flindex])
+        return (astrotime(flmjd, format='mjd').datetime, photometry.value('source', flindex))
+
     eventphoto = [(Decimal(x['time']) if isinstance(x['time'], str) else Decimal(min(float(y) for y in x['time'])),
         x['source']) for x in events[name]['photometry'] if 'upperlimit' not in x
         and 'time' in x and 'u_time' in x and x['u_time'] == 'MJD']
@@ -1316,66 +1579,104 @@ def set_preferred_names():
                 tprint('Changing event name (' + name + ') to preferred name (' + newname + ').')
                 events[newname] = events[name]
                 events[newname]['name'] = newname
-                del(events[name])
+                drop_event(name)
+                index_aliases(newname)
+                mark_dirty(newname)
                 journal_events()
         if args.travis and ni > travislimit:
             break
 
 # Merge and remove duplicate events
+# Names an event is matched on when looking for duplicates, its aliases and the
+# AT designation of an SN name.
+def merge_names(name):
+    return set(get_aliases(name) + (['AT' + name[2:]] if (name.startswith('SN') and is_number(name[2:6])) else []))
+
+def merge_priority(names):
+    return len([x for x in names if len(x) >= 2 and x.startswith(('SN', 'AT'))])
+
+# Events sharing a name (directly or through other events) grouped with a
+# union-find over an index of who claimed each name first. Groups are listed
+# in order of their first name, their names sorted.
+def duplicate_groups(keys):
+    parents = {}
+    def find(name):
+        while parents[name] != name:
+            parents[name] = parents[parents[name]]
+            name = parents[name]
+        return name
+    owners = {}
+    for name in keys:
+        parents[name] = name
+        for alias in merge_names(name):
+            if alias not in owners:
+                owners[alias] = name
+                continue
+            root1 = find(owners[alias])
+            root2 = find(name)
+            if root1 != root2:
+                parents[root2] = root1
+    groups = OrderedDict()
+    for name in keys:
+        groups.setdefault(find(name), []).append(name)
+    return [x for x in groups.values() if len(x) > 1]
+
 def merge_duplicates():
     if not len(events):
         load_stubs()
     currenttask = 'Merging duplicate events'
     keys = list(sorted(list(events.keys())))
-    for n1, name1 in enumerate(tq(keys[:], currenttask)):
-        if name1 not in events:
-            continue
-        allnames1 = set(get_aliases(name1) + (['AT' + name1[2:]] if (name1.startswith('SN') and is_number(name1[2:6])) else []))
-        for name2 in keys[n1+1:]:
-            if name2 not in events or name1 == name2:
+    groups = duplicate_groups(keys)
+    if args.travis:
+        positions = dict((x, i) for i, x in enumerate(keys))
+        groups = [x for x in groups if positions[x[0]] <= travislimit + 1]
+    # Events are only compared with the others in their group, pairwise in name
+    # order, so that groups are merged just as a scan over all pairs would.
+    for group in tq(groups, currenttask):
+        for n1, name1 in enumerate(group[:]):
+            if name1 not in events:
                 continue
-            allnames2 = set(get_aliases(name2) + (['AT' + name2[2:]] if (name2.startswith('SN') and is_number(name2[2:6])) else []))
-            if bool(allnames1 & allnames2):
-                tprint('Found single event with multiple entries (' + name1 + ' and ' + name2 + '), merging.')
-                load1 = load_event_from_file(name1, delete = True)
-                load2 = load_event_from_file(name2, delete = True)
-                if load1 and load2:
-                    priority1 = 0
-                    priority2 = 0
-                    for an in list(allnames1):
-                        if len(an) >= 2 and an.startswith(('SN', 'AT')):
-                            priority1 = priority1 + 1
-                    for an in list(allnames2):
-                        if len(an) >= 2 and an.startswith(('SN', 'AT')):
-                            priority2 = priority2 + 1
-
-                    if priority1 > priority2:
-                        copy_to_event(name2, name1)
-                        keys.append(name1)
-                        del(events[name2])
+            allnames1 = merge_names(name1)
+            for name2 in group[n1+1:]:
+                if name2 not in events or name1 == name2:
+                    continue
+                allnames2 = merge_names(name2)
+                if bool(allnames1 & allnames2):
+                    tprint('Found single event with multiple entries (' + name1 + ' and ' + name2 + '), merging.')
+                    load1 = load_event_from_file(name1, delete = True)
+                    load2 = load_event_from_file(name2, delete = True)
+                    if load1 and load2:
+                        if merge_priority(allnames1) > merge_priority(allnames2):
+                            copy_to_event(name2, name1)
+                            group.append(name1)
+                            drop_event(name2)
+                        else:
+                            copy_to_event(name1, name2)
+                            group.append(name2)
+                            drop_event(name1)
                     else:
-                        copy_to_event(name1, name2)
-                        keys.append(name2)
-                        del(events[name1])
-                else:
-                    print ('Duplicate already deleted')
-                journal_events()
-        if args.travis and n1 > travislimit:
-            break
+                        print ('Duplicate already deleted')
+                    journal_events()
 
-def derive_and_sanitize():
-    biberrordict = {
-        "2012Sci..337..942D":"2012Sci...337..942D",
-        "2012MNRAS.420.1135":"2012MNRAS.420.1135S",
-        "2014MNRAS.438,368":"2014MNRAS.438..368T",
-        "2006ApJ...636...400Q":"2006ApJ...636..400Q",
-        "0609268":"2007AJ....133...58K",
-        "2004MNRAS.tmp..131P":"2004MNRAS.352..457P",
-        "2013MNRAS.tmp.1499F":"2013MNRAS.433.1312F",
-        "1991MNRAS.247P.410B":"1991A&A...247..410B",
-        "2011Sci.333..856S":"2011Sci...333..856S"
-    }
+biberrordict = {
+    "2012Sci..337..942D":"2012Sci...337..942D",
+    "2012MNRAS.420.1135":"2012MNRAS.420.1135S",
+    "2014MNRAS.438,368":"2014MNRAS.438..368T",
+    "2006ApJ...636...400Q":"2006ApJ...636..400Q",
+    "0609268":"2007AJ....133...58K",
+    "2004MNRAS.tmp..131P":"2004MNRAS.352..457P",
+    "2013MNRAS.tmp.1499F":"2013MNRAS.433.1312F",
+    "1991MNRAS.247P.410B":"1991A&A...247..410B",
+    "2011Sci.333..856S":"2011Sci...333..856S"
+}
+
+# Bibcodes as sources sometimes give them, quoted or mistyped.
+def clean_bibcode(bibcode):
+    if len(bibcode) != 19:
+        bibcode = urllib.parse.unquote(unescape(bibcode)).replace('A.A.', 'A&A')
+    return biberrordict.get(bibcode, bibcode)
 
+def derive_and_sanitize():
     # Calculate some columns based on imported data, sanitize some fields
     for name in events:
         aliases = get_aliases(name, includename = False)
@@ -1493,20 +1794,31 @@ def derive_and_sanitize():
         if ('ra' in events[name] and 'dec' in events[name] and 
             (not 'host' in events[name] or not any([x['value'] == 'Milky Way' for x in events[name]['host']]))):
             if name not in extinctionsdict:
+                # Look up the local dust maps if there are any, IRSA otherwise.
                 try:
-                    result = IrsaDust.get_query_table(events[name]['ra'][0]['value'] + " " + events[name]['dec'][0]['value'], section = 'ebv')
-                except (KeyboardInterrupt, SystemExit):
-                    raise
-                except:
-                    warnings.warn("Coordinate lookup for " + name + " failed in IRSA.")
+                    ra = sexagesimal_degrees(events[name]['ra'][0]['value'], hours = True)
+                    dec = sexagesimal_degrees(events[name]['dec'][0]['value'])
+                except ValueError:
+                    ra = None
+                if ra is not None and load_dust_maps(args.dustmapdir):
+                    extinctionsdict[name] = [round(float(sfd_ebv([ra], [dec])[0]), 4)]
                 else:
-                    ebv = result['ext SandF mean'][0]
-                    ebverr = result['ext SandF std'][0]
-                    extinctionsdict[name] = [ebv, ebverr]
+                    try:
+                        result = IrsaDust.get_query_table(events[name]['ra'][0]['value'] + " " + events[name]['dec'][0]['value'], section = 'ebv')
+                    except (KeyboardInterrupt, SystemExit):
+                        raise
+                    except:
+                        warnings.warn("Coordinate lookup for " + name + " failed in IRSA.")
+                    else:
+                        ebv = result['ext SandF mean'][0]
+                        ebverr = result['ext SandF std'][0]
+                        extinctionsdict[name] = [ebv, ebverr]
             if name in extinctionsdict:
                 sources = uniq_cdl([add_source(name, bibcode = oscbibcode, refname = oscname, url = oscurl, secondary = True), 
                     add_source(name, bibcode = '2011ApJ...737..103S')])
-                add_quantity(name, 'ebv', str(extinctionsdict[name][0]), sources, error = str(extinctionsdict[name][1]), derived = True)
+                # Values from the local maps have no error.
+                add_quantity(name, 'ebv', str(extinctionsdict[name][0]), sources,
+                    error = str(extinctionsdict[name][1]) if len(extinctionsdict[name]) > 1 else '', derived = True)
         if 'host' in events[name] and ('hostra' not in events[name] or 'hostdec' not in events[name]):
             for host in events[name]['host']:
                 alias = host['value']
@@ -1558,8 +1870,8 @@ def derive_and_sanitize():
                 if host['value'] in nedddict:
                     source = add_source(name, bibcode = '2015arXiv150201589P')
                     secondarysource = add_source(name, refname = reference, url = refurl, secondary = True)
-                    meddist = statistics.median(nedddict[host['value']])
-                    redshift = pretty_num(z_at_value(cosmo.comoving_distance, float(meddist) * un.Mpc), sig = get_sig_digits(str(meddist)))
+                    meddist = statistics.median([Decimal(x) for x in nedddict[host['value']]])
+                    redshift = pretty_num(float(cosmo_redshift(float(meddist))), sig = get_sig_digits(str(meddist)))
                     add_quantity(name, 'redshift', redshift, uniq_cdl([source,secondarysource]), kind = 'host', derived = True)
         if 'maxabsmag' not in events[name] and 'maxappmag' in events[name] and 'lumdist' in events[name]:
             # Find the "best" distance to use for this
@@ -1587,22 +1899,22 @@ def derive_and_sanitize():
                         ((bestz + 1.)**2. + 1.), sig = bestsig), sources, kind = prefkinds[bestkind], derived = True)
                 if bestz > 0.:
                     if 'lumdist' not in events[name]:
-                        dl = cosmo.luminosity_distance(bestz)
+                        dl = float(cosmo_luminosity_distance(bestz))
                         sources = [add_source(name, bibcode = oscbibcode, refname = oscname, url = oscurl, secondary = True),
                             add_source(name, bibcode = '2015arXiv150201589P')]
                         sources = uniq_cdl(sources + bestsrc.split(','))
-                        add_quantity(name, 'lumdist', pretty_num(dl.value, sig = bestsig), sources,
+                        add_quantity(name, 'lumdist', pretty_num(dl, sig = bestsig), sources,
                             kind = prefkinds[bestkind], derived = True)
                         if 'maxabsmag' not in events[name] and 'maxappmag' in events[name]:
                             source = add_source(name, bibcode = oscbibcode, refname = oscname, url = oscurl, secondary = True)
                             add_quantity(name, 'maxabsmag', pretty_num(float(events[name]['maxappmag'][0]['value']) -
-                                5.0*(log10(dl.to('pc').value) - 1.0), sig = bestsig), sources, derived = True)
+                                5.0*(log10(dl*1.0e6) - 1.0), sig = bestsig), sources, derived = True)
                     if 'comovingdist' not in events[name]:
-                        cd = cosmo.comoving_distance(bestz)
+                        cd = float(cosmo_comoving_distance(bestz))
                         sources = [add_source(name, bibcode = oscbibcode, refname = oscname, url = oscurl, secondary = True),
                             add_source(name, bibcode = '2015arXiv150201589P')]
                         sources = uniq_cdl(sources + bestsrc.split(','))
-                        add_quantity(name, 'comovingdist', pretty_num(cd.value, sig = bestsig), sources, derived = True)
+                        add_quantity(name, 'comovingdist', pretty_num(cd, sig = bestsig), sources, derived = True)
         if all([x in events[name] for x in ['ra', 'dec', 'hostra', 'hostdec']]):
             # For now just using first coordinates that appear in entry
             try:
@@ -1627,7 +1939,15 @@ def derive_and_sanitize():
                         pretty_num(float(events[name]['hostoffsetang'][0]['value']) / 3600. * (pi / 180.) *
                         float(events[name]['comovingdist'][0]['value']) * 1000. / (1.0 + float(events[name]['redshift'][0]['value'])),
                         sig = offsetsig), sources)
-        if 'photometry' in events[name]:
+        if 'photometry' in events[name] and isinstance(events[name]['photometry'], PhotoTable):
+            photometry = events[name]['photometry']
+            bands = photometry.labels('band', missing = '')
+            mags = photometry.floats('magnitude')
+            # Rows without a magnitude sort ahead of those with one at the same time and band.
+            photometry.take(numpy.lexsort((numpy.where(photometry.has('magnitude'), mags, -numpy.inf),
+                numpy.unique(bands, return_inverse=True)[1],
+                numpy.where(photometry.has('time'), photometry.floats('time'), 0.0))))
+        elif 'photometry' in events[name]:
             events[name]['photometry'].sort(key=lambda x: ((float(x['time']) if isinstance(x['time'], str) else
                 min([float(y) for y in x['time']])) if 'time' in x else 0.0,
                 x['band'] if 'band' in x else '', float(x['magnitude']) if 'magnitude' in x else ''))
@@ -1637,33 +1957,20 @@ def derive_and_sanitize():
             for source in events[name]['sources']:
                 if 'bibcode' in source:
                     #First sanitize the bibcode
-                    if len(source['bibcode']) != 19:
-                        source['bibcode'] = urllib.parse.unquote(unescape(source['bibcode'])).replace('A.A.', 'A&A')
-                    if source['bibcode'] in biberrordict:
-                        source['bibcode'] = biberrordict[source['bibcode']]
+                    source['bibcode'] = clean_bibcode(source['bibcode'])
 
                     if source['bibcode'] not in bibauthordict:
                         bibcode = source['bibcode']
-                        adsquery = ('http://adsabs.harvard.edu/cgi-bin/nph-abs_connect?db_key=ALL&version=1&bibcode=' +
-                                    urllib.parse.quote(bibcode) + '&data_type=Custom&format=%253m%20%25(y)')
-                        response = urllib.request.urlopen(adsquery)
-                        html = response.read().decode('utf-8')
-                        hsplit = html.split("\n")
-                        if len(hsplit) > 5:
-                            bibcodeauthor = hsplit[5]
-                        else:
-                            bibcodeauthor = ''
-
-                        if not bibcodeauthor:
-                            warnings.warn("Bibcode didn't return authors, not converting this bibcode.")
-
-                        bibauthordict[bibcode] = unescape(bibcodeauthor).strip()
+                        bibauthordict[bibcode] = query_bib_author(bibcode, args.adsurl)
+                        journal_bib_authors('../bibauthors.json', [(bibcode, bibauthordict[bibcode])])
 
             for source in events[name]['sources']:
                 if 'bibcode' in source and source['bibcode'] in bibauthordict and bibauthordict[source['bibcode']]:
                     source['reference'] = bibauthordict[source['bibcode']]
                     if 'name' not in source and source['bibcode']:
                         source['name'] = source['bibcode']
+            # Bibcodes and names were edited in place above.
+            sourceindex.pop(name, None)
         if 'redshift' in events[name]:
             events[name]['redshift'] = list(sorted(events[name]['redshift'], key=lambda key: frame_priority(key)))
         if 'velocity' in events[name]:
@@ -1671,7 +1978,7 @@ def derive_and_sanitize():
         if 'claimedtype' in events[name]:
             events[name]['claimedtype'] = list(sorted(events[name]['claimedtype'], key=lambda key: ct_priority(name, key)))
 
-        events[name] = OrderedDict(sorted(events[name].items(), key=lambda key: event_attr_priority(key[0])))
+        events[name] = Event(sorted(events[name].items(), key=lambda key: event_attr_priority(key[0])))
 
 
 def delete_old_event_files():
@@ -1680,9 +1987,9 @@ def delete_old_event_files():
     for f in files:
         os.remove(f)
 
-def write_all_events(empty = False, gz = False, bury = False):
+def write_all_events(empty = False, gz = False, bury = False, names = None):
     # Write it all out!
-    for name in events:
+    for name in (events if names is None else names):
         if 'stub' in events[name]:
             if not empty:
                 continue
@@ -1707,6 +2014,8 @@ def write_all_events(empty = False, gz = False, bury = False):
             nonsneprefixes = ('PNVJ', 'PNV J', 'OGLE-2013-NOVA', 'EV*', 'V*', "Nova")
             if name.startswith(nonsneprefixes):
                 tprint('Burying ' + name + ', non-SNe prefix.')
+                if name in eventpaths and os.path.isfile(eventpaths[name]):
+                    os.remove(eventpaths[name])
                 continue
             if 'claimedtype' in events[name]:
                 for ct in events[name]['claimedtype']:
@@ -1719,20 +2028,34 @@ def write_all_events(empty = False, gz = False, bury = False):
                     tprint('Burying ' + name + ' (' + ct['value'] + ').')
                     outdir = '../sne-boneyard'
 
-        jsonstring = json.dumps({name:events[name]}, indent='\t', separators=(',', ':'), ensure_ascii=False)
+        jsonstring = json.dumps({name:events[name]}, indent='\t', separators=(',', ':'), ensure_ascii=False,
+            default=entry_json)
 
         path = outdir + '/' + filename + '.json'
-        with codecs.open(path, 'w', encoding='utf8') as f:
-            f.write(jsonstring)
-
-        if gz:
-            if os.path.getsize(path) > 90000000:
-                if not args.travis:
-                    tprint('Compressing ' + name)
-                with open(path, 'rb') as f_in, gzip.open(path + '.gz', 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
-                os.remove(path)
-                os.system('cd ' + outdir + '; git rm ' + filename + '.json; git add -f ' + filename + '.json.gz; cd ' + '../scripts')
+        # Events that were read compressed are written compressed, and with gz large events are compressed too.
+        wasgz = name in eventpaths and eventpaths[name].endswith('.gz')
+        compress = wasgz or (gz and len(jsonstring) > 90000000)
+        if compress:
+            if not wasgz and not args.travis:
+                tprint('Compressing ' + name)
+            path += '.gz'
+        write_event_text(path, jsonstring)
+        count_task('written')
+
+        # The event may have moved to another year's repository since it was last written.
+        if name in eventpaths and eventpaths[name] != path and os.path.isfile(eventpaths[name]):
+            os.remove(eventpaths[name])
+        eventpaths[name] = path
+        eventsizes[name] = len(jsonstring)
+        update_stub_index(path, name, [x['value'] for x in events[name]['alias']] if 'alias' in events[name] else [], jsonstring)
+
+        if compress and not wasgz:
+            gitcommand = 'cd ' + outdir + '; git rm -q --cached --ignore-unmatch ' + filename + '.json; git add -f ' + filename + '.json.gz; cd ' + '../scripts'
+            # Workers of the final pass leave these to the main process so that only one touches the git index.
+            if gitqueue is None:
+                os.system(gitcommand)
+            else:
+                gitqueue.append(gitcommand)
 
 def null_field(obj, field):
     return obj[field] if field in obj else ''
@@ -1795,6 +2118,10 @@ def load_event_from_file(name = '', location = '', clean = False, delete = True)
     if not name and not location:
         raise ValueError('Either event name or location must be specified to load event')
 
+    # Events still resident from an earlier task are current, their files may not be.
+    if name and not location and name in events and 'stub' not in events[name]:
+        return name
+
     path = ''
     namepath = ''
     if location:
@@ -1803,9 +2130,9 @@ def load_event_from_file(name = '', location = '', clean = False, delete = True)
         indir = '../'
         for rep in repofolders:
             filename = get_event_filename(name)
-            newpath = indir + rep + '/' + filename + '.json'
-            if os.path.isfile(newpath):
-                namepath = newpath
+            for newpath in [indir + rep + '/' + filename + '.json', indir + rep + '/' + filename + '.json.gz']:
+                if os.path.isfile(newpath):
+                    namepath = newpath
 
     if not path and not namepath:
         return False
@@ -1813,35 +2140,44 @@ def load_event_from_file(name = '', location = '', clean = False, delete = True)
         newevent = ''
         if path or namepath:
             if name in events:
+                unindex_event(name)
                 del events[name]
 
-        if path:
-            with open(path, 'r') as f:
-                newevent = json.loads(f.read(), object_pairs_hook=OrderedDict)
-        elif namepath:
-            with open(namepath, 'r') as f:
-                newevent = json.loads(f.read(), object_pairs_hook=OrderedDict)
+        filetext = get_event_text(path if path else namepath)
+        newevent = json.loads(filetext, object_pairs_hook=OrderedDict)
 
         if newevent:
             if clean:
                 newevent = clean_event(newevent)
             name = next(reversed(newevent))
 
-            events.update(newevent)
+            if name in events:
+                unindex_event(name)
+            events[name] = make_event(newevent[name])
+            if args.columnar and 'photometry' in events[name]:
+                events[name]['photometry'] = PhotoTable(events[name]['photometry'])
+            index_aliases(name)
+            eventsizes[name] = len(filetext)
+            use_event(name)
 
             if args.verbose and not args.travis:
                 tprint('Loaded ' + name)
+            count_task('loaded')
 
+        # Rather than deleting the file now, remember it so that it is replaced (or removed, if the
+        # event is renamed or merged away) when the event is next written.
         if 'writeevents' in tasks and delete and namepath:
-            os.remove(namepath)
+            eventpaths[name] = namepath
+        elif path:
+            mark_dirty(name)
         return name
 
 def clean_event(dirtyevent):
     bibcodes = []
     name = next(reversed(dirtyevent))
 
-    # This is very hacky and is only necessary because we don't have a proper 'Event' object yet.
-    events['temp'] = dirtyevent[name]
+    # The add_* functions look events up by name, so the event is cleaned under a temporary name.
+    events['temp'] = make_event(dirtyevent[name])
 
     if 'schema' not in events['temp']:
         events['temp']['schema'] = get_schema()
@@ -1903,6 +2239,8 @@ def clean_event(dirtyevent):
                     events['temp'][key][qi]['source'] = source
 
     cleanevent = events['temp']
+    unindex_event('temp')
+    forget_event('temp')
     del (events['temp'])
     return OrderedDict([[name,cleanevent]])
 
@@ -1920,19 +2258,89 @@ def archived_task(task):
 def do_task(checktask, task, quiet = False):
     global currenttask
     dotask = has_task(task) and checktask == task
+    if dotask:
+        set_fetch_task(task)
+        start_task_report(task)
     if dotask and not quiet:
         currenttask = (tasks[task]['nicename'] if tasks[task]['nicename'] else task).replace('%pre', 'Updating' if args.update else 'Loading')
     return dotask
 
-def journal_events(clear = True):
-    if 'writeevents' in tasks:
-        write_all_events()
+# Sizes are those of the event's JSON when last read or written, plus a rough
+# estimate for whatever has been added since.
+def mark_dirty(name, size = 100):
+    dirtyevents.add(name)
+    eventsizes[name] = eventsizes.get(name, 0) + size
+    use_event(name)
+
+def use_event(name):
+    eventuse[name] = True
+    eventuse.move_to_end(name)
+
+def forget_event(name):
+    dirtyevents.discard(name)
+    eventsizes.pop(name, None)
+    eventuse.pop(name, None)
+
+# Remove an event that has been merged into or renamed to another, along with its file.
+def drop_event(name):
+    unindex_event(name)
+    if name in eventpaths:
+        if os.path.isfile(eventpaths[name]):
+            os.remove(eventpaths[name])
+        del(eventpaths[name])
+    forget_event(name)
+    del(events[name])
+
+def stub_event(name):
+    return Event([['name', events[name]['name']]] + ([['alias', events[name]['alias']]] if 'alias' in events[name] else []) + [['stub', True]])
+
+# Write out the events changed since the last journal, then reduce the least
+# recently used events to stubs until the rest fit in the memory budget.
+# Events stay loaded between journals, up to the memory budget. Changed events
+# are written when they are evicted and at the end of each task (flush).
+def journal_events(clear = True, flush = False):
+    if taskworker:
+        # A task worker's events go to the main process through its delta.
+        if clear or flush:
+            write_task_delta()
+        return
+    if 'writeevents' not in tasks:
+        # Nothing is written, so nothing can be kept safely either.
+        if clear:
+            clear_events()
+        return
+    if flush:
+        write_all_events(names = [x for x in events if x in dirtyevents and 'stub' not in events[x]])
+        dirtyevents.clear()
+        save_stub_index()
     if clear:
-        clear_events()
+        evict_events(args.memorybudget*1.e6)
+
+def evict_events(budget):
+    resident = [x for x in eventuse if x in events and 'stub' not in events[x]]
+    total = sum([eventsizes.get(x, 0) for x in resident])
+    evicted = []
+    for name in resident:
+        if total <= budget:
+            break
+        total -= eventsizes.get(name, 0)
+        evicted.append(name)
+    write_all_events(names = [x for x in evicted if x in dirtyevents])
+    for name in evicted:
+        unindex_event(name)
+        events[name] = stub_event(name)
+        index_aliases(name)
+        forget_event(name)
 
 def clear_events():
     global events
-    events = OrderedDict((k, OrderedDict([['name', events[k]['name']]] + ([['alias', events[k]['alias']]] if 'alias' in events[k] else []) + [['stub', True]])) for k in events)
+    events = OrderedDict((k, stub_event(k)) for k in events)
+    reindex_aliases()
+    photoindex.clear()
+    sourceindex.clear()
+    dirtyevents.clear()
+    eventsizes.clear()
+    eventuse.clear()
 
 def load_stubs():
     global currenttask
@@ -1940,27 +2348,290 @@ def load_stubs():
 
     files = repo_file_list()
 
-    #try:
-    #    namepath = '../names.min.json'
-    #    with open(namepath, 'r') as f:
-    #        names = json.loads(f.read(), object_pairs_hook=OrderedDict)
-    #    for fi in tq(files):
-    #        name = os.path.basename(os.path.splitext(fi)[0])
-    #        if name not in names:
-    #            name = name.replace("_", "/")
-    #        events[name] = OrderedDict(([['name', name], ['alias', [OrderedDict(([['value', x]])) for x in names[name]]], ['stub', True]]))
-    #except:
-    #    events = OrderedDict()
+    # Only files changed since the stub index was last written get parsed.
+    stubs = load_stub_index(files)
     for fi in tq(files, currenttask):
-        fname = fi
-        if '.gz' in fi:
-            fname = fi.replace('.gz', '')
-            with gzip.open(fi, 'rb') as f_in, open(fname, 'wb') as f_out:
-                shutil.copyfileobj(f_in, f_out)
-            os.remove(fi)
-        name = os.path.basename(os.path.splitext(fname)[0]).replace('.json', '')
-        name = add_event(name, delete = False, loadifempty = False)
-        events[name] = OrderedDict(([['name', events[name]['name']]] + ([['alias', events[name]['alias']]] if 'alias' in events[name] else []) + [['stub', True]]))
+        name = name_clean(os.path.basename(os.path.splitext(fi)[0]).replace('.json', ''))
+        # Files whose name already belongs to an event (directly or as an alias) add nothing.
+        if name in events or alias_matches(name):
+            continue
+        name = stubs[fi]['name']
+        if name in events:
+            continue
+        events[name] = Event([['name', name]] + ([['alias', [QuantityEntry([['value', x]]) for x in stubs[fi]['alias']]]]
+            if stubs[fi]['alias'] else []) + [['stub', True]])
+        index_aliases(name)
+
+# Task workers and the merging of their deltas in the main process.
+taskjobs = OrderedDict()
+reusedshards = set()
+taskdir = ''
+taskpool = None
+taskstubs = OrderedDict()
+taskworker = ''
+sortedsources = set()
+
+repofingerprint = ''
+
+def task_stubs():
+    return OrderedDict([(x, [y['value'] for y in events[x]['alias']] if 'alias' in events[x] else []) for x in events])
+
+def open_task_dir():
+    global taskdir, repofingerprint
+    if taskdir:
+        return
+    if args.sharddir:
+        taskdir = args.sharddir
+        os.makedirs(taskdir, exist_ok = True)
+    else:
+        taskdir = tempfile.mkdtemp(prefix = 'osc-tasks-')
+    # Workers never read the repositories, which are rewritten here as they run. They start from the
+    # names and aliases of the events as they stand now instead, which the pool is forked with.
+    if args.update and not len(events):
+        load_stubs()
+    if args.update and args.sharddir:
+        repofingerprint = md5(json.dumps([[x, stubindex[x]['mtime'], stubindex[x]['size']]
+            for x in sorted(stubindex)]).encode()).hexdigest()
+
+# A shard is only reused by a run that would build the same one: the same scripts and options, the
+# same input files (by size and modification time) and the same events to start from, which for a
+# worker are the names and aliases it is given and for a task run here are the shards of the tasks
+# before it (and in update mode the event files). Data fetched live isn't covered, the shards of
+# tasks that fetch are refreshed by listing them in --rerun-shards.
+shardargs = ['update', 'refresh', 'fullrefresh', 'archived', 'travis', 'refreshlist', 'columnar', 'reconcile', 'htmlparser']
+sharedinputs = ['../atels.json', '../cbets.json', '../iaucs.json']
+codefingerprint = ''
+
+def file_md5(path):
+    digest = md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def task_fingerprint(task, stubsdigest = ''):
+    global codefingerprint
+    if not codefingerprint:
+        codefingerprint = md5(''.join([file_md5(x) for x in sorted(glob('*.py'))]).encode()).hexdigest()
+    files = []
+    for path in sorted(set(sum([glob(x) for x in taskinputs.get(task, []) + sharedinputs], []))):
+        if os.path.isdir(path):
+            files.extend(sorted([os.path.join(x[0], y) for x in os.walk(path) for y in x[2]]))
+        else:
+            files.append(path)
+    stats = [[x, os.stat(x).st_size, os.stat(x).st_mtime_ns] for x in files]
+    if tasks[task].get('inprocess', False):
+        before = [file_md5(shard_path(x)) for x in tasks[task].get('after', []) if os.path.isfile(shard_path(x))]
+        start = [repofingerprint] + before
+    else:
+        start = [stubsdigest]
+    return md5(json.dumps([codefingerprint, [getattr(args, x) for x in shardargs], stats, start]).encode()).hexdigest()
+
+def shard_path(task):
+    return taskdir + '/' + task + ('.calls' if tasks[task].get('inprocess', False) else '.delta')
+
+def shard_fingerprint(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r', encoding='utf8') as f:
+        return json.loads(f.readline()).get('fingerprint')
+
+def reuse_shard(task, fingerprint):
+    if not args.sharddir or task in args.rerunshards.split(','):
+        return False
+    path = shard_path(task)
+    if shard_fingerprint(path) == fingerprint:
+        tprint('Reusing shard for ' + task)
+        reusedshards.add(task)
+        return True
+    if os.path.isfile(path):
+        tprint('Shard for ' + task + ' is out of date, rebuilding it')
+    return False
+
+# A task run here has a shard too, holding the calls it made to add to the events (those made by
+# others among them being left out), which are made again when the shard is reused.
+recordedcalls = ['add_event', 'add_source', 'add_quantity', 'add_photometry', 'add_spectrum', 'journal_events']
+
+def shard_json(value):
+    return value.item() if isinstance(value, numpy.generic) else str(value)
+
+def run_shard_task(task):
+    open_task_dir()
+    fingerprint = task_fingerprint(task)
+    path = shard_path(task)
+    if reuse_shard(task, fingerprint):
+        do_task(task, task)
+        with open(path, 'r', encoding='utf8') as f:
+            for line in f:
+                entry = json.loads(line, object_pairs_hook=OrderedDict)
+                if 'call' in entry:
+                    (name, callargs, callkwargs) = entry['call']
+                    globals()[name](*callargs, **callkwargs)
+        journal_events(clear = False, flush = True)
+        end_task_report()
+        return
+    originals = OrderedDict([(x, globals()[x]) for x in recordedcalls])
+    depth = [0]
+    with open(path + '.part', 'w', encoding='utf8') as calls:
+        calls.write(json.dumps({'task': task, 'fingerprint': fingerprint}) + '\n')
+        def recorded_call(name):
+            def call(*callargs, **callkwargs):
+                if not depth[0]:
+                    calls.write(json.dumps({'call': [name, callargs, callkwargs]}, separators=(',', ':'),
+                        ensure_ascii=False, default=shard_json) + '\n')
+                depth[0] += 1
+                try:
+                    return originals[name](*callargs, **callkwargs)
+                finally:
+                    depth[0] -= 1
+            return call
+        globals().update([(x, recorded_call(x)) for x in recordedcalls])
+        try:
+            import_task(task)
+        finally:
+            globals().update(originals)
+    os.replace(path + '.part', path)
+
+# Workers are started for the first task and every later one that doesn't wait for a task still to
+# be merged. The others are started when the loop reaches them, from the names as they stand then.
+def start_task_workers(first):
+    global taskpool, taskstubs
+    stubs = None
+    if taskpool is None:
+        open_task_dir()
+        taskstubs = task_stubs()
+        taskpool = multiprocessing.get_context('fork').Pool(max(args.jobs, 1))
+    else:
+        stubs = task_stubs()
+    stubsdigest = md5(json.dumps(taskstubs if stubs is None else stubs).encode()).hexdigest() if args.sharddir else ''
+    order = list(tasks)
+    for task in order[order.index(first):]:
+        if task in taskjobs or not has_task(task) or tasks[task].get('inprocess', False):
+            continue
+        if task != first and any([order.index(x) >= order.index(first) for x in tasks[task].get('after', []) if has_task(x)]):
+            continue
+        fingerprint = task_fingerprint(task, stubsdigest) if args.sharddir else ''
+        if reuse_shard(task, fingerprint):
+            taskjobs[task] = shard_path(task)
+        else:
+            taskjobs[task] = taskpool.apply_async(run_task_worker, (task, stubs, fingerprint))
+
+# Run by a worker of the pool, which may have run other tasks before: the event store is started again
+# from the names and aliases it was given (or those the pool was forked with).
+def run_task_worker(task, stubs = None, fingerprint = ''):
+    global events, taskworker, taskdelta
+    delta = taskdir + '/' + task + '.delta'
+    logpath = taskdir + '/' + task + '.log'
+    taskworker = task
+    events = OrderedDict()
+    clear_events()
+    for (name, aliases) in (taskstubs if stubs is None else stubs).items():
+        events[name] = Event([['name', name]] + ([['alias', [QuantityEntry([['value', x]]) for x in aliases]]]
+            if aliases else []) + [['stub', True]])
+        index_aliases(name)
+    fetchstats.clear()
+    sortedsources.clear()
+    taskdelta = open(delta + '.part', 'w', encoding='utf8')
+    taskdelta.write(json.dumps({'task': task, 'fingerprint': fingerprint}) + '\n')
+    (stdout, stderr) = (sys.stdout, sys.stderr)
+    with open(logpath, 'w') as log:
+        sys.stdout = sys.stderr = log
+        try:
+            import_task(task)
+        except:
+            traceback.print_exc()
+            raise(RuntimeError('Task ' + task + ' failed, see ' + logpath))
+        finally:
+            (sys.stdout, sys.stderr) = (stdout, stderr)
+    exports = OrderedDict([(x, globals()[x]) for x in tasks[task].get('exports', []) if x in globals()])
+    for (key, value) in [('exports', exports), ('fetchstats', fetchstats), ('runreport', runstats.get(task, {}))]:
+        taskdelta.write(json.dumps({key: value}, separators=(',', ':'), ensure_ascii=False) + '\n')
+    taskdelta.close()
+    os.replace(delta + '.part', delta)
+    os.remove(logpath)
+    return delta
+
+# Written by a task worker whenever it journals: its events as they stand, after which they are
+# reduced to stubs (an event added to again is started afresh and comes back in a later line).
+def write_task_delta():
+    if sortedsources:
+        taskdelta.write(json.dumps({'sorted': sorted(sortedsources)}) + '\n')
+        sortedsources.clear()
+    for name in [x for x in events if 'stub' not in events[x]]:
+        taskdelta.write(json.dumps({'event': {name: events[name]}}, separators=(',', ':'), ensure_ascii=False,
+            default=entry_json) + '\n')
+    clear_events()
+
+# An event from a worker's delta. One this process doesn't have yet is taken as the worker built it,
+# the entries of one it has are added to it with the worker's source aliases mapped to the ones here
+# (those the worker listed sorted are sorted again).
+def merge_task_event(name, event, size, sortedcdls):
+    newname = add_event(name)
+    if newname == name and set(events[newname].keys()) <= set(['schema', 'name']):
+        unindex_event(newname)
+        events[newname] = make_event(event)
+        if args.columnar and 'photometry' in events[newname]:
+            events[newname]['photometry'] = PhotoTable(events[newname]['photometry'])
+        index_aliases(newname)
+        sourcebibcodes.update([x['bibcode'] for x in events[newname].get('sources', []) if 'bibcode' in x])
+        mark_dirty(newname, size)
+        return
+    aliases = {}
+    for source in event.get('sources', []):
+        aliases[source['alias']] = add_source(newname, refname = source.get('name', ''), reference = source.get('reference', ''),
+            url = source.get('url', ''), bibcode = source.get('bibcode', ''), secondary = source.get('secondary', ''),
+            acknowledgment = source.get('acknowledgment', ''))
+    for key in event:
+        if key in ['schema', 'name', 'sources']:
+            continue
+        for item in event[key]:
+            sources = [aliases[x] for x in item['source'].split(',')]
+            sources = uniq_cdl(sources) if item['source'] in sortedcdls else ','.join(OrderedDict.fromkeys(sources))
+            fields = OrderedDict([(x, item[x]) for x in item if x != 'source'])
+            if key == 'photometry':
+                fields.setdefault('u_time', '')
+                add_photometry(newname, source = sources, **fields)
+            elif key == 'spectra':
+                # Only spectra given as columns keep their error unit, so those are given as columns again.
+                if 'errorunit' in fields:
+                    data = fields.pop('data')
+                    fields['wavelengths'] = [x[0] for x in data]
+                    fields['fluxes'] = [x[1] for x in data]
+                    if data and len(data[0]) > 2:
+                        fields['errors'] = [x[2] for x in data]
+                add_spectrum(newname, source = sources, **fields)
+            else:
+                add_quantity(newname, key, fields.pop('value'), sources, **fields)
+
+def merge_task_delta(task, delta):
+    rows = task_report(task)['rows']
+    report = None
+    sortedcdls = set()
+    with open(delta, 'r', encoding='utf8') as f:
+        for line in f:
+            entry = json.loads(line, object_pairs_hook=OrderedDict)
+            if 'task' in entry:
+                if entry['task'] != task:
+                    raise(ValueError('Shard ' + delta + ' was not written by task ' + task))
+            elif 'event' in entry:
+                name = next(iter(entry['event']))
+                merge_task_event(name, entry['event'][name], len(line), sortedcdls)
+            elif 'sorted' in entry:
+                sortedcdls.update(entry['sorted'])
+            elif 'exports' in entry:
+                globals().update(entry['exports'])
+            elif 'fetchstats' in entry:
+                # Downloads made by a reused shard's worker weren't made by this run.
+                if task not in reusedshards:
+                    fetchstats.update(entry['fetchstats'])
+            elif 'runreport' in entry:
+                report = entry['runreport']
+    # The rows are those the worker read, not the entries added again here. Events are counted here.
+    if report is not None and task not in reusedshards:
+        task_report(task)['rows'] = rows
+        merge_task_report(task, report, ['seconds', 'cpu', 'peakrss', 'rows', 'cachehits', 'cachemisses'])
+    if not args.sharddir:
+        os.remove(delta)
 
 path = '../atels.json'
 if os.path.isfile(path):
@@ -1981,7 +2652,10 @@ if os.path.isfile(path):
 else:
     iaucsdict = OrderedDict()
 
-for task in tasks:
+# The body of every task, run here or in a worker of the task pool.
+def import_task(task):
+    global currenttask, nedddict
+
     if do_task(task, 'deleteoldevents'):
         currenttask = 'Deleting old events'
         delete_old_event_files()
@@ -2094,10 +2768,10 @@ for task in tasks:
     # Import primary data sources from Vizier
     if do_task(task, 'vizier'):
         Vizier.ROW_LIMIT = -1
+        prefetch_vizier_tables(viziercatalogs, refresh = viziercatalogs if args.fullrefresh else args.refreshlist.split(','))
     
         # 2012ApJS..200...12H
-        result = Vizier.get_catalogs("J/ApJS/200/12/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJS/200/12/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         oldname = ''
         for row in tq(table, currenttask):
@@ -2114,8 +2788,7 @@ for task in tasks:
             add_quantity(name, 'dec', row['DEJ2000'], source)
     
         # 2012ApJ...746...85S
-        result = Vizier.get_catalogs("J/ApJ/746/85/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/746/85/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         oldname = ''
         for row in tq(table, currenttask):
@@ -2131,8 +2804,7 @@ for task in tasks:
             add_quantity(name, 'ra', row['RAJ2000'], source)
             add_quantity(name, 'dec', row['DEJ2000'], source)
     
-        result = Vizier.get_catalogs("J/ApJ/746/85/table2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/746/85/table2")
         table.convert_bytestring_to_unicode(python3_only=True)
         oldname = ''
         for row in tq(table, currenttask):
@@ -2152,8 +2824,7 @@ for task in tasks:
                 magnitude = magnitude, e_magnitude = e_magnitude, source = source)
     
         # 2004ApJ...602..571B
-        result = Vizier.get_catalogs("J/ApJ/602/571/table8")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/602/571/table8")
         table.convert_bytestring_to_unicode(python3_only=True)
         oldname = ''
         for row in tq(table, currenttask):
@@ -2179,8 +2850,7 @@ for task in tasks:
                 magnitude = magnitude, e_magnitude = e_magnitude, source = source)
         
         # 2014MNRAS.444.3258M
-        result = Vizier.get_catalogs("J/MNRAS/444/3258/SNe")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/444/3258/SNe")
         table.convert_bytestring_to_unicode(python3_only=True)
         oldname = ''
         for row in tq(table, currenttask):
@@ -2195,8 +2865,7 @@ for task in tasks:
         journal_events()
     
         # 2014MNRAS.438.1391P
-        result = Vizier.get_catalogs("J/MNRAS/438/1391/table2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/438/1391/table2")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             name = row['SN']
@@ -2207,8 +2876,7 @@ for task in tasks:
         journal_events()
     
         # 2012ApJ...749...18B
-        result = Vizier.get_catalogs("J/ApJ/749/18/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/749/18/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             name = row['Name'].replace(' ','')
@@ -2224,8 +2892,7 @@ for task in tasks:
         journal_events()
     
         # 2010A&A...523A...7G
-        result = Vizier.get_catalogs("J/A+A/523/A7/table9")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/A+A/523/A7/table9")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             name = 'SNLS-' + row['SNLS']
@@ -2241,8 +2908,7 @@ for task in tasks:
         journal_events()
     
         # 2004A&A...415..863G
-        result = Vizier.get_catalogs("J/A+A/415/863/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/A+A/415/863/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             name = 'SN' + row['SN']
@@ -2260,8 +2926,7 @@ for task in tasks:
         journal_events()
     
         # 2008AJ....136.2306H
-        result = Vizier.get_catalogs("J/AJ/136/2306/sources")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/AJ/136/2306/sources")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             name = 'SDSS-II SN ' + str(row['SNID'])
@@ -2271,8 +2936,7 @@ for task in tasks:
             add_quantity(name, 'dec', row['DEJ2000'], source)
     
         # 2010ApJ...708..661D
-        result = Vizier.get_catalogs("J/ApJ/708/661/sn")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/708/661/sn")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             name = row['SN']
@@ -2286,8 +2950,7 @@ for task in tasks:
             add_quantity(name, 'ra', row['RAJ2000'], source)
             add_quantity(name, 'dec', row['DEJ2000'], source)
     
-        result = Vizier.get_catalogs("J/ApJ/708/661/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/708/661/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             if row['f_SN'] == 'a':
@@ -2299,8 +2962,7 @@ for task in tasks:
         journal_events()
     
         # 2014ApJ...795...44R
-        result = Vizier.get_catalogs("J/ApJ/795/44/ps1_snIa")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/795/44/ps1_snIa")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             name = row['SN']
@@ -2312,8 +2974,7 @@ for task in tasks:
             add_quantity(name, 'dec', row['DEJ2000'], source)
             add_quantity(name, 'claimedtype', 'Ia', source)
     
-        result = Vizier.get_catalogs("J/ApJ/795/44/table6")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/795/44/table6")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             name = row['SN']
@@ -2324,8 +2985,7 @@ for task in tasks:
         journal_events()
     
         # 1990A&AS...82..145C
-        result = Vizier.get_catalogs("II/189/mag")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("II/189/mag")
         table.convert_bytestring_to_unicode(python3_only=True)
     
         with open('../sne-external/II_189_refs.csv') as f:
@@ -2358,8 +3018,7 @@ for task in tasks:
         journal_events()
     
         # 2014yCat.7272....0G
-        result = Vizier.get_catalogs("VII/272/snrs")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("VII/272/snrs")
         table.convert_bytestring_to_unicode(python3_only=True)
     
         for row in tq(table, currenttask):
@@ -2402,8 +3061,7 @@ for task in tasks:
         journal_events()
     
         # 2014MNRAS.442..844F
-        result = Vizier.get_catalogs("J/MNRAS/442/844/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/442/844/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2413,8 +3071,7 @@ for task in tasks:
             add_quantity(name, 'ebv', str(row['E_B-V_']), source)
         journal_events()
     
-        result = Vizier.get_catalogs("J/MNRAS/442/844/table2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/442/844/table2")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2428,8 +3085,7 @@ for task in tasks:
         journal_events()
     
         # 2012MNRAS.425.1789S
-        result = Vizier.get_catalogs("J/MNRAS/425/1789/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/425/1789/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2443,8 +3099,7 @@ for task in tasks:
         journal_events()
     
         # 2015ApJS..219...13W
-        result = Vizier.get_catalogs("J/ApJS/219/13/table3")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJS/219/13/table3")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2455,8 +3110,7 @@ for task in tasks:
             add_quantity(name, 'redshift', row['z'], source, error = row['e_z'], kind = 'heliocentric')
             add_quantity(name, 'ebv', row['E_B-V_'], source)
             add_quantity(name, 'claimedtype', 'Ia', source)
-        result = Vizier.get_catalogs("J/ApJS/219/13/table2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJS/219/13/table2")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2468,8 +3122,7 @@ for task in tasks:
         journal_events()
     
         # 2012Natur.491..228C
-        result = Vizier.get_catalogs("J/other/Nat/491.228/tablef1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/other/Nat/491.228/tablef1")
         table.convert_bytestring_to_unicode(python3_only=True)
         name = 'SN2213-1745'
         (name, source) = new_event(name, bibcode = "2012Natur.491..228C")
@@ -2482,8 +3135,7 @@ for task in tasks:
                     add_photometry(name, time = row["MJD" + band + "_"], band = band + "'", magnitude = row[bandtag],
                         e_magnitude = row["e_" + bandtag], source = source)
     
-        result = Vizier.get_catalogs("J/other/Nat/491.228/tablef2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/other/Nat/491.228/tablef2")
         table.convert_bytestring_to_unicode(python3_only=True)
         name = 'SN1000+0216'
         (name, source) = new_event(name, bibcode = "2012Natur.491..228C")
@@ -2498,8 +3150,7 @@ for task in tasks:
         journal_events()
     
         # 2011Natur.474..484Q
-        result = Vizier.get_catalogs("J/other/Nat/474.484/tables1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/other/Nat/474.484/tables1")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2510,8 +3161,7 @@ for task in tasks:
         journal_events()
     
         # 2011ApJ...736..159G
-        result = Vizier.get_catalogs("J/ApJ/736/159/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/736/159/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         name = 'PTF10vdl'
         (name, source) = new_event(name, bibcode = "2011ApJ...736..159G")
@@ -2522,8 +3172,7 @@ for task in tasks:
         journal_events()
     
         # 2012ApJ...760L..33B
-        result = Vizier.get_catalogs("J/ApJ/760/L33/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/760/L33/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         name = 'PTF12gzk'
         (name, source) = new_event(name, bibcode = "2012ApJ...760L..33B")
@@ -2537,8 +3186,7 @@ for task in tasks:
         journal_events()
     
         # 2013ApJ...769...39S
-        result = Vizier.get_catalogs("J/ApJ/769/39/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/769/39/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         name = 'PS1-12sk'
         (name, source) = new_event(name, bibcode = "2013ApJ...769...39S")
@@ -2558,8 +3206,7 @@ for task in tasks:
         # Note: Instrument info available via links in VizieR, can't auto-parse just yet.
         name = 'SN2005cs'
         (name, source) = new_event(name, bibcode = "2009MNRAS.394.2266P")
-        result = Vizier.get_catalogs("J/MNRAS/394/2266/table2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/394/2266/table2")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2573,8 +3220,7 @@ for task in tasks:
                 add_photometry(name, time = str(jd_to_mjd(Decimal(row["JD"]))), band = "z", magnitude = row["zmag"],
                                e_magnitude = row["e_zmag"], source = source)
     
-        result = Vizier.get_catalogs("J/MNRAS/394/2266/table3")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/394/2266/table3")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2585,8 +3231,7 @@ for task in tasks:
                         e_magnitude = (row["e_" + bandtag] if row['l_' + bandtag] != '>' else ''),
                         source = source, upperlimit = (row['l_' + bandtag] == '>'))
     
-        result = Vizier.get_catalogs("J/MNRAS/394/2266/table4")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/394/2266/table4")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2598,8 +3243,7 @@ for task in tasks:
         journal_events()
     
         # 2013AJ....145...99A
-        result = Vizier.get_catalogs("J/AJ/145/99/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/AJ/145/99/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         name = 'SN2003ie'
         (name, source) = new_event(name, bibcode = "2013AJ....145...99A")
@@ -2623,16 +3267,14 @@ for task in tasks:
         name = 'SN2008am'
         (name, source) = new_event(name, bibcode = "2011ApJ...729..143C")
     
-        result = Vizier.get_catalogs("J/ApJ/729/143/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/729/143/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
             add_photometry(name, time = row['MJD'], band = 'ROTSE', telescope = 'ROTSE', magnitude = row['mag'],
                            e_magnitude = row['e_mag'] if not row['l_mag'] else '', upperlimit = (row['l_mag'] == '<'), source = source)
     
-        result = Vizier.get_catalogs("J/ApJ/729/143/table2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/729/143/table2")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2642,16 +3284,14 @@ for task in tasks:
                     add_photometry(name, time = row["MJD"], telescope = "PAIRITEL", band = band, magnitude = row[bandtag],
                                    e_magnitude = row["e_" + bandtag], source = source)
     
-        result = Vizier.get_catalogs("J/ApJ/729/143/table4")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/729/143/table4")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
             add_photometry(name, time = row['MJD'], band = row['Filt'], telescope = 'P60', magnitude = row['mag'],
                            e_magnitude = row['e_mag'], source = source)
     
-        result = Vizier.get_catalogs("J/ApJ/729/143/table5")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/729/143/table5")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2663,8 +3303,7 @@ for task in tasks:
         name = 'SN2009bb'
         (name, source) = new_event(name, bibcode = "2011ApJ...728...14P")
     
-        result = Vizier.get_catalogs("J/ApJ/728/14/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/728/14/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2674,8 +3313,7 @@ for task in tasks:
                     add_photometry(name, time = str(jd_to_mjd(Decimal(row["JD"]))), telescope = row["Tel"], band = band, magnitude = row[bandtag],
                                    e_magnitude = row["e_" + bandtag], source = source)
     
-        result = Vizier.get_catalogs("J/ApJ/728/14/table2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/728/14/table2")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2685,8 +3323,7 @@ for task in tasks:
                     add_photometry(name, time = str(jd_to_mjd(Decimal(row["JD"]))), telescope = row["Tel"], band = band + "'", magnitude = row[bandtag],
                                    e_magnitude = row["e_" + bandtag], source = source)
     
-        result = Vizier.get_catalogs("J/ApJ/728/14/table3")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/728/14/table3")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2701,8 +3338,7 @@ for task in tasks:
         name = 'SN2009nr'
         (name, source) = new_event(name, bibcode = "2011PAZh...37..837T")
     
-        result = Vizier.get_catalogs("J/PAZh/37/837/table2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/PAZh/37/837/table2")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2718,8 +3354,7 @@ for task in tasks:
         name = 'SN2012aw'
         (name, source) = new_event(name, bibcode = "2013MNRAS.433.1871B")
     
-        result = Vizier.get_catalogs("J/MNRAS/433/1871/table3a")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/433/1871/table3a")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2730,8 +3365,7 @@ for task in tasks:
                     add_photometry(name, time = mjd, telescope = row["Tel"], band = band, magnitude = row[bandtag],
                                    e_magnitude = row["e_" + bandtag], source = source)
     
-        result = Vizier.get_catalogs("J/MNRAS/433/1871/table3b")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/433/1871/table3b")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2747,8 +3381,7 @@ for task in tasks:
         name = 'SN2012fr'
         (name, source) = new_event(name, bibcode = "2014AJ....148....1Z")
     
-        result = Vizier.get_catalogs("J/AJ/148/1/table2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/AJ/148/1/table2")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2759,8 +3392,7 @@ for task in tasks:
                     add_photometry(name, time = mjd, telescope = "LJT", instrument = "YFOSC", band = band, magnitude = row[bandtag],
                                    e_magnitude = row["e_" + bandtag], source = source)
     
-        result = Vizier.get_catalogs("J/AJ/148/1/table3")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/AJ/148/1/table3")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2771,8 +3403,7 @@ for task in tasks:
                     add_photometry(name, time = mjd, telescope = "Swift", instrument = "UVOT", band = band, magnitude = row[bandtag],
                                    e_magnitude = row["e_" + bandtag], source = source)
     
-        result = Vizier.get_catalogs("J/AJ/148/1/table5")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/AJ/148/1/table5")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2788,8 +3419,7 @@ for task in tasks:
         name = 'SN2014J'
         (name, source) = new_event(name, bibcode = "2014AJ....148....1Z")
     
-        result = Vizier.get_catalogs("J/ApJ/805/74/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/805/74/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2803,8 +3433,7 @@ for task in tasks:
         journal_events()
     
         # 2011ApJ...741...97D
-        result = Vizier.get_catalogs("J/ApJ/741/97/table2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/741/97/table2")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2816,8 +3445,7 @@ for task in tasks:
     
         # 2015MNRAS.448.1206M
         # Note: Photometry from two SN can also be added from this source.
-        result = Vizier.get_catalogs("J/MNRAS/448/1206/table3")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/448/1206/table3")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2830,8 +3458,7 @@ for task in tasks:
             add_quantity(name, 'maxappmag', row['rP1mag'], source, error = row['e_rP1mag'])
             add_quantity(name, 'maxband', 'r', source)
             add_quantity(name, 'claimedtype', 'Ia', source)
-        result = Vizier.get_catalogs("J/MNRAS/448/1206/table4")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/448/1206/table4")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2844,8 +3471,7 @@ for task in tasks:
             add_quantity(name, 'maxappmag', row['rP1mag'], source, error = row['e_rP1mag'])
             add_quantity(name, 'maxband', 'r', source)
             add_quantity(name, 'claimedtype', 'Ia?', source)
-        result = Vizier.get_catalogs("J/MNRAS/448/1206/table5")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/448/1206/table5")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2858,8 +3484,7 @@ for task in tasks:
             add_quantity(name, 'maxappmag', row['rP1mag'], source, error = row['e_rP1mag'])
             add_quantity(name, 'maxband', 'r', source)
             add_quantity(name, 'claimedtype', row['Type'], source)
-        result = Vizier.get_catalogs("J/MNRAS/448/1206/table6")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/448/1206/table6")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2871,8 +3496,7 @@ for task in tasks:
             add_quantity(name, 'maxappmag', row['rP1mag'], source, error = row['e_rP1mag'])
             add_quantity(name, 'maxband', 'r', source)
             add_quantity(name, 'claimedtype', row['Type'], source)
-        result = Vizier.get_catalogs("J/MNRAS/448/1206/tablea2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/448/1206/tablea2")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2885,8 +3509,7 @@ for task in tasks:
             add_quantity(name, 'maxband', 'r', source)
             add_quantity(name, 'claimedtype', row['Typesoft']+'?', source)
             add_quantity(name, 'claimedtype', row['Typepsnid']+'?', source)
-        result = Vizier.get_catalogs("J/MNRAS/448/1206/tablea3")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/448/1206/tablea3")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2901,8 +3524,7 @@ for task in tasks:
         journal_events()
     
         # 2012AJ....143..126B
-        result = Vizier.get_catalogs("J/AJ/143/126/table4")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/AJ/143/126/table4")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             if not row['Wcl'] or row['Wcl'] == 'N':
@@ -2915,8 +3537,7 @@ for task in tasks:
 
         # 2015ApJS..220....9F
         for viztab in ['1', '2']:
-            result = Vizier.get_catalogs("J/ApJS/220/9/table" + viztab)
-            table = result[list(result.keys())[0]]
+            table = get_vizier_table("J/ApJS/220/9/table" + viztab)
             table.convert_bytestring_to_unicode(python3_only=True)
             for row in tq(table, currenttask):
                 row = convert_aq_output(row)
@@ -2932,8 +3553,7 @@ for task in tasks:
                 elif 'Spectrum' in row['n_z']:
                     kind = 'spectroscopic'
                 add_quantity(name, 'redshift', row['z'], source, error = row['e_z'], kind = kind)
-        result = Vizier.get_catalogs("J/ApJS/220/9/table8")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJS/220/9/table8")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2944,8 +3564,7 @@ for task in tasks:
         journal_events()
 
         # 2008ApJ...673..999P
-        result = Vizier.get_catalogs("J/ApJ/673/999/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/673/999/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2959,8 +3578,7 @@ for task in tasks:
         journal_events()
 
         # 2011MNRAS.417..916G
-        result = Vizier.get_catalogs("J/MNRAS/417/916/table2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/417/916/table2")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2974,8 +3592,7 @@ for task in tasks:
         journal_events()
 
         # 2013MNRAS.430.1746G
-        result = Vizier.get_catalogs("J/MNRAS/430/1746/table4")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/430/1746/table4")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -2988,8 +3605,7 @@ for task in tasks:
         journal_events()
 
         # 2014AJ....148...13R
-        result = Vizier.get_catalogs("J/AJ/148/13/high_z")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/AJ/148/13/high_z")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3002,8 +3618,7 @@ for task in tasks:
             add_quantity(name, 'hostdec', row['DEG'], source)
             add_quantity(name, 'hostoffsetang', row['ASep'], source, unit = 'arcseconds')
             add_quantity(name, 'redshift', row['zhost'], source, kind = 'host', error = row['e_zhost'])
-        result = Vizier.get_catalogs("J/AJ/148/13/low_z")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/AJ/148/13/low_z")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3019,8 +3634,7 @@ for task in tasks:
         journal_events()
 
         # 2007ApJ...666..674M
-        result = Vizier.get_catalogs("J/ApJ/666/674/table3")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/666/674/table3")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3039,8 +3653,7 @@ for task in tasks:
         journal_events()
 
         # 2013AcA....63....1K
-        result = Vizier.get_catalogs("J/AcA/63/1/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/AcA/63/1/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3055,8 +3668,7 @@ for task in tasks:
         journal_events()
     
         # 2011MNRAS.410.1262W
-        result = Vizier.get_catalogs("J/MNRAS/410/1262/tablea2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/MNRAS/410/1262/tablea2")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3067,8 +3679,7 @@ for task in tasks:
         journal_events()
 
         # 2012ApJ...755...61S
-        result = Vizier.get_catalogs("J/ApJ/755/61/table3")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/755/61/table3")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3085,8 +3696,7 @@ for task in tasks:
         journal_events()
 
         # 2008AJ....135..348S
-        result = Vizier.get_catalogs("J/AJ/135/348/SNe")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/AJ/135/348/SNe")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3107,8 +3717,7 @@ for task in tasks:
         journal_events()
 
         # 2010ApJ...713.1026D
-        result = Vizier.get_catalogs("J/ApJ/713/1026/SNe")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/713/1026/SNe")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3125,8 +3734,7 @@ for task in tasks:
         journal_events()
 
         # 2013ApJ...770..107C
-        result = Vizier.get_catalogs("J/ApJ/770/107/galaxies")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/770/107/galaxies")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3137,8 +3745,7 @@ for task in tasks:
         journal_events()
 
         # 2011ApJ...738..162S
-        result = Vizier.get_catalogs("J/ApJ/738/162/table3")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/738/162/table3")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3151,8 +3758,7 @@ for task in tasks:
             add_quantity(name, 'dec', row['DEJ2000'], source, unit = 'floatdegrees')
             add_quantity(name, 'redshift', row['z'], source, kind = 'spectroscopic', error = row['e_z'])
             add_quantity(name, 'claimedtype', 'Ia', source, probability = row['PzIa'])
-        result = Vizier.get_catalogs("J/ApJ/738/162/table4")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/738/162/table4")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3171,8 +3777,7 @@ for task in tasks:
         snrtabs = ["ngc2403","ngc2903","ngc300","ngc3077","ngc4214","ngc4395","ngc4449","ngc5204",
             "ngc5585","ngc6946","ngc7793","m33","m74","m81","m82","m83","m101","m31"]
         for tab in tq(snrtabs, currenttask):
-            result = Vizier.get_catalogs("J/MNRAS/446/943/" + tab)
-            table = result[list(result.keys())[0]]
+            table = get_vizier_table("J/MNRAS/446/943/" + tab)
             table.convert_bytestring_to_unicode(python3_only=True)
             for ri, row in enumerate(tq(table, currenttask)):
                 ra = row['RAJ2000'] if isinstance(row['RAJ2000'], str) else radec_clean(str(row['RAJ2000']), 'ra', unit = 'floatdegrees')[0]
@@ -3185,8 +3790,7 @@ for task in tasks:
         journal_events()
 
         # 2009ApJ...703..370C
-        result = Vizier.get_catalogs("J/ApJ/703/370/tables")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/703/370/tables")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3201,8 +3805,7 @@ for task in tasks:
 
         # 2016ApJ...821...57D
         (name, source) = new_event('SN2013ge', bibcode = "2016ApJ...821...57D")
-        result = Vizier.get_catalogs("J/ApJ/821/57/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/821/57/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3211,8 +3814,7 @@ for task in tasks:
                 if bandtag in row and is_number(row[bandtag]) and not isnan(float(row[bandtag])):
                     add_photometry(name, time = str(row["MJD"]), band = band, magnitude = row[bandtag],
                                    e_magnitude = row["e_" + bandtag], telescope = 'Swift', instrument = 'UVOT', source = source)
-        result = Vizier.get_catalogs("J/ApJ/821/57/table2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/821/57/table2")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3221,8 +3823,7 @@ for task in tasks:
                 if bandtag in row and is_number(row[bandtag]) and not isnan(float(row[bandtag])):
                     add_photometry(name, time = str(row["MJD"]), band = band, magnitude = row[bandtag],
                                    e_magnitude = row["e_" + bandtag], instrument = 'CAO', source = source)
-        result = Vizier.get_catalogs("J/ApJ/821/57/table3")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/821/57/table3")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3231,8 +3832,7 @@ for task in tasks:
                 if bandtag in row and is_number(row[bandtag]) and not isnan(float(row[bandtag])):
                     add_photometry(name, time = str(row["MJD"]), band = band, magnitude = row[bandtag],
                                    e_magnitude = row["e_" + bandtag], instrument = 'FLWO', source = source)
-        result = Vizier.get_catalogs("J/ApJ/821/57/table4")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/821/57/table4")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3248,8 +3848,7 @@ for task in tasks:
         journal_events()
 
         # 2004ApJ...607..665R
-        result = Vizier.get_catalogs("J/ApJ/607/665/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/607/665/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3258,8 +3857,7 @@ for task in tasks:
             add_quantity(name, 'alias', row['OName'], source)
             add_quantity(name, 'ra', row['RAJ2000'], source)
             add_quantity(name, 'dec', row['DEJ2000'], source)
-        result = Vizier.get_catalogs("J/ApJ/607/665/table2")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/607/665/table2")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3268,8 +3866,7 @@ for task in tasks:
             mjd = str(jd_to_mjd(Decimal(row['HJD'])))
             add_photometry(name, time = mjd, band = row['Filt'], magnitude = row['Vega'], system = 'Vega',
                            e_magnitude = row['e_Vega'], source = source)
-        result = Vizier.get_catalogs("J/ApJ/607/665/table5")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/ApJ/607/665/table5")
         table.convert_bytestring_to_unicode(python3_only=True)
         for row in tq(table, currenttask):
             row = convert_aq_output(row)
@@ -3805,15 +4402,15 @@ for task in tasks:
         if archived_task('cccp'):
             with open('../sne-external/CCCP/sc_cccp.html', 'r') as f:
                 html = f.read()
+            count_task('cachehits')
         else:
-            session = requests.Session()
-            response = session.get("https://webhome.weizmann.ac.il/home/iair/sc_cccp.html")
+            response = fetchsession.get("https://webhome.weizmann.ac.il/home/iair/sc_cccp.html")
             html = response.text
             with open('../sne-external/CCCP/sc_cccp.html', 'w') as f:
                 f.write(html)
     
-        soup = BeautifulSoup(html, "html5lib")
-        links = soup.body.findAll("a")
+        soup = parse_html(html, 'a')
+        links = soup.findAll("a")
         for link in tq(links, currenttask):
             if 'sc_sn' in link['href']:
                 (name, source) = new_event(link.text.replace(' ', ''), refname = 'CCCP', url = 'https://webhome.weizmann.ac.il/home/iair/sc_cccp.html')
@@ -3821,14 +4418,15 @@ for task in tasks:
                 if archived_task('cccp'):
                     with open('../sne-external/CCCP/' + link['href'].split('/')[-1], 'r') as f:
                         html2 = f.read()
+                    count_task('cachehits')
                 else:
-                    response2 = session.get("https://webhome.weizmann.ac.il/home/iair/" + link['href'])
+                    response2 = fetchsession.get("https://webhome.weizmann.ac.il/home/iair/" + link['href'])
                     html2 = response2.text
                     with open('../sne-external/CCCP/' + link['href'].split('/')[-1], 'w') as f:
                         f.write(html2)
     
-                soup2 = BeautifulSoup(html2, "html5lib")
-                links2 = soup2.body.findAll("a")
+                soup2 = parse_html(html2, 'a')
+                links2 = soup2.findAll("a")
                 for link2 in links2:
                     if ".txt" in link2['href'] and '_' in link2['href']:
                         band = link2['href'].split('_')[1].split('.')[0].upper()
@@ -3838,8 +4436,9 @@ for task in tasks:
                                 continue
                             with open(fname, 'r') as f:
                                 html3 = f.read()
+                            count_task('cachehits')
                         else:
-                            response3 = session.get("https://webhome.weizmann.ac.il/home/iair/cccp/" + link2['href'])
+                            response3 = fetchsession.get("https://webhome.weizmann.ac.il/home/iair/cccp/" + link2['href'])
                             if response3.status_code == 404:
                                 continue
                             html3 = response3.text
@@ -3869,7 +4468,7 @@ for task in tasks:
             ei = int(basesplit[2])
             bandlink = 'file://' + os.path.abspath(datafile)
             bandresp = urllib.request.urlopen(bandlink)
-            bandsoup = BeautifulSoup(bandresp, "html5lib")
+            bandsoup = parse_html(bandresp)
             bandtable = bandsoup.find('table')
     
             names = bandsoup.body.findAll(text=re.compile("Name"))
@@ -4032,7 +4631,7 @@ for task in tasks:
         jsontxt = load_cached_url("http://heracles.astro.berkeley.edu/sndb/download?id=allpubphot",
             '../sne-external-spectra/UCB/allpub.json')
         if not jsontxt:
-            continue
+            return
     
         photom = json.loads(jsontxt)
         photom = sorted(photom, key = lambda k: k['ObjName'])
@@ -4065,9 +4664,9 @@ for task in tasks:
             if archived_task('ucb') and os.path.isfile(filepath):
                 with open(filepath, 'r') as f:
                     phottxt = f.read()
+                count_task('cachehits')
             else:
-                session = requests.Session()
-                response = session.get("http://heracles.astro.berkeley.edu/sndb/download?id=dp:" + str(phot["PhotID"]))
+                response = fetchsession.get("http://heracles.astro.berkeley.edu/sndb/download?id=dp:" + str(phot["PhotID"]))
                 phottxt = response.text
                 with open(filepath, 'w') as f:
                     f.write(phottxt)
@@ -4142,10 +4741,23 @@ for task in tasks:
         fname = '../sne-external/GAIA/alerts.csv'
         csvtxt = load_cached_url('http://gsaweb.ast.cam.ac.uk/alerts/alerts.csv', fname)
         if not csvtxt:
-            continue
-        tsvin = csv.reader(csvtxt.splitlines(), delimiter=',', skipinitialspace=True)
+            return
+        tsvin = list(csv.reader(csvtxt.splitlines(), delimiter=',', skipinitialspace=True))
         reference = "Gaia Photometric Science Alerts"
         refurl = "http://gsaweb.ast.cam.ac.uk/alerts/alertsindex"
+        # Light curves keep growing for a while after an alert, so updates go back
+        # syncwindow days from the newest alert date seen last time.
+        syncstate = load_sync_state('gaia')
+        reconcile = not args.update or sync_reconcile(syncstate, args.reconcile)
+        since = ''
+        if not reconcile and syncstate.get('date'):
+            since = (datetime.strptime(syncstate['date'], '%Y-%m-%d') - timedelta(days = syncwindow)).strftime('%Y-%m-%d')
+        tsvin = [tsvin[0]] + [x for x in tsvin[1:] if x and x[1][:10] >= since]
+        fetcher = AsyncFetcher()
+        for row in tsvin[1:]:
+            fname = '../sne-external/GAIA/' + row[0] + '.csv'
+            if args.fullrefresh or not archived_task('gaia') or not os.path.isfile(fname):
+                fetcher.submit("http://gsaweb.ast.cam.ac.uk/alerts/alert/" + row[0] + "/lightcurve.csv", fname)
         for ri, row in enumerate(tq(tsvin, currenttask)):
             if ri == 0 or not row:
                 continue
@@ -4174,11 +4786,9 @@ for task in tasks:
             if not args.fullrefresh and archived_task('gaia') and os.path.isfile(fname):
                 with open(fname, 'r') as f:
                     csvtxt = f.read()
+                count_task('cachehits')
             else:
-                response = urllib.request.urlopen("http://gsaweb.ast.cam.ac.uk/alerts/alert/" + row[0] + "/lightcurve.csv")
-                with open(fname, 'w') as f:
-                    csvtxt = response.read().decode('utf-8')
-                    f.write(csvtxt)
+                csvtxt = fetcher.get("http://gsaweb.ast.cam.ac.uk/alerts/alert/" + row[0] + "/lightcurve.csv", fname)
     
             tsvin2 = csv.reader(csvtxt.splitlines())
             for ri2, row2 in enumerate(tsvin2):
@@ -4194,7 +4804,11 @@ for task in tasks:
                 add_photometry(name, time = mjd, telescope = telescope, band = band, magnitude = magnitude, e_magnitude = e_magnitude, source = source)
             if args.update:
                 journal_events()
+        fetcher.close()
         journal_events()
+        if len(tsvin) > 1:
+            syncstate['date'] = max([syncstate.get('date', '')] + [x[1][:10] for x in tsvin[1:]])
+        save_sync_state('gaia', syncstate, reconciled = reconcile)
     
     # Import CSP
     # VizieR catalogs exist for this: J/AJ/139/519, J/AJ/142/156. Should replace eventually.
@@ -4292,7 +4906,7 @@ for task in tasks:
         html = response.read().decode('utf-8')
         html = html.replace("\r", "")
     
-        soup = BeautifulSoup(html, "html5lib")
+        soup = parse_html(html)
         table = soup.find("table")
     
         records = []
@@ -4377,8 +4991,7 @@ for task in tasks:
     
     if do_task(task, 'lennarz'): 
         Vizier.ROW_LIMIT = -1
-        result = Vizier.get_catalogs("J/A+A/538/A120/usc")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/A+A/538/A120/usc")
         table.convert_bytestring_to_unicode(python3_only=True)
     
         bibcode = "2012A&A...538A.120L"
@@ -4443,7 +5056,6 @@ for task in tasks:
                             datestr = row['Mdate'].strip() + '-01-01'
                         mjd = str(astrotime(datestr).mjd)
                         add_photometry(name, time = mjd, band = row['Mband'], magnitude = row['Mmag'], source = source)
-        f.close()
         journal_events()
 
     if do_task(task, 'fermi'):
@@ -4464,23 +5076,29 @@ for task in tasks:
         journal_events()
     
     if do_task(task, 'tns'):
-        session = requests.Session()
         csvtxt = load_cached_url("https://wis-tns.weizmann.ac.il/search?&num_page=1&format=html&sort=desc&order=id&format=csv&page=0",
             "../sne-external/TNS/index.csv")
         if not csvtxt:
-            continue
+            return
         maxid = csvtxt.splitlines()[1].split(",")[0].strip('"')
         maxpages = ceil(int(maxid)/1000.)
+        # Pages before the last one read were full and are taken from the cache,
+        # and skipped altogether when updating, until the next full walk.
+        syncstate = load_sync_state('tns')
+        reconcile = sync_reconcile(syncstate, args.reconcile)
+        syncpage = 7 if reconcile else max(7, syncstate.get('page', 0))
     
         for page in tq(range(maxpages), currenttask):
+            if args.update and not reconcile and page < syncpage:
+                continue
             fname = '../sne-external/TNS/page-' + str(page).zfill(2) + '.csv'
-            if archived_task('tns') and os.path.isfile(fname) and page < 7:
+            if archived_task('tns') and os.path.isfile(fname) and page < syncpage:
                 with open(fname, 'r') as f:
                     csvtxt = f.read()
+                count_task('cachehits')
             else:
                 with open(fname, 'w') as f:
-                    session = requests.Session()
-                    response = session.get("https://wis-tns.weizmann.ac.il/search?&num_page=1000&format=html&edit[type]=&edit[objname]=&edit[id]=&sort=asc&order=id&display[redshift]=1&display[hostname]=1&display[host_redshift]=1&display[source_group_name]=1&display[programs_name]=1&display[internal_name]=1&display[isTNS_AT]=1&display[public]=1&display[end_pop_period]=0&display[spectra_count]=1&display[discoverymag]=1&display[discmagfilter]=1&display[discoverydate]=1&display[discoverer]=1&display[sources]=1&display[bibcode]=1&format=csv&page=" + str(page))
+                    response = fetchsession.get("https://wis-tns.weizmann.ac.il/search?&num_page=1000&format=html&edit[type]=&edit[objname]=&edit[id]=&sort=asc&order=id&display[redshift]=1&display[hostname]=1&display[host_redshift]=1&display[source_group_name]=1&display[programs_name]=1&display[internal_name]=1&display[isTNS_AT]=1&display[public]=1&display[end_pop_period]=0&display[spectra_count]=1&display[discoverymag]=1&display[discmagfilter]=1&display[discoverydate]=1&display[discoverer]=1&display[sources]=1&display[bibcode]=1&format=csv&page=" + str(page))
                     csvtxt = response.text
                     f.write(csvtxt)
     
@@ -4531,6 +5149,9 @@ for task in tasks:
                 if args.update:
                     journal_events()
         journal_events()
+        syncstate['maxid'] = int(maxid)
+        syncstate['page'] = maxpages - 1
+        save_sync_state('tns', syncstate, reconciled = reconcile)
     
     if do_task(task, 'rochester'): 
         rochestermirrors = ['http://www.rochesterastronomy.org/', 'http://www.supernova.thistlethwaites.com/']
@@ -4549,7 +5170,7 @@ for task in tasks:
             if not html:
                 continue
     
-            soup = BeautifulSoup(html, "html5lib")
+            soup = parse_html(html)
             rows = soup.findAll('tr')
             secondaryreference = "Latest Supernovae"
             secondaryrefurl = "http://www.rochesterastronomy.org/snimages/snredshiftall.html"
@@ -4701,7 +5322,7 @@ for task in tasks:
             if not htmltxt:
                 continue
     
-            soup = BeautifulSoup(htmltxt, "html5lib")
+            soup = parse_html(htmltxt)
             links = soup.findAll('a')
             breaks = soup.findAll('br')
             datalinks = []
@@ -4712,6 +5333,12 @@ for task in tasks:
                         datalinks.append('http://ogle.astrouw.edu.pl/ogle4/' + bn + '/' + a['href'])
                         datafnames.append(bn.replace('/', '-') + '-' + a['href'].replace('/', '-'))
     
+            fetcher = AsyncFetcher()
+            for datalink, datafname in zip(datalinks, datafnames):
+                fname = '../sne-external/OGLE/' + datafname
+                if args.fullrefresh or not archived_task('ogle') or not os.path.isfile(fname):
+                    fetcher.submit(datalink, fname)
+
             ec = -1
             reference = 'OGLE-IV Transient Detection System'
             refurl = 'http://ogle.astrouw.edu.pl/ogle4/transients/transients.html'
@@ -4759,11 +5386,9 @@ for task in tasks:
                     if not args.fullrefresh and archived_task('ogle') and os.path.isfile(fname):
                         with open(fname, 'r') as f:
                             csvtxt = f.read()
+                        count_task('cachehits')
                     else:
-                        response = urllib.request.urlopen(datalinks[ec])
-                        with open(fname, 'w') as f:
-                            csvtxt = response.read().decode('utf-8')
-                            f.write(csvtxt)
+                        csvtxt = fetcher.get(datalinks[ec], fname)
     
                     lcdat = csvtxt.splitlines()
                     sources = [add_source(name, refname = reference, url = refurl)]
@@ -4802,6 +5427,7 @@ for task in tasks:
                             system = 'Vega', source = sources, upperlimit = upperlimit)
                     if args.update:
                         journal_events()
+            fetcher.close()
             journal_events()
     
     if do_task(task, 'snls'): 
@@ -4831,9 +5457,9 @@ for task in tasks:
         fname = '../sne-external/3pi/page00.html'
         html = load_cached_url("http://psweb.mp.qub.ac.uk/ps1threepi/psdb/public/?page=1&sort=followup_flag_date", fname, write = False)
         if not html:
-            continue
+            return
 
-        bs = BeautifulSoup(html, "html5lib")
+        bs = parse_html(html, 'div', {"class":"pagination"})
         div = bs.find('div', {"class":"pagination"})
         offline = False
         if not div:
@@ -4845,11 +5471,11 @@ for task in tasks:
     
         if offline:
             if args.update:
-                continue
+                return
             warnings.warn("Pan-STARRS 3pi offline, using local files only.")
             with open(fname, 'r') as f:
                 html = f.read()
-            bs = BeautifulSoup(html, "html5lib")
+            bs = parse_html(html, 'div', {"class":"pagination"})
             div = bs.find('div', {"class":"pagination"})
             links = div.findAll('a')
         else:
@@ -4858,6 +5484,21 @@ for task in tasks:
     
         numpages = int(links[-2].contents[0])
         oldnumpages = len(glob('../sne-external/3pi/page*'))
+        # Listing rows are remembered by a hash of their HTML, and when updating
+        # only new or changed rows are processed (and their candidate pages fetched).
+        # The listing is sorted by follow-up date, so an update stops at the first
+        # page with nothing new on it and pages are only fetched one ahead.
+        syncstate = load_sync_state('psthreepi')
+        reconcile = not args.update or sync_reconcile(syncstate, args.reconcile)
+        syncrows = set(syncstate.get('rows', []))
+        seenrows = set()
+        fetcher = AsyncFetcher()
+        if not offline:
+            # Travis only runs the first page.
+            for page in range(1, 2 if args.travis or not reconcile else numpages):
+                fname = '../sne-external/3pi/page' + str(page).zfill(2) + '.html'
+                if args.fullrefresh or not archived_task('psthreepi') or page >= oldnumpages or not os.path.isfile(fname):
+                    fetcher.submit("http://psweb.mp.qub.ac.uk/ps1threepi/psdb/public/?page=" + str(page) + "&sort=followup_flag_date", fname)
         for page in tq(range(1,numpages), currenttask):
             fname = '../sne-external/3pi/page' + str(page).zfill(2) + '.html'
             if offline:
@@ -4869,14 +5510,30 @@ for task in tasks:
                 if not args.fullrefresh and archived_task('psthreepi') and page < oldnumpages and os.path.isfile(fname) :
                     with open(fname, 'r') as f:
                         html = f.read()
+                    count_task('cachehits')
                 else:
-                    response = urllib.request.urlopen("http://psweb.mp.qub.ac.uk/ps1threepi/psdb/public/?page=" + str(page) + "&sort=followup_flag_date")
-                    with open(fname, 'w') as f:
-                        html = response.read().decode('utf-8')
-                        f.write(html)
+                    html = fetcher.get("http://psweb.mp.qub.ac.uk/ps1threepi/psdb/public/?page=" + str(page) + "&sort=followup_flag_date", fname)
     
-            bs = BeautifulSoup(html, "html5lib")
+            bs = parse_html(html)
             trs = bs.findAll('tr')
+            if not offline:
+                rowhashes = [md5(str(tr).encode('utf-8')).hexdigest() for tr in trs]
+                seenrows.update(rowhashes)
+                if not reconcile:
+                    trs = [tr for tr, rowhash in zip(trs, rowhashes) if rowhash not in syncrows]
+                    if not trs:
+                        break
+                    if page + 1 < numpages and (args.fullrefresh or not archived_task('psthreepi') or page + 1 >= oldnumpages or
+                        not os.path.isfile('../sne-external/3pi/page' + str(page + 1).zfill(2) + '.html')):
+                        fetcher.submit("http://psweb.mp.qub.ac.uk/ps1threepi/psdb/public/?page=" + str(page + 1) + "&sort=followup_flag_date",
+                            '../sne-external/3pi/page' + str(page + 1).zfill(2) + '.html')
+                # Candidate pages of the page's supernovae and orphans.
+                for tr in trs:
+                    tds = tr.findAll('td')
+                    if len(tds) > 3 and tds[3].contents and tds[3].contents[0] in ['sn', 'orphan']:
+                        fname2 = '../sne-external/3pi/candidate-' + tds[0].contents[0]['href'].rstrip('/').split('/')[-1] + '.html'
+                        if not archived_task('psthreepi') or not os.path.isfile(fname2):
+                            fetcher.submit('http://psweb.mp.qub.ac.uk/ps1threepi/psdb/public/' + tds[0].contents[0]['href'], fname2)
             for tr in tq(trs, currenttask):
                 tds = tr.findAll('td')
                 if not tds:
@@ -4950,23 +5607,19 @@ for task in tasks:
                     if archived_task('psthreepi') and os.path.isfile(fname2):
                         with open(fname2, 'r') as f:
                             html2 = f.read()
+                        count_task('cachehits')
                     else:
                         pslink = 'http://psweb.mp.qub.ac.uk/ps1threepi/psdb/public/' + pslink
                         try:
-                            session2 = requests.Session()
-                            response2 = session2.get(pslink)
+                            html2 = fetcher.get(pslink, fname2)
                         except:
                             offline = True
                             if not os.path.isfile(fname2):
                                 continue
                             with open(fname2, 'r') as f:
                                 html2 = f.read()
-                        else:
-                            html2 = response2.text
-                            with open(fname2, 'w') as f:
-                                f.write(html2)
     
-                bs2 = BeautifulSoup(html2, "html5lib")
+                bs2 = parse_html(html2, ['script', 'table'])
                 scripts = bs2.findAll('script')
                 nslines = []
                 nslabels = []
@@ -5017,6 +5670,11 @@ for task in tasks:
             # Only run first page for Travis
             if args.travis:
                 break
+        fetcher.close()
+        if not offline and not args.travis:
+            # Rows on the pages an update didn't reach are kept until the next full walk.
+            syncstate['rows'] = sorted(seenrows if reconcile else seenrows | syncrows)
+            save_sync_state('psthreepi', syncstate, reconciled = reconcile)
     
     if do_task(task, 'psmds'):
         with open('../sne-external/MDS/apj506838t1_mrt.txt') as f:
@@ -5078,7 +5736,7 @@ for task in tasks:
         csvtxt = load_cached_url('http://grb.pa.msu.edu/grbcatalog/download_data?cut_0_min=10&cut_0=BAT%20T90&cut_0_max=100000&num_cuts=1&no_date_cut=True',
             '../sne-external/GRB-catalog/catalog.csv')
         if not csvtxt:
-            continue
+            return
         data = csv.reader(csvtxt.splitlines(), delimiter=',', quotechar='"', skipinitialspace = True)
         for r, row in enumerate(tq(data, currenttask)):
             if r == 0:
@@ -5097,8 +5755,16 @@ for task in tasks:
             html = load_cached_url("http://nesssi.cacr.caltech.edu/" + fold + "/AllSN.html", '../sne-external/CRTS/' + fold + '.html')
             if not html:
                 continue
-            bs = BeautifulSoup(html, "html5lib")
+            bs = parse_html(html)
             trs = bs.findAll('tr')
+            fetcher = AsyncFetcher()
+            for tr in trs:
+                tds = tr.findAll('td')
+                if len(tds) > 11 and tds[11].find('a') and tds[11].find('a').has_attr('onclick'):
+                    lclink = tds[11].find('a')['onclick'].split("'")[1]
+                    fname2 = '../sne-external/' + fold + '/' + lclink.split('.')[-2].rstrip('p').split('/')[-1] + '.html'
+                    if args.fullrefresh or not archived_task('crts') or not os.path.isfile(fname2):
+                        fetcher.submit(lclink, fname2)
             for tri, tr in enumerate(tq(trs, currenttask)):
                 tds = tr.findAll('td')
                 if not tds:
@@ -5170,11 +5836,9 @@ for task in tasks:
                 if not args.fullrefresh and archived_task('crts') and os.path.isfile(fname2):
                     with open(fname2, 'r') as f:
                         html2 = f.read()
+                    count_task('cachehits')
                 else:
-                    with open(fname2, 'w') as f:
-                        response2 = urllib.request.urlopen(lclink)
-                        html2 = response2.read().decode('utf-8')
-                        f.write(html2)
+                    html2 = fetcher.get(lclink, fname2)
     
                 lines = html2.splitlines()
                 for line in lines:
@@ -5193,6 +5857,7 @@ for task in tasks:
                         telescope = 'Catalina Schmidt', e_magnitude = err if float(err) > 0.0 else '', upperlimit = (float(err) == 0.0))
                 if args.update:
                     journal_events()
+            fetcher.close()
             if args.travis and tri > travislimit:
                 break
         journal_events()
@@ -5200,7 +5865,7 @@ for task in tasks:
     if do_task(task, 'snhunt'):
         html = load_cached_url('http://nesssi.cacr.caltech.edu/catalina/current.html', '../sne-external/SNhunt/current.html')
         if not html:
-            continue
+            return
         text = html.splitlines()
         findtable = False
         for ri, row in enumerate(text):
@@ -5217,7 +5882,7 @@ for task in tasks:
             else:
                 tablestr = tablestr + row
         tablestr = tablestr + '</table></body></html>'
-        bs = BeautifulSoup(tablestr, 'html5lib')
+        bs = parse_html(tablestr)
         trs = bs.find('table').findAll('tr')
         for tr in tq(trs, currenttask):
             cols = [str(x.text) for x in tr.findAll('td')]
@@ -5256,45 +5921,45 @@ for task in tasks:
                 moderr = row[5]
                 dist = row[6]
                 bibcode = unescape(row[8])
-                snname = name_clean(row[9])
+                nedname = name_clean(row[9])
                 redshift = row[10]
                 cleanhost = ''
 
-                if name != snname and (name + ' HOST' != snname):
+                if name != nedname and (name + ' HOST' != nedname):
                     cleanhost = host_clean(distname)
                     if cleanhost.endswith(' HOST'):
                         cleanhost = ''
                     if not is_number(dist):
                         print(dist)
                     if dist:
-                        nedddict.setdefault(cleanhost,[]).append(Decimal(dist))
+                        nedddict.setdefault(cleanhost,[]).append(dist)
     
-                if snname and 'HOST' not in snname:
-                    (snname, secondarysource) = new_event(snname, refname = reference, url = refurl, secondary = True)
+                if nedname and 'HOST' not in nedname:
+                    (nedname, secondarysource) = new_event(nedname, refname = reference, url = refurl, secondary = True)
                     if bibcode:
-                        source = add_source(snname, bibcode = bibcode)
+                        source = add_source(nedname, bibcode = bibcode)
                         sources = uniq_cdl([source, secondarysource])
                     else:
                         sources = secondarysource
 
-                    if name == snname:
+                    if name == nedname:
                         if redshift:
-                            add_quantity(snname, 'redshift', redshift, sources)
+                            add_quantity(nedname, 'redshift', redshift, sources)
                         if dist:
-                            add_quantity(snname, 'comovingdist', dist, sources)
+                            add_quantity(nedname, 'comovingdist', dist, sources)
                             if not redshift:
                                 try:
-                                    redshift = pretty_num(z_at_value(cosmo.comoving_distance, float(dist) * un.Mpc, zmax = 5.0), sig = get_sig_digits(str(dist)))
+                                    redshift = pretty_num(float(cosmo_redshift(float(dist), zmax = 5.0)), sig = get_sig_digits(str(dist)))
                                 except (KeyboardInterrupt, SystemExit):
                                     raise
                                 except:
                                     pass
                                 else:
                                     cosmosource = add_source(name, bibcode = '2015arXiv150201589P')
-                                    add_quantity(snname, 'redshift', redshift, uniq_cdl(sources.split(',') + [cosmosource])) 
+                                    add_quantity(nedname, 'redshift', redshift, uniq_cdl(sources.split(',') + [cosmosource])) 
 
                     if cleanhost:
-                        add_quantity(snname, 'host', cleanhost, sources)
+                        add_quantity(nedname, 'host', cleanhost, sources)
 
                     if args.update and olddistname != distname:
                         journal_events()
@@ -5306,8 +5971,13 @@ for task in tasks:
         jsontxt = load_cached_url("http://gsaweb.ast.cam.ac.uk/followup/list_of_alerts?format=json&num=100000&published=1&observed_only=1&hashtag=JG_530ad9462a0b8785bfb385614bf178c6",
             "../sne-external/CPCS/index.json")
         if not jsontxt:
-            continue
+            return
         alertindex = json.loads(jsontxt, object_pairs_hook=OrderedDict)
+        # Updates only go through alerts newer than the last one seen.
+        syncstate = load_sync_state('cpcs')
+        reconcile = not args.update or sync_reconcile(syncstate, args.reconcile)
+        if not reconcile:
+            alertindex = [x for x in alertindex if x["id"] > syncstate.get('maxid', -1)]
         ids = [x["id"] for x in alertindex]
     
         for i, ai in enumerate(tq(ids, currenttask)):
@@ -5345,9 +6015,9 @@ for task in tasks:
             if archived_task('cpcs') and os.path.isfile(fname):
                 with open(fname, 'r') as f:
                     jsonstr = f.read()
+                count_task('cachehits')
             else:
-                session = requests.Session()
-                response = session.get(alerturl + "&hashtag=JG_530ad9462a0b8785bfb385614bf178c6")
+                response = fetchsession.get(alerturl + "&hashtag=JG_530ad9462a0b8785bfb385614bf178c6")
                 with open(fname, 'w') as f:
                     jsonstr = response.text
                     f.write(jsonstr)
@@ -5368,6 +6038,9 @@ for task in tasks:
             if args.update:
                 journal_events()
         journal_events()
+        if ids:
+            syncstate['maxid'] = max([syncstate.get('maxid', -1)] + ids)
+        save_sync_state('cpcs', syncstate, reconciled = reconcile)
     
     if do_task(task, 'ptf'):
         #response = urllib.request.urlopen("http://wiserep.weizmann.ac.il/objects/list")
@@ -5384,14 +6057,14 @@ for task in tasks:
         if archived_task('ptf'):
             with open('../sne-external/PTF/update.html', 'r') as f:
                 html = f.read()
+            count_task('cachehits')
         else:
-            session = requests.Session()
-            response = session.get("http://wiserep.weizmann.ac.il/spectra/update")
+            response = fetchsession.get("http://wiserep.weizmann.ac.il/spectra/update")
             html = response.text
             with open('../sne-external/PTF/update.html', 'w') as f:
                 f.write(html)
     
-        bs = BeautifulSoup(html, "html5lib")
+        bs = parse_html(html, 'select', {"name":"objid"})
         select = bs.find('select', {"name":"objid"})
         options = select.findAll('option')
         for option in options:
@@ -5434,9 +6107,9 @@ for task in tasks:
     if do_task(task, 'des'):
         html = load_cached_url("https://portal.nersc.gov/des-sn/transients/", "../sne-external/DES/transients.html")
         if not html:
-            continue
-        bs = BeautifulSoup(html, "html5lib")
-        trs = bs.find('tbody').findAll('tr')
+            return
+        bs = parse_html(html)
+        trs = tbody_rows(bs)
         for tri, tr in enumerate(tq(trs, currenttask)):
             name = ''
             source = ''
@@ -5484,8 +6157,8 @@ for task in tasks:
     if do_task(task, 'asassn'):
         html = load_cached_url("http://www.astronomy.ohio-state.edu/~assassin/sn_list.html", "../sne-external/ASASSN/sn_list.html")
         if not html:
-            continue
-        bs = BeautifulSoup(html, "html5lib")
+            return
+        bs = parse_html(html)
         trs = bs.find('table').findAll('tr')
         for tri, tr in enumerate(tq(trs, currenttask)):
             name = ''
@@ -5560,8 +6233,8 @@ for task in tasks:
     if do_task(task, 'asiagospectra'):
         html = load_cached_url("http://sngroup.oapd.inaf.it./cgi-bin/output_class.cgi?sn=1990", "../sne-external-spectra/Asiago/spectra.html")
         if not html:
-            continue
-        bs = BeautifulSoup(html, "html5lib")
+            return
+        bs = parse_html(html)
         trs = bs.findAll('tr')
         for tr in tq(trs, currenttask):
             tds = tr.findAll('td')
@@ -5673,167 +6346,77 @@ for task in tasks:
                                  'stt1839':''}
     
         oldname = ''
-        for folder in tq(sorted(next(os.walk("../sne-external-WISEREP"))[1], key=lambda s: s.lower()), currenttask):
-            files = glob("../sne-external-WISEREP/" + folder + '/*')
-            for fname in tq(files, currenttask):
-                if '.html' in fname:
-                    lfiles = deepcopy(files)
-                    with open(fname, 'r') as f:
-                        path = os.path.abspath(fname)
-                        response = urllib.request.urlopen('file://' + path)
-                        bs = BeautifulSoup(response, "html5lib")
-                        trs = bs.findAll('tr', {'valign': 'top'})
-                        for tri, tr in enumerate(trs):
-                            if "Click to show/update object" in str(tr.contents):
-                                claimedtype = ''
-                                instrument = ''
-                                epoch = ''
-                                observer = ''
-                                reducer = ''
-                                specfile = ''
-                                produceoutput = True
-                                specpath = ''
-                                tds = tr.findAll('td')
-                                for tdi, td in enumerate(tds):
-                                    if td.contents:
-                                        if tdi == 3:
-                                            name = re.sub('<[^<]+?>', '', str(td.contents[0])).strip()
-                                        elif tdi == 5:
-                                            claimedtype = re.sub('<[^<]+?>', '', str(td.contents[0])).strip()
-                                            if claimedtype == 'SN':
-                                                claimedtype = ''
-                                                continue
-                                            if claimedtype[:3] == 'SN ':
-                                                claimedtype = claimedtype[3:].strip()
-                                            claimedtype = claimedtype.replace('-like', '').strip()
-                                        elif tdi == 9:
-                                            instrument = re.sub('<[^<]+?>', '', str(td.contents[0])).strip()
-                                        elif tdi == 11:
-                                            epoch = re.sub('<[^<]+?>', '', str(td.contents[0])).strip()
-                                        elif tdi == 13:
-                                            observer = re.sub('<[^<]+?>', '', str(td.contents[0])).strip()
-                                            if observer == 'Unknown' or observer == 'Other':
-                                                observer = ''
-                                        elif tdi == 17:
-                                            reducer = re.sub('<[^<]+?>', '', str(td.contents[0])).strip()
-                                            if reducer == 'Unknown' or reducer == 'Other':
-                                                reducer = ''
-                                        elif tdi == 25:
-                                            speclinks = td.findAll('a')
-                                            try:
-                                                for link in speclinks:
-                                                    if 'Ascii' in link['href']:
-                                                        specfile = link.contents[0].strip()
-                                                        tfiles = deepcopy(lfiles)
-                                                        for fi, fname in enumerate(lfiles):
-                                                            if specfile in fname:
-                                                                specpath = fname
-                                                                del(tfiles[fi])
-                                                                lfiles = deepcopy(tfiles)
-                                                                raise(StopIteration)
-                                            except (KeyboardInterrupt, SystemExit):
-                                                raise
-                                            except StopIteration:
-                                                pass
-                                            #if not specpath:
-                                            #    warnings.warn('Spectrum file not found, "' + specfile + '"')
-                                        else:
-                                            continue
-                            if "Spec Type:</span>" in str(tr.contents) and produceoutput:
-                                produceoutput = False
-    
-                                trstr = str(tr)
-                                result = re.search('redshift=(.*?)&amp;', trstr)
-                                redshift = ''
-                                if result:
-                                    redshift = result.group(1)
-                                    if not is_number(redshift) or float(redshift) > 100.:
-                                        redshift = ''
-    
-                                result = re.search('publish=(.*?)&amp;', trstr)
-                                bibcode = ''
-                                if result:
-                                    bibcode = unescape(urllib.parse.unquote(urllib.parse.unquote(result.group(1))).split('/')[-1])
-    
-                                if not bibcode:
-                                    biblink = tr.find('a', {'title': 'Link to NASA ADS'})
-                                    if biblink:
-                                        bibcode = biblink.contents[0]
-    
-                                if name.startswith('sn'):
-                                    name = 'SN' + name[2:]
-                                if name.startswith(('CSS', 'SSS', 'MLS')) and ':' not in name:
-                                    name = name.replace('-', ':', 1)
-                                if name.startswith('MASTERJ'):
-                                    name = name.replace('MASTERJ', 'MASTER OT J')
-                                if name.startswith('PSNJ'):
-                                    name = name.replace('PSNJ', 'PSN J')
-                                name = get_preferred_name(name)
-                                if oldname and name != oldname:
-                                    journal_events()
-                                oldname = name
-    
-                                #print(name + " " + claimedtype + " " + epoch + " " + observer + " " + reducer + " " + specfile + " " + bibcode + " " + redshift)
-    
-                                (name, secondarysource) = new_event(name, refname = secondaryreference, url = secondaryrefurl, bibcode = secondarybibcode, secondary = True)
-                                if bibcode:
-                                    newbibcode = bibcode
-                                    if bibcode in wiserepbibcorrectdict:
-                                        newbibcode = wiserepbibcorrectdict[bibcode]
-                                    if newbibcode:
-                                        source = add_source(name, bibcode = unescape(newbibcode))
-                                    else:
-                                        source = add_source(name, refname = unescape(bibcode))
-                                    sources = uniq_cdl([source, secondarysource])
-                                else:
-                                    sources = secondarysource
-    
-                                if claimedtype not in ['Other']:
-                                    add_quantity(name, 'claimedtype', claimedtype, secondarysource)
-                                add_quantity(name, 'redshift', redshift, secondarysource)
-    
-                                if not specpath:
-                                    continue
-    
-                                with open(specpath,'r') as f:
-                                    data = [x.split() for x in f]
-    
-                                    skipspec = False
-                                    newdata = []
-                                    oldval = ''
-                                    for row in data:
-                                        if row and '#' not in row[0]:
-                                            if len(row) >= 2 and is_number(row[0]) and is_number(row[1]) and row[1] != oldval:
-                                                newdata.append(row)
-                                                oldval = row[1]
-    
-                                    if skipspec or not newdata:
-                                        warnings.warn('Skipped adding spectrum file ' + specfile)
-                                        continue
-    
-                                    data = [list(i) for i in zip(*newdata)]
-                                    wavelengths = data[0]
-                                    fluxes = data[1]
-                                    errors = ''
-                                    if len(data) == 3:
-                                        errors = data[1]
-                                    time = str(astrotime(epoch).mjd)
-    
-                                    if max([float(x) for x in fluxes]) < 1.0e-5:
-                                        fluxunit = 'erg/s/cm^2/Angstrom'
-                                    else:
-                                        fluxunit = 'Uncalibrated'
-    
-                                    add_spectrum(name = name, waveunit = 'Angstrom', fluxunit = fluxunit, errors = errors, errorunit = fluxunit, wavelengths = wavelengths,
-                                        fluxes = fluxes, u_time = 'MJD', time = time, instrument = instrument, source = sources, observer = observer, reducer = reducer,
-                                        filename = specfile)
-                                    wiserepcnt = wiserepcnt + 1
-    
-                                    if args.travis and wiserepcnt % travislimit == 0:
-                                        break
-    
-                    tprint('Unadded files: ' + str(len(lfiles) - 1) + "/" + str(len(files)-1))
-                    tprint('WISeREP spectrum count: ' + str(wiserepcnt))
+        for folder in tq(sorted(next(os.walk(wiserepdir))[1], key=lambda s: s.lower()), currenttask):
+            files = glob(wiserepdir + '/' + folder + '/*')
+            manifest = load_wiserep_manifest(folder)
+            hashes = hash_wiserep_files(files, manifest)
+            if hashes != manifest.get('hashes'):
+                manifest = update_wiserep_manifest(folder, files, hashes, manifest)
+                save_wiserep_manifest(folder, manifest)
+            for index in tq(manifest['indexes'], currenttask):
+                for row in manifest['indexes'][index]['rows']:
+                    name = row['name']
+                    if name.startswith('sn'):
+                        name = 'SN' + name[2:]
+                    if name.startswith(('CSS', 'SSS', 'MLS')) and ':' not in name:
+                        name = name.replace('-', ':', 1)
+                    if name.startswith('MASTERJ'):
+                        name = name.replace('MASTERJ', 'MASTER OT J')
+                    if name.startswith('PSNJ'):
+                        name = name.replace('PSNJ', 'PSN J')
+                    name = get_preferred_name(name)
+                    if oldname and name != oldname:
+                        journal_events()
+                    oldname = name
+
+                    (name, secondarysource) = new_event(name, refname = secondaryreference, url = secondaryrefurl, bibcode = secondarybibcode, secondary = True)
+                    bibcode = row['bibcode']
+                    if bibcode:
+                        newbibcode = bibcode
+                        if bibcode in wiserepbibcorrectdict:
+                            newbibcode = wiserepbibcorrectdict[bibcode]
+                        if newbibcode:
+                            source = add_source(name, bibcode = unescape(newbibcode))
+                        else:
+                            source = add_source(name, refname = unescape(bibcode))
+                        sources = uniq_cdl([source, secondarysource])
+                    else:
+                        sources = secondarysource
+
+                    if row['claimedtype'] not in ['Other']:
+                        add_quantity(name, 'claimedtype', row['claimedtype'], secondarysource)
+                    add_quantity(name, 'redshift', row['redshift'], secondarysource)
+
+                    if not row['specpath']:
+                        continue
+
+                    data = manifest['spectra'][row['specpath']]
+                    if not data:
+                        warnings.warn('Skipped adding spectrum file ' + row['specfile'])
+                        continue
+
+                    wavelengths = data[0]
+                    fluxes = data[1]
+                    errors = ''
+                    if len(data) == 3:
+                        errors = data[1]
+                    time = str(astrotime(row['epoch']).mjd)
+
+                    if max([float(x) for x in fluxes]) < 1.0e-5:
+                        fluxunit = 'erg/s/cm^2/Angstrom'
+                    else:
+                        fluxunit = 'Uncalibrated'
+
+                    add_spectrum(name = name, waveunit = 'Angstrom', fluxunit = fluxunit, errors = errors, errorunit = fluxunit, wavelengths = wavelengths,
+                        fluxes = fluxes, u_time = 'MJD', time = time, instrument = row['instrument'], source = sources, observer = row['observer'],
+                        reducer = row['reducer'], filename = row['specfile'])
+                    wiserepcnt = wiserepcnt + 1
+
+                    if args.travis and wiserepcnt % travislimit == 0:
+                        break
+
+                tprint('Unadded files: ' + str(manifest['indexes'][index]['unadded']) + "/" + str(len(files)-1))
+                tprint('WISeREP spectrum count: ' + str(wiserepcnt))
         journal_events()
     
     if do_task(task, 'cfaspectra'): 
@@ -5853,7 +6436,9 @@ for task in tasks:
             reference = 'CfA Supernova Archive'
             refurl = 'https://www.cfa.harvard.edu/supernova/SNarchive.html'
             (name, source) = new_event(name, refname = reference, url = refurl, secondary = True, acknowledgment = cfaack)
-            for fi, fname in enumerate(sorted(glob(fullpath + '/*'), key=lambda s: s.lower())):
+            fnames = sorted(glob(fullpath + '/*'), key=lambda s: s.lower())
+            spectra = read_spectrum_files(fnames)
+            for fi, (fname, (data, header)) in enumerate(zip(fnames, spectra)):
                 filename = os.path.basename(fname)
                 fileparts = filename.split('-')
                 if origname.startswith("sn") and is_number(origname[2:6]):
@@ -5867,17 +6452,15 @@ for task in tasks:
                     day = fileparts[2][6:]
                     instrument = fileparts[3].split('.')[0]
                 time = str(astrotime(year + '-' + month + '-' + str(floor(float(day))).zfill(2)).mjd + float(day) - floor(float(day)))
-                f = open(fname,'r')
-                data = csv.reader(f, delimiter=' ', skipinitialspace=True)
-                data = [list(i) for i in zip(*data)]
                 wavelengths = data[0]
                 fluxes = data[1]
-                errors = data[2]
+                errors = data[2] if len(data) > 2 else ''
                 sources = uniq_cdl([source, add_source(name, bibcode = '2012AJ....143..126B'), add_source(name, bibcode = '2008AJ....135.1598M')])
                 add_spectrum(name = name, waveunit = 'Angstrom', fluxunit = 'erg/s/cm^2/Angstrom', filename = filename,
                     wavelengths = wavelengths, fluxes = fluxes, u_time = 'MJD' if time else '', time = time, instrument = instrument,
                     errorunit = "ergs/s/cm^2/Angstrom", errors = errors, source = sources, dereddened = False, deredshifted = False)
                 if args.travis and fi >= travislimit:
+                    spectra.close()
                     break
         journal_events()
     
@@ -5894,7 +6477,9 @@ for task in tasks:
             reference = 'CfA Supernova Archive'
             refurl = 'https://www.cfa.harvard.edu/supernova/SNarchive.html'
             (name, source) = new_event(name, refname = reference, url = refurl, secondary = True, acknowledgment = cfaack)
-            for fi, fname in enumerate(sorted(glob(fullpath + '/*'), key=lambda s: s.lower())):
+            fnames = sorted(glob(fullpath + '/*'), key=lambda s: s.lower())
+            spectra = read_spectrum_files(fnames)
+            for fi, (fname, (data, header)) in enumerate(zip(fnames, spectra)):
                 filename = os.path.basename(fname)
                 fileparts = filename.split('-')
                 instrument = ''
@@ -5904,9 +6489,6 @@ for task in tasks:
                 if len(fileparts) > 2:
                     instrument = fileparts[-1].split('.')[0]
                 time = str(astrotime(year + '-' + month + '-' + str(floor(float(day))).zfill(2)).mjd + float(day) - floor(float(day)))
-                f = open(fname,'r')
-                data = csv.reader(f, delimiter=' ', skipinitialspace=True)
-                data = [list(i) for i in zip(*data)]
                 wavelengths = data[0]
                 fluxes = data[1]
                 sources = uniq_cdl([source, add_source(name, bibcode = '2014AJ....147...99M')])
@@ -5914,6 +6496,7 @@ for task in tasks:
                     fluxes = fluxes, u_time = 'MJD' if time else '', time = time, instrument = instrument, source = sources,
                     dereddened = False, deredshifted = False)
                 if args.travis and fi >= travislimit:
+                    spectra.close()
                     break
         journal_events()
 
@@ -5930,13 +6513,12 @@ for task in tasks:
             reference = 'CfA Supernova Archive'
             refurl = 'https://www.cfa.harvard.edu/supernova/SNarchive.html'
             (name, source) = new_event(name, refname = reference, url = refurl, secondary = True, acknowledgment = cfaack)
-            for fi, fname in enumerate(sorted(glob(fullpath + '/*'), key=lambda s: s.lower())):
-                if not os.path.isfile(fname):
-                    continue
+            fnames = [(fi, x) for fi, x in enumerate(sorted(glob(fullpath + '/*'), key=lambda s: s.lower())) if os.path.isfile(x) and
+                os.path.basename(x).startswith('sn') and x.endswith('flm') and
+                not any(y in os.path.basename(x) for y in ['-interp', '-z', '-dered', '-obj', '-gal'])]
+            spectra = read_spectrum_files([x[1] for x in fnames])
+            for (fi, fname), (data, header) in zip(fnames, spectra):
                 filename = os.path.basename(fname)
-                if (not filename.startswith('sn') or not filename.endswith('flm') or
-                    any(x in filename for x in ['-interp', '-z', '-dered', '-obj', '-gal'])):
-                    continue
                 fileparts = filename.split('.')[0].split('-')
                 instrument = ''
                 time = ''
@@ -5948,28 +6530,27 @@ for task in tasks:
                         if len(fileparts) > 2:
                             instrument = fileparts[-1]
                         time = str(astrotime(year + '-' + month + '-' + str(floor(float(day))).zfill(2)).mjd + float(day) - floor(float(day)))
-                f = open(fname,'r')
-                data = csv.reader(f, delimiter=' ', skipinitialspace=True)
-                data = [list(i) for i in zip(*data)]
                 wavelengths = data[0]
                 fluxes = [str(Decimal(x)*Decimal(1.0e-15)) for x in data[1]]
                 add_spectrum(name = name, waveunit = 'Angstrom', fluxunit = 'erg/s/cm^2/Angstrom', wavelengths = wavelengths, filename = filename,
                     fluxes = fluxes, u_time = 'MJD' if time else '', time = time, instrument = instrument, source = source,
                     dereddened = False, deredshifted = False)
                 if args.travis and fi >= travislimit:
+                    spectra.close()
                     break
         journal_events()
     
     if do_task(task, 'snlsspectra'): 
-        result = Vizier.get_catalogs("J/A+A/507/85/table1")
-        table = result[list(result.keys())[0]]
+        table = get_vizier_table("J/A+A/507/85/table1")
         table.convert_bytestring_to_unicode(python3_only=True)
         datedict = {}
         for row in table:
             datedict['SNLS-' + row['SN']] = str(astrotime(row['Date']).mjd)
     
         oldname = ''
-        for fi, fname in enumerate(tq(sorted(glob('../sne-external-spectra/SNLS/*'), key=lambda s: s.lower()), currenttask = currenttask)):
+        fnames = sorted(glob('../sne-external-spectra/SNLS/*'), key=lambda s: s.lower())
+        spectra = read_spectrum_files(fnames, skiprows = 14, comment = '@')
+        for fi, (fname, (specdata, header)) in enumerate(zip(tq(fnames, currenttask = currenttask), spectra)):
             filename = os.path.basename(fname)
             fileparts = filename.split('_')
             name = 'SNLS-' + fileparts[1]
@@ -5981,18 +6562,11 @@ for task in tasks:
     
             add_quantity(name, 'discoverdate', '20' + fileparts[1][:2], source)
     
-            f = open(fname,'r')
-            data = csv.reader(f, delimiter=' ', skipinitialspace=True)
-            specdata = []
-            for r, row in enumerate(data):
+            for row in header:
                 if row[0] == '@TELESCOPE':
                     telescope = row[1].strip()
                 elif row[0] == '@REDSHIFT':
                     add_quantity(name, 'redshift', row[1].strip(), source)
-                if r < 14:
-                    continue
-                specdata.append(list(filter(None, [x.strip(' \t') for x in row])))
-            specdata = [list(i) for i in zip(*specdata)]
             wavelengths = specdata[1]
             
             fluxes = [pretty_num(float(x)*1.e-16, sig = get_sig_digits(x)) for x in specdata[2]]
@@ -6002,17 +6576,18 @@ for task in tasks:
                 fluxes = fluxes, u_time = 'MJD' if name in datedict else '', time = datedict[name] if name in datedict else '', telescope = telescope, source = source,
                 filename = filename)
             if args.travis and fi >= travislimit:
+                spectra.close()
                 break
         journal_events()
     
     if do_task(task, 'cspspectra'): 
         oldname = ''
-        for fi, fname in enumerate(tq(sorted(glob('../sne-external-spectra/CSP/*'), key=lambda s: s.lower()), currenttask = currenttask)):
+        fnames = [(fi, x) for fi, x in enumerate(sorted(glob('../sne-external-spectra/CSP/*'), key=lambda s: s.lower()))
+            if os.path.basename(x).split('.')[1] != 'txt']
+        spectra = read_spectrum_files([x[1] for x in fnames], skiprows = 7, comment = '#')
+        for (fi, fname), (specdata, header) in zip(tq(fnames, currenttask = currenttask), spectra):
             filename = os.path.basename(fname)
-            sfile = filename.split('.')
-            if sfile[1] == 'txt':
-                continue
-            sfile = sfile[0]
+            sfile = filename.split('.')[0]
             fileparts = sfile.split('_')
             name = 'SN20' + fileparts[0][2:]
             name = get_preferred_name(name)
@@ -6023,25 +6598,19 @@ for task in tasks:
             instrument = fileparts[-1]
             (name, source) = new_event(name, bibcode = "2013ApJ...773...53F")
     
-            f = open(fname,'r')
-            data = csv.reader(f, delimiter=' ', skipinitialspace=True)
-            specdata = []
-            for r, row in enumerate(data):
+            for row in header:
                 if row[0] == '#JDate_of_observation:':
                     jd = row[1].strip()
                     time = str(jd_to_mjd(Decimal(jd)))
                 elif row[0] == '#Redshift:':
                     add_quantity(name, 'redshift', row[1].strip(), source)
-                if r < 7:
-                    continue
-                specdata.append(list(filter(None, [x.strip(' ') for x in row])))
-            specdata = [list(i) for i in zip(*specdata)]
             wavelengths = specdata[0]
             fluxes = specdata[1]
     
             add_spectrum(name = name, u_time = 'MJD', time = time, waveunit = 'Angstrom', fluxunit = 'erg/s/cm^2/Angstrom', wavelengths = wavelengths,
                 fluxes = fluxes, telescope = telescope, instrument = instrument, source = source, deredshifted = True, filename = filename)
             if args.travis and fi >= travislimit:
+                spectra.close()
                 break
         journal_events()
     
@@ -6054,7 +6623,7 @@ for task in tasks:
         jsontxt = load_cached_url("http://heracles.astro.berkeley.edu/sndb/download?id=allpubspec",
             '../sne-external-spectra/UCB/allpub.json')
         if not jsontxt:
-            continue
+            return
     
         spectra = json.loads(jsontxt)
         spectra = sorted(spectra, key = lambda k: k['ObjName'])
@@ -6100,9 +6669,9 @@ for task in tasks:
             if archived_task('ucbspectra') and os.path.isfile(filepath):
                 with open(filepath, 'r') as f:
                     spectxt = f.read()
+                count_task('cachehits')
             else:
-                session = requests.Session()
-                response = session.get("http://heracles.astro.berkeley.edu/sndb/download?id=ds:" + str(spectrum["SpecID"]))
+                response = fetchsession.get("http://heracles.astro.berkeley.edu/sndb/download?id=ds:" + str(spectrum["SpecID"]))
                 spectxt = response.text
                 with open(filepath, 'w') as f:
                     f.write(spectxt)
@@ -6168,7 +6737,9 @@ for task in tasks:
                 secondarybibcode = "2001AAS...199.8408R"
                 (name, secondarysource) = new_event(name, refname = secondaryreference, url = secondaryrefurl, bibcode = secondarybibcode, secondary = True)
                 eventspectra = next(os.walk('../sne-external-spectra/Suspect/'+folder+'/'+eventfolder))[2]
-                for spectrum in eventspectra:
+                specpaths = ['../sne-external-spectra/Suspect/'+folder+'/'+eventfolder+'/'+x for x in eventspectra]
+                spectra = read_spectrum_files(specpaths, comment = '')
+                for spectrum, (specdata, header) in zip(eventspectra, spectra):
                     sources = [secondarysource]
                     bibcode = ''
                     if spectrum in changedict:
@@ -6191,19 +6762,10 @@ for task in tasks:
                     sig = get_sig_digits(day) + 5
                     time = pretty_num(astrotime(year + '-' + month + '-' + str(floor(float(day))).zfill(2)).mjd + float(day) - floor(float(day)), sig = sig)
     
-                    with open('../sne-external-spectra/Suspect/'+folder+'/'+eventfolder+'/'+spectrum) as f:
-                        specdata = list(csv.reader(f, delimiter=' ', skipinitialspace=True))
-                        specdata = list(filter(None, specdata))
-                        newspec = []
-                        oldval = ''
-                        for row in specdata:
-                            if row[1] == oldval:
-                                continue
-                            newspec.append(row)
-                            oldval = row[1]
-                        specdata = newspec
-                    haserrors = len(specdata[0]) == 3 and specdata[0][2] and specdata[0][2] != 'NaN'
-                    specdata = [list(i) for i in zip(*specdata)]
+                    # Drop rows repeating the flux of the row before.
+                    keep = [i for i, x in enumerate(specdata[1]) if not i or x != specdata[1][i - 1]]
+                    specdata = [[x[i] for i in keep] for x in specdata]
+                    haserrors = len(specdata) == 3 and specdata[2][0] and specdata[2][0] != 'NaN'
     
                     wavelengths = specdata[0]
                     fluxes = specdata[1]
@@ -6215,6 +6777,7 @@ for task in tasks:
                         fluxes = fluxes, errors = errors, errorunit = 'Uncalibrated', source = sources, filename = spectrum)
                     suspectcnt = suspectcnt + 1
                     if args.travis and suspectcnt % travislimit == 0:
+                        spectra.close()
                         break
         journal_events()
     
@@ -6237,12 +6800,9 @@ for task in tasks:
             source = add_source(name, bibcode = bibcode)
             sources = uniq_cdl([source,secondarysource])
             eventspectra = glob('../sne-external-spectra/SNFactory/'+eventfolder+'/*.dat')
-            for spectrum in eventspectra:
+            spectra = read_spectrum_files(eventspectra)
+            for spectrum, (specdata, header) in zip(eventspectra, spectra):
                 filename = os.path.basename(spectrum)
-                with open(spectrum) as f:
-                    specdata = list(csv.reader(f, delimiter=' ', skipinitialspace=True))
-                specdata = list(filter(None, specdata))
-                newspec = []
                 time = ''
                 telescope = ''
                 instrument = ''
@@ -6256,35 +6816,30 @@ for task in tasks:
                     time = pretty_num(astrotime('2005-11-25').mjd, sig = 5)
                 elif 'Spectrum05_336' in spectrum:
                     time = pretty_num(astrotime('2005-12-02').mjd, sig = 5)
-                for row in specdata:
-                    if row[0][0] == '#':
-                        joinrow = (' '.join(row)).split('=')
-                        if len(joinrow) < 2:
-                            continue
-                        field = joinrow[0].strip('# ')
-                        value = joinrow[1].split('/')[0].strip("' ")
-                        if not time:
-                            if field == 'JD':
-                                time = str(jd_to_mjd(Decimal(value)))
-                            elif field == 'MJD':
-                                time = value
-                            elif field == 'MJD-OBS':
-                                time = value
-                        if field == 'OBSERVER':
-                            observer = value.capitalize()
-                        if field == 'OBSERVAT':
-                            observatory = value.capitalize()
-                        if field == 'TELESCOP':
-                            telescope = value.capitalize()
-                        if field == 'INSTRUME':
-                            instrument = value.capitalize()
-                    else:
-                        newspec.append(row)
+                for row in header:
+                    joinrow = (' '.join(row)).split('=')
+                    if len(joinrow) < 2:
+                        continue
+                    field = joinrow[0].strip('# ')
+                    value = joinrow[1].split('/')[0].strip("' ")
+                    if not time:
+                        if field == 'JD':
+                            time = str(jd_to_mjd(Decimal(value)))
+                        elif field == 'MJD':
+                            time = value
+                        elif field == 'MJD-OBS':
+                            time = value
+                    if field == 'OBSERVER':
+                        observer = value.capitalize()
+                    if field == 'OBSERVAT':
+                        observatory = value.capitalize()
+                    if field == 'TELESCOP':
+                        telescope = value.capitalize()
+                    if field == 'INSTRUME':
+                        instrument = value.capitalize()
                 if not time:
                     raise(ValueError('Time missing from spectrum.'))
-                specdata = newspec
-                haserrors = len(specdata[0]) == 3 and specdata[0][2] and specdata[0][2] != 'NaN'
-                specdata = [list(i) for i in zip(*specdata)]
+                haserrors = len(specdata) == 3 and specdata[2][0] and specdata[2][0] != 'NaN'
     
                 wavelengths = specdata[0]
                 fluxes = specdata[1]
@@ -6298,6 +6853,7 @@ for task in tasks:
                     errorunit = ('Variance' if name == 'SN2011fe' else 'erg/s/cm^2/Angstrom'), source = sources, filename = filename)
                 snfcnt = snfcnt + 1
                 if args.travis and snfcnt % travislimit == 0:
+                    spectra.close()
                     break
         journal_events()
     
@@ -6337,13 +6893,7 @@ for task in tasks:
                 source = add_source(name, refname = 'Superfit', url = 'http://www.dahowell.com/superfit.html', secondary = True)
                 add_quantity(name, 'alias', oldname, source)
     
-                with open(sffile) as f:
-                    rows = f.read().splitlines()
-                specdata = []
-                for row in rows:
-                    if row.strip():
-                        specdata.append(list(filter(None,re.split('\t+|\s+', row, maxsplit=0))))
-                specdata = [[x.replace('D','E') for x in list(i)] for i in zip(*specdata)]
+                specdata = [[x.replace('D','E') for x in i] for i in read_spectrum_file(sffile, comment = '')[0]]
                 wavelengths = specdata[0]
                 fluxes = specdata[1]
     
@@ -6363,14 +6913,51 @@ for task in tasks:
     if do_task(task, 'setprefnames'):
         set_preferred_names()
 
-files = repo_file_list()
+    journal_events(clear = False, flush = True)
+    end_task_report()
 
-path = '../bibauthors.json'
-if os.path.isfile(path):
-    with open(path, 'r') as f:
-        bibauthordict = json.loads(f.read(), object_pairs_hook=OrderedDict)
-else:
-    bibauthordict = OrderedDict()
+for task in tasks:
+    if (args.jobs > 1 or args.sharddir) and has_task(task) and not tasks[task].get('inprocess', False):
+        if task not in taskjobs:
+            start_task_workers(task)
+        # The wait for the worker isn't counted, its own times come back with its delta.
+        delta = taskjobs[task] if task in reusedshards else taskjobs[task].get()
+        start_task_report(task)
+        merge_task_delta(task, delta)
+        journal_events(clear = False, flush = True)
+        end_task_report()
+    elif args.sharddir and has_task(task) and task in taskinputs:
+        run_shard_task(task)
+    else:
+        import_task(task)
+
+if taskpool is not None:
+    taskpool.close()
+    taskpool.join()
+if taskdir and not args.sharddir:
+    os.rmdir(taskdir)
+
+# Everything after the tasks (author lookups, the derive pass and the caches written after it).
+set_fetch_task('derive')
+start_task_report('derive', children = True)
+
+files = repo_file_list()
+if args.travis:
+    files = files[:travislimit + 2]
+
+bibauthordict = load_bib_authors('../bibauthors.json')
+# Authors of all the bibcodes the pass will need, those added this run and those already in the
+# event files, are fetched together rather than event by event. The bibcodes of the files are kept
+# in the stub index, so only files changed since it was written are read again.
+read_stub_index()
+stalefiles = [x for x in files if stub_entry_stale(x)]
+with ThreadPoolExecutor(max_workers = 8) as pool:
+    for (fi, entry) in zip(stalefiles, tq(pool.map(scan_stub_entry, stalefiles), 'Collecting bibcodes of event sources',
+        total = len(stalefiles))):
+        merge_stub_index({fi: entry})
+for fi in files:
+    sourcebibcodes.update([clean_bibcode(x) for x in stubindex[fi]['bibcode']])
+resolve_bib_authors(sorted(sourcebibcodes), bibauthordict, '../bibauthors.json', url = args.adsurl)
 path = '../extinctions.json'
 if os.path.isfile(path):
     with open(path, 'r') as f:
@@ -6378,23 +6965,147 @@ if os.path.isfile(path):
 else:
     extinctionsdict = OrderedDict()
 
-for i, fi in enumerate(tq(files, 'Sanitizing and deriving quantities for events')):
+# Event files are independent in this pass except for the author and extinction caches. With --jobs
+# the files are shared out to worker processes, largest first, and the caches are backed by a store
+# the workers share so that each bibcode or event is only looked up once: a worker that doesn't find
+# a key claims it before looking it up, and any other worker wanting it waits for the claim to be
+# filled (or given up once the claimant is done with its file). The entries each file used that
+# weren't cached before the pass are sent back and merged in file order, as a serial pass would.
+class SharedCache(OrderedDict):
+    def __init__(self, cache, store, claims, lock):
+        super().__init__()
+        for (key, value) in cache.items():
+            super().__setitem__(key, value)
+        self.store = store
+        self.claims = claims
+        self.lock = lock
+        self.claimed = set()
+        self.added = set()
+        self.used = []
+
+    def __contains__(self, key):
+        if not super().__contains__(key):
+            if not self.claim(key):
+                return False
+        if key in self.added and key not in self.used:
+            self.used.append(key)
+        return True
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        with self.lock:
+            self.store[key] = value
+            self.claims.pop(key, None)
+        self.claimed.discard(key)
+        self.added.add(key)
+        if key not in self.used:
+            self.used.append(key)
+
+    # Takes the key from the store if another worker has filled it, otherwise claims it for this
+    # worker (returning False) once no other worker holds it.
+    def claim(self, key):
+        while True:
+            with self.lock:
+                if key in self.store:
+                    super().__setitem__(key, self.store[key])
+                    self.added.add(key)
+                    return True
+                if self.claims.get(key, os.getpid()) == os.getpid():
+                    self.claims[key] = os.getpid()
+                    self.claimed.add(key)
+                    return False
+            sleep(0.05)
+
+    def release_claims(self):
+        with self.lock:
+            for key in self.claimed:
+                self.claims.pop(key, None)
+        self.claimed.clear()
+
+def derive_event_file(fi):
+    global events
     events = OrderedDict()
+    aliasindex.clear()
+    photoindex.clear()
+    sourceindex.clear()
+    dirtyevents.clear()
+    eventpaths.clear()
+    eventsizes.clear()
+    eventuse.clear()
     name = os.path.basename(os.path.splitext(fi)[0]).replace('.json', '')
     name = add_event(name, loadifempty = False)
     derive_and_sanitize()
     if has_task('writeevents'): 
         write_all_events(empty = True, gz = True, bury = True)
-    if args.travis and i > travislimit:
-        break
+
+def start_derive_worker(bibstore, extinctionstore, claims, lock):
+    global bibauthordict, extinctionsdict
+    bibauthordict = SharedCache(bibauthordict, bibstore, claims['bibauthors'], lock)
+    extinctionsdict = SharedCache(extinctionsdict, extinctionstore, claims['extinctions'], lock)
+
+def derive_worker(fi):
+    global gitqueue
+    bibauthordict.used = []
+    extinctionsdict.used = []
+    gitqueue = []
+    reset_task_counts()
+    try:
+        derive_event_file(fi)
+    finally:
+        # Lookups that failed leave their keys for other workers to try.
+        bibauthordict.release_claims()
+        extinctionsdict.release_claims()
+    return (fi, [(x, bibauthordict[x]) for x in bibauthordict.used], [(x, extinctionsdict[x]) for x in extinctionsdict.used],
+        [(x, stubindex[x]) for x in set(eventpaths.values()) if x in stubindex], gitqueue, task_counts())
+
+def derive_event_files(files):
+    if args.jobs < 2 or len(files) < 2:
+        for fi in tq(files, 'Sanitizing and deriving quantities for events'):
+            derive_event_file(fi)
+        return
+    manager = multiprocessing.Manager()
+    pool = multiprocessing.get_context('fork').Pool(min(args.jobs, len(files)), initializer = start_derive_worker,
+        initargs = (manager.dict(), manager.dict(), {'bibauthors': manager.dict(), 'extinctions': manager.dict()}, manager.Lock()))
+    bysize = sorted(files, key = lambda x: os.path.getsize(x), reverse = True)
+    results = {}
+    for result in tq(pool.imap_unordered(derive_worker, bysize, chunksize = 8), 'Sanitizing and deriving quantities for events', total = len(files)):
+        results[result[0]] = result
+    pool.close()
+    pool.join()
+    manager.shutdown()
+    for fi in files:
+        (fi, bibentries, extinctionentries, stubentries, gitcommands, counts) = results[fi]
+        merge_task_report('derive', counts, counterkeys)
+        for (key, value) in bibentries:
+            if key not in bibauthordict:
+                bibauthordict[key] = value
+        for (key, value) in extinctionentries:
+            if key not in extinctionsdict:
+                extinctionsdict[key] = value
+        merge_stub_index(stubentries)
+        for gitcommand in gitcommands:
+            os.system(gitcommand)
+
+derive_event_files(files)
+
+save_stub_index()
 
 jsonstring = json.dumps(bibauthordict, indent='\t', separators=(',', ':'), ensure_ascii=False)
-with codecs.open('../bibauthors.json', 'w', encoding='utf8') as f:
+# The journal only goes once the authors it holds are safely in place.
+with codecs.open('../bibauthors.json.' + str(os.getpid()), 'w', encoding='utf8') as f:
     f.write(jsonstring)
+os.replace('../bibauthors.json.' + str(os.getpid()), '../bibauthors.json')
+clear_bib_journal('../bibauthors.json')
 jsonstring = json.dumps(extinctionsdict, indent='\t', separators=(',', ':'), ensure_ascii=False)
 with codecs.open('../extinctions.json', 'w', encoding='utf8') as f:
     f.write(jsonstring)
 
-print("Memory used (MBs on Mac, GBs on Linux): " + "{:,}".format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024./1024.))
+end_task_report()
+for line in run_report_table():
+    tprint(line)
+if args.runreport:
+    write_run_report(args.runreport, vars(args))
+
+print("Peak memory used (MB): " + "{:,.1f}".format(maxrss_bytes()/1.e6))
 
 sys.exit(0)
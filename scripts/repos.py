@@ -1,7 +1,12 @@
+import json
+import os
+import re
 import sys
 import warnings
 from glob import glob
+from collections import OrderedDict
 from digits import *
+from events import get_event_text
 
 with open('rep-folders.txt', 'r') as f:
     repofolders = f.read().splitlines()
@@ -29,3 +34,72 @@ def get_rep_folder(entry):
         if int(entry['discoverdate'][0]['value'].split('/')[0]) <= repoyear:
             return repofolders[r]
     return repofolders[0]
+
+# Name, aliases and source bibcodes of the event in each repository file, keyed
+# by path and checked against the file's modification time and size, so that
+# events can be stubbed and their sources listed without parsing every file.
+stubindexpath = '../stubs.json'
+stubindex = OrderedDict()
+stubindexchanged = False
+
+bibcodepattern = re.compile(r'"bibcode"\s*:\s*("(?:[^"\\]|\\.)*")')
+def text_bibcodes(text):
+    return [json.loads(x) for x in bibcodepattern.findall(text)]
+
+def stub_entry(path, name, aliases, text):
+    stat = os.stat(path)
+    return OrderedDict([['mtime', stat.st_mtime_ns], ['size', stat.st_size], ['name', name], ['alias', aliases],
+        ['bibcode', text_bibcodes(text)]])
+
+def update_stub_index(path, name, aliases, text):
+    global stubindexchanged
+    stubindex[path] = stub_entry(path, name, aliases, text)
+    stubindexchanged = True
+
+def read_stub_index():
+    if not stubindex and os.path.isfile(stubindexpath):
+        with open(stubindexpath, 'r') as f:
+            stubindex.update(json.loads(f.read(), object_pairs_hook=OrderedDict))
+
+# Entries written before bibcodes were recorded are stale too.
+def stub_entry_stale(path):
+    stat = os.stat(path)
+    entry = stubindex.get(path)
+    return not (entry and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size and 'bibcode' in entry)
+
+def scan_stub_entry(path):
+    text = get_event_text(path)
+    event = json.loads(text, object_pairs_hook=OrderedDict)
+    name = next(reversed(event))
+    return stub_entry(path, name, [x['value'] for x in event[name]['alias']] if 'alias' in event[name] else [], text)
+
+def load_stub_index(files):
+    global stubindexchanged
+    read_stub_index()
+    for path in files:
+        if stub_entry_stale(path):
+            stubindex[path] = scan_stub_entry(path)
+            stubindexchanged = True
+    fileset = set(files)
+    for path in [x for x in stubindex if x not in fileset]:
+        del(stubindex[path])
+        stubindexchanged = True
+    save_stub_index()
+    return stubindex
+
+def merge_stub_index(entries):
+    global stubindexchanged
+    stubindex.update(entries)
+    stubindexchanged = True
+
+def save_stub_index():
+    global stubindexchanged
+    if not stubindexchanged:
+        return
+    jsonstring = json.dumps(stubindex, separators=(',',':'), ensure_ascii=False)
+    # Task workers may save it too, so replace the file whole.
+    temppath = stubindexpath + '.' + str(os.getpid())
+    with open(temppath, 'w', encoding='utf8') as f:
+        f.write(jsonstring)
+    os.replace(temppath, stubindexpath)
+    stubindexchanged = False
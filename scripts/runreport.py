@@ -0,0 +1,117 @@
+import json
+import os
+import resource
+import sys
+import time
+from collections import OrderedDict
+from fetch import fetchstats
+
+# Time, memory, events and rows each task of a run accounts for, with its HTTP
+# traffic (counted in fetch.py) and how often it found what it needed cached.
+# Counters go to the task started last. Tasks run by workers send their times,
+# rows and cache counts back with their deltas, the events are counted as those
+# are merged. The report is written as JSON and summarized in a table at the
+# end of the run.
+
+counterkeys = ['loaded', 'created', 'written', 'rows', 'cachehits', 'cachemisses']
+
+runstats = OrderedDict()
+reporttask = ''
+reportstart = {}
+runstart = time.time()
+
+# ru_maxrss is in kilobytes on Linux but in bytes on Mac.
+def maxrss_bytes(who = resource.RUSAGE_SELF):
+    return resource.getrusage(who).ru_maxrss*(1 if sys.platform == 'darwin' else 1024)
+
+def cpu_seconds(who = resource.RUSAGE_SELF):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+def task_report(task):
+    if task not in runstats:
+        runstats[task] = OrderedDict([('seconds', 0.), ('cpu', 0.), ('peakrss', 0)] + [(x, 0) for x in counterkeys])
+    return runstats[task]
+
+# Child processes' CPU time is added for tasks that hand their work to a pool
+# (it is only counted once they have been waited on).
+def start_task_report(task, children = False):
+    global reporttask
+    if task == reporttask:
+        return
+    end_task_report()
+    reporttask = task
+    task_report(task)
+    reportstart.update([('time', time.time()), ('cpu', cpu_seconds()), ('rss', maxrss_bytes()),
+        ('children', cpu_seconds(resource.RUSAGE_CHILDREN) if children else None)])
+
+def end_task_report():
+    global reporttask
+    if not reporttask:
+        return
+    stats = runstats[reporttask]
+    stats['seconds'] += time.time() - reportstart['time']
+    stats['cpu'] += cpu_seconds() - reportstart['cpu']
+    if reportstart['children'] is not None:
+        stats['cpu'] += cpu_seconds(resource.RUSAGE_CHILDREN) - reportstart['children']
+    stats['peakrss'] = max(stats['peakrss'], maxrss_bytes() - reportstart['rss'])
+    reporttask = ''
+
+def count_task(key, count = 1):
+    if reporttask:
+        runstats[reporttask][key] += count
+
+def reset_task_counts():
+    if reporttask:
+        runstats[reporttask].update([(x, 0) for x in counterkeys])
+
+def task_counts():
+    return OrderedDict([(x, runstats[reporttask][x]) for x in counterkeys]) if reporttask else OrderedDict()
+
+# Adds what a worker counted for the task, the peak memory of the two being the
+# larger.
+def merge_task_report(task, stats, keys):
+    report = task_report(task)
+    for key in keys:
+        if key == 'peakrss':
+            report[key] = max(report[key], stats.get(key, 0))
+        else:
+            report[key] += stats.get(key, 0)
+
+# The task's report with its HTTP traffic, and the share of pages it read from a
+# cached copy (a local file or a 304 answer) rather than downloading again.
+def full_task_report(task):
+    report = OrderedDict(runstats[task])
+    fetched = fetchstats.get(task, {})
+    for key in ['requests', 'notmodified', 'bytes']:
+        report[key] = fetched.get(key, 0)
+    report['httpseconds'] = fetched.get('seconds', 0.)
+    hits = report['cachehits'] + report['notmodified']
+    lookups = report['cachehits'] + report['cachemisses'] + report['requests']
+    report['cachehitrate'] = hits/lookups if lookups else None
+    return report
+
+def write_run_report(path, arguments):
+    report = OrderedDict([
+        ('date', time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(runstart))),
+        ('arguments', arguments),
+        ('seconds', time.time() - runstart),
+        ('cpu', cpu_seconds() + cpu_seconds(resource.RUSAGE_CHILDREN)),
+        ('peakrss', maxrss_bytes()),
+        ('tasks', OrderedDict([(x, full_task_report(x)) for x in runstats]))
+    ])
+    temppath = path + '.' + str(os.getpid())
+    with open(temppath, 'w') as f:
+        f.write(json.dumps(report, indent='\t', separators=(',', ':')))
+    os.replace(temppath, path)
+
+def run_report_table():
+    lines = ['{:<18} {:>8} {:>8} {:>8} {:>7} {:>7} {:>7} {:>9} {:>8} {:>8} {:>6}'.format('Task', 'Wall s', 'CPU s',
+        'Peak MB', 'Loaded', 'Created', 'Written', 'Rows', 'Requests', 'MB', 'Cached')]
+    for task in runstats:
+        report = full_task_report(task)
+        lines.append('{:<18} {:>8.1f} {:>8.1f} {:>8.1f} {:>7,} {:>7,} {:>7,} {:>9,} {:>8,} {:>8.1f} {:>6}'.format(task[:18],
+            report['seconds'], report['cpu'], report['peakrss']/1.e6, report['loaded'], report['created'], report['written'],
+            report['rows'], report['requests'], report['bytes']/1.e6,
+            '' if report['cachehitrate'] is None else '{:.0%}'.format(report['cachehitrate'])))
+    return lines
@@ -0,0 +1,75 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Flat spectrum files are columns of wavelength, flux and sometimes error,
+# separated by whitespace or commas. They are read into columns of strings (so
+# that the digits given in the file are kept), cut to the shortest row as zip()
+# would, with the header lines returned split the same way. The files of a task
+# can be read ahead on a thread pool while earlier ones are being added.
+
+def split_spectrum_line(line, delimiter = None):
+    if delimiter:
+        return [x.strip() for x in line.split(delimiter)]
+    return line.split()
+
+# Columns of a whitespace separated body in which every line has the same number
+# of values, split in one go with a marker token standing in for each line end.
+# Returns None for anything less regular (blank or ragged lines).
+def split_regular_columns(body):
+    tokens = body.replace('\n', ' \x00 ').split()
+    if not tokens:
+        return []
+    if tokens[-1] != '\x00':
+        tokens.append('\x00')
+    width = tokens.index('\x00') + 1
+    ends = tokens[width - 1::width]
+    if width == 1 or len(tokens) % width or ends.count('\x00') != len(ends) or tokens.count('\x00') != len(ends):
+        return None
+    return [tokens[i::width] for i in range(width - 1)]
+
+# Returns (columns, header). The first skiprows lines and lines starting with
+# comment go to the header, blank lines are dropped.
+def read_spectrum_file(path, delimiter = None, skiprows = 0, comment = '#'):
+    with open(path, 'r') as f:
+        text = f.read()
+    header = []
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start)
+        end = len(text) if end < 0 else end
+        line = text[start:end]
+        if len(header) >= skiprows and not (comment and line.lstrip().startswith(comment)):
+            break
+        header.append(split_spectrum_line(line, delimiter))
+        start = end + 1
+    body = text[start:]
+    if not delimiter and not (comment and comment in body) and '\x00' not in body:
+        columns = split_regular_columns(body)
+        if columns is not None:
+            return (columns, header)
+    rows = []
+    for line in body.split('\n'):
+        if comment and line.lstrip().startswith(comment):
+            header.append(split_spectrum_line(line, delimiter))
+            continue
+        row = split_spectrum_line(line, delimiter)
+        if row and any(row):
+            rows.append(row)
+    return ([list(x) for x in zip(*rows)], header)
+
+# Yields read_spectrum_file(path) for each path in order, reading up to ahead
+# files in advance on jobs threads. Closing the generator early (a task that
+# stops partway) cancels the reads that haven't started yet.
+def read_spectrum_files(paths, jobs = 4, ahead = 64, **kwargs):
+    with ThreadPoolExecutor(max_workers = jobs) as executor:
+        futures = deque()
+        try:
+            for path in paths:
+                futures.append(executor.submit(read_spectrum_file, path, **kwargs))
+                if len(futures) >= ahead:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            for future in futures:
+                future.cancel()
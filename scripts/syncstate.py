@@ -0,0 +1,39 @@
+import json
+import os
+import time
+from collections import OrderedDict
+
+# How far each paginated live source was read on its last run (the last ID,
+# date or page seen), so that update runs only fetch and process what is new.
+# Every reconciledays (or when asked) a source is walked in full again to pick
+# up rows that changed behind its mark. One file per source, since task workers
+# running side by side each keep their own.
+
+syncdir = '../sync-state'
+reconciledays = 30
+syncwindow = 30
+
+def sync_state_path(source):
+    return syncdir + '/' + source + '.json'
+
+def load_sync_state(source):
+    path = sync_state_path(source)
+    if not os.path.isfile(path):
+        return OrderedDict()
+    with open(path, 'r') as f:
+        return json.loads(f.read(), object_pairs_hook=OrderedDict)
+
+def save_sync_state(source, state, reconciled = False):
+    if reconciled or 'reconciled' not in state:
+        state['reconciled'] = time.time()
+    os.makedirs(syncdir, exist_ok = True)
+    path = sync_state_path(source)
+    temppath = path + '.' + str(os.getpid())
+    with open(temppath, 'w') as f:
+        f.write(json.dumps(state, indent='\t', separators=(',', ':')))
+    os.replace(temppath, path)
+
+# Whether the source has to be walked in full: it has no state yet, its last full
+# walk is older than reconciledays, or a full walk was asked for.
+def sync_reconcile(state, force = False):
+    return force or 'reconciled' not in state or time.time() - state['reconciled'] > reconciledays*86400.
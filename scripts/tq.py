@@ -1,7 +1,8 @@
 from tqdm import tqdm, trange
 
-def tq(li, currenttask = '', leave = True):
-    return tqdm(list(li), desc = currenttask, leave = leave)
+def tq(li, currenttask = '', leave = True, total = None):
+    # With a total the items are shown as they arrive rather than listed first.
+    return tqdm(list(li) if total is None else li, desc = currenttask, leave = leave, total = total)
 
 def tprint(string):
     try:
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from astropy.table import Table
+from astropy.units import UnitsWarning
+from astroquery.vizier import Vizier
+from runreport import count_task
+
+# VizieR tables read by the vizier task, kept as ECSV files so that they are
+# only downloaded once. Masks are written as columns of their own, so that a
+# cached table reads back with the same values, masks and types as a fresh one
+# (an empty string stays an empty string rather than becoming masked). Files
+# are keyed by catalog ID and the columns asked for, since those determine what
+# VizieR returns. A file that can't be read is fetched again.
+
+vizierdir = '../sne-external/VizieR'
+
+viziercatalogs = [
+    "J/ApJS/200/12/table1", "J/ApJ/746/85/table1", "J/ApJ/746/85/table2", "J/ApJ/602/571/table8",
+    "J/MNRAS/444/3258/SNe", "J/MNRAS/438/1391/table2", "J/ApJ/749/18/table1", "J/A+A/523/A7/table9",
+    "J/A+A/415/863/table1", "J/AJ/136/2306/sources", "J/ApJ/708/661/sn", "J/ApJ/708/661/table1",
+    "J/ApJ/795/44/ps1_snIa", "J/ApJ/795/44/table6", "II/189/mag", "VII/272/snrs", "J/MNRAS/442/844/table1",
+    "J/MNRAS/442/844/table2", "J/MNRAS/425/1789/table1", "J/ApJS/219/13/table3", "J/ApJS/219/13/table2",
+    "J/other/Nat/491.228/tablef1", "J/other/Nat/491.228/tablef2", "J/other/Nat/474.484/tables1",
+    "J/ApJ/736/159/table1", "J/ApJ/760/L33/table1", "J/ApJ/769/39/table1", "J/MNRAS/394/2266/table2",
+    "J/MNRAS/394/2266/table3", "J/MNRAS/394/2266/table4", "J/AJ/145/99/table1", "J/ApJ/729/143/table1",
+    "J/ApJ/729/143/table2", "J/ApJ/729/143/table4", "J/ApJ/729/143/table5", "J/ApJ/728/14/table1",
+    "J/ApJ/728/14/table2", "J/ApJ/728/14/table3", "J/PAZh/37/837/table2", "J/MNRAS/433/1871/table3a",
+    "J/MNRAS/433/1871/table3b", "J/AJ/148/1/table2", "J/AJ/148/1/table3", "J/AJ/148/1/table5",
+    "J/ApJ/805/74/table1", "J/ApJ/741/97/table2", "J/MNRAS/448/1206/table3", "J/MNRAS/448/1206/table4",
+    "J/MNRAS/448/1206/table5", "J/MNRAS/448/1206/table6", "J/MNRAS/448/1206/tablea2",
+    "J/MNRAS/448/1206/tablea3", "J/AJ/143/126/table4", "J/ApJS/220/9/table1", "J/ApJS/220/9/table2",
+    "J/ApJS/220/9/table8", "J/ApJ/673/999/table1", "J/MNRAS/417/916/table2", "J/MNRAS/430/1746/table4",
+    "J/AJ/148/13/high_z", "J/AJ/148/13/low_z", "J/ApJ/666/674/table3", "J/AcA/63/1/table1",
+    "J/MNRAS/410/1262/tablea2", "J/ApJ/755/61/table3", "J/AJ/135/348/SNe", "J/ApJ/713/1026/SNe",
+    "J/ApJ/770/107/galaxies", "J/ApJ/738/162/table3", "J/ApJ/738/162/table4", "J/ApJ/703/370/tables",
+    "J/ApJ/821/57/table1", "J/ApJ/821/57/table2", "J/ApJ/821/57/table3", "J/ApJ/821/57/table4",
+    "J/ApJ/607/665/table1", "J/ApJ/607/665/table2", "J/ApJ/607/665/table5", "J/A+A/538/A120/usc",
+    "J/A+A/507/85/table1"] + ["J/MNRAS/446/943/" + x for x in ["ngc2403","ngc2903","ngc300","ngc3077","ngc4214","ngc4395","ngc4449",
+    "ngc5204","ngc5585","ngc6946","ngc7793","m33","m74","m81","m82","m83","m101","m31"]]
+
+def vizier_table_path(catalog, columns = ['*']):
+    columnhash = hashlib.md5(json.dumps(list(columns)).encode('utf-8')).hexdigest()[:8]
+    return vizierdir + '/' + catalog.replace('/', '_') + '-' + columnhash + '.ecsv'
+
+def read_vizier_table(path):
+    with warnings.catch_warnings():
+        # Not all of VizieR's units are ones astropy knows.
+        warnings.simplefilter('ignore', UnitsWarning)
+        return Table.read(path, format = 'ascii.ecsv')
+
+def get_vizier_table(catalog, columns = ['*'], refresh = False):
+    path = vizier_table_path(catalog, columns)
+    if not refresh and os.path.isfile(path):
+        try:
+            return read_vizier_table(path)
+        except (OSError, ValueError):
+            warnings.warn('Cached VizieR table ' + path + ' is unreadable, fetching it again.')
+    result = Vizier(columns = list(columns), row_limit = -1).get_catalogs(catalog)
+    table = result[list(result.keys())[0]]
+    os.makedirs(vizierdir, exist_ok = True)
+    temppath = path + '.' + str(os.getpid())
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UnitsWarning)
+        table.write(temppath, format = 'ascii.ecsv', serialize_method = 'data_mask', overwrite = True)
+    os.replace(temppath, path)
+    # Read back so that a fresh table is the same as a cached one.
+    return read_vizier_table(path)
+
+# Download the tables not cached yet (and those to refresh) several at a time.
+def prefetch_vizier_tables(catalogs, refresh = [], jobs = 8):
+    def fetch(catalog):
+        try:
+            get_vizier_table(catalog, refresh = True)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            # Left for the task to fetch (and fail on) itself.
+            warnings.warn('Prefetching VizieR table ' + catalog + ' failed.')
+
+    missing = [x for x in catalogs if x in refresh or not os.path.isfile(vizier_table_path(x))]
+    with ThreadPoolExecutor(max_workers = jobs) as pool:
+        list(pool.map(fetch, missing))
+    count_task('cachehits', len(catalogs) - len(missing))
+    count_task('cachemisses', len(missing))
+    return missing
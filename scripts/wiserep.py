@@ -0,0 +1,186 @@
+import json
+import os
+import re
+import urllib.parse
+from collections import OrderedDict
+from hashlib import md5
+from html import unescape
+from digits import is_number
+from htmlparse import parse_html
+
+# What the wiserepspectra task reads from each folder of the WISeREP repository
+# is kept in a manifest per folder, together with the content hash of every file
+# it came from. Folders whose files are unchanged are replayed from the manifest
+# without parsing anything, and in changed folders only the indexes and spectra
+# that changed are parsed again.
+
+wiserepdir = '../sne-external-WISEREP'
+wiserepcachedir = '../wiserep-cache'
+wiserepcacheversion = 2
+
+def wiserep_manifest_path(folder):
+    return wiserepcachedir + '/' + folder + '.json'
+
+def load_wiserep_manifest(folder):
+    path = wiserep_manifest_path(folder)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'r', encoding='utf8') as f:
+        try:
+            manifest = json.loads(f.read(), object_pairs_hook=OrderedDict)
+        except ValueError:
+            return {}
+    return manifest if manifest.get('version') == wiserepcacheversion else {}
+
+def save_wiserep_manifest(folder, manifest):
+    os.makedirs(wiserepcachedir, exist_ok = True)
+    path = wiserep_manifest_path(folder)
+    temppath = path + '.' + str(os.getpid())
+    with open(temppath, 'w', encoding='utf8') as f:
+        f.write(json.dumps(manifest, separators=(',', ':'), ensure_ascii=False))
+    os.replace(temppath, path)
+
+# Content hashes of the folder's files, keyed by file name, as [size, mtime, md5]
+# lists (as they come back from JSON). A file whose size and modification time
+# match the manifest keeps its hash without being read again.
+def hash_wiserep_files(files, manifest):
+    oldhashes = manifest.get('hashes', {})
+    hashes = OrderedDict()
+    for fname in files:
+        base = os.path.basename(fname)
+        stat = os.stat(fname)
+        if base in oldhashes and oldhashes[base][:2] == [stat.st_size, stat.st_mtime]:
+            hashes[base] = oldhashes[base]
+            continue
+        with open(fname, 'rb') as f:
+            hashes[base] = [stat.st_size, stat.st_mtime, md5(f.read()).hexdigest()]
+    return hashes
+
+def wiserep_text(td):
+    return re.sub('<[^<]+?>', '', str(td.contents[0])).strip()
+
+# Spectrum rows of an HTML index, with each row's ASCII file matched against the
+# folder's files. Returns the rows and the files left unmatched.
+def parse_wiserep_index(fname, files):
+    lfiles = list(files)
+    rows = []
+    with open(fname, 'rb') as f:
+        bs = parse_html(f.read(), 'tr')
+    trs = bs.findAll('tr', {'valign': 'top'})
+    name = ''
+    produceoutput = False
+    for tr in trs:
+        if "Click to show/update object" in str(tr.contents):
+            claimedtype = ''
+            instrument = ''
+            epoch = ''
+            observer = ''
+            reducer = ''
+            specfile = ''
+            produceoutput = True
+            specpath = ''
+            tds = tr.findAll('td')
+            for tdi, td in enumerate(tds):
+                if td.contents:
+                    if tdi == 3:
+                        name = wiserep_text(td)
+                    elif tdi == 5:
+                        claimedtype = wiserep_text(td)
+                        if claimedtype == 'SN':
+                            claimedtype = ''
+                            continue
+                        if claimedtype[:3] == 'SN ':
+                            claimedtype = claimedtype[3:].strip()
+                        claimedtype = claimedtype.replace('-like', '').strip()
+                    elif tdi == 9:
+                        instrument = wiserep_text(td)
+                    elif tdi == 11:
+                        epoch = wiserep_text(td)
+                    elif tdi == 13:
+                        observer = wiserep_text(td)
+                        if observer == 'Unknown' or observer == 'Other':
+                            observer = ''
+                    elif tdi == 17:
+                        reducer = wiserep_text(td)
+                        if reducer == 'Unknown' or reducer == 'Other':
+                            reducer = ''
+                    elif tdi == 25:
+                        for link in td.findAll('a'):
+                            if 'Ascii' in link['href']:
+                                specfile = link.contents[0].strip()
+                                match = [x for x in lfiles if specfile in x]
+                                if match:
+                                    specpath = match[0]
+                                    lfiles.remove(specpath)
+                                    break
+        if "Spec Type:</span>" in str(tr.contents) and produceoutput:
+            produceoutput = False
+
+            trstr = str(tr)
+            result = re.search('redshift=(.*?)&amp;', trstr)
+            redshift = ''
+            if result:
+                redshift = result.group(1)
+                if not is_number(redshift) or float(redshift) > 100.:
+                    redshift = ''
+
+            result = re.search('publish=(.*?)&amp;', trstr)
+            bibcode = ''
+            if result:
+                bibcode = unescape(urllib.parse.unquote(urllib.parse.unquote(result.group(1))).split('/')[-1])
+
+            if not bibcode:
+                biblink = tr.find('a', {'title': 'Link to NASA ADS'})
+                if biblink:
+                    bibcode = str(biblink.contents[0])
+
+            rows.append(OrderedDict([('name', name), ('claimedtype', claimedtype), ('instrument', instrument),
+                ('epoch', epoch), ('observer', observer), ('reducer', reducer), ('specfile', specfile),
+                ('specpath', os.path.basename(specpath)), ('redshift', redshift), ('bibcode', bibcode)]))
+    return (rows, lfiles)
+
+# Wavelength and flux columns (and a third if there is one) of a spectrum file,
+# dropping comments and rows that repeat the previous flux.
+def read_wiserep_spectrum(specpath):
+    with open(specpath, 'r') as f:
+        data = [x.split() for x in f]
+    newdata = []
+    oldval = ''
+    for row in data:
+        if row and '#' not in row[0]:
+            if len(row) >= 2 and is_number(row[0]) and is_number(row[1]) and row[1] != oldval:
+                newdata.append(row)
+                oldval = row[1]
+    if not newdata:
+        return []
+    return [list(i) for i in zip(*newdata)]
+
+# Brings the folder's manifest up to date with its files, parsing only the HTML
+# indexes and spectra whose hashes changed.
+def update_wiserep_manifest(folder, files, hashes, manifest):
+    oldhashes = manifest.get('hashes', {})
+    oldindexes = manifest.get('indexes', {})
+    oldspectra = manifest.get('spectra', {})
+    # Indexes are also parsed again when files were added or removed, as their
+    # rows are matched against the folder's file names.
+    folderchanged = list(hashes) != list(oldhashes)
+    indexes = OrderedDict()
+    spectra = OrderedDict()
+    for fname in files:
+        base = os.path.basename(fname)
+        if '.html' not in fname:
+            continue
+        if not folderchanged and base in oldindexes and oldhashes[base][2] == hashes[base][2]:
+            indexes[base] = oldindexes[base]
+        else:
+            (rows, lfiles) = parse_wiserep_index(fname, files)
+            indexes[base] = OrderedDict([('rows', rows), ('unadded', len(lfiles) - 1)])
+        for row in indexes[base]['rows']:
+            specpath = row['specpath']
+            if not specpath or specpath in spectra:
+                continue
+            if specpath in oldspectra and oldhashes[specpath][2] == hashes[specpath][2]:
+                spectra[specpath] = oldspectra[specpath]
+            else:
+                spectra[specpath] = read_wiserep_spectrum(wiserepdir + '/' + folder + '/' + specpath)
+    return OrderedDict([('version', wiserepcacheversion), ('hashes', hashes), ('indexes', indexes), ('spectra', spectra)])